@@ -1,15 +1,18 @@
-import json
 from pathlib import Path
 from typing import Dict, List, Optional, Literal, Any
 import os
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import dotenv
 from langchain.agents import create_agent
 from pydantic import BaseModel, Field
 
+from LLM_Agent.prompt_layout import build_selection_messages
+from LLM_Agent.usage import invoke_with_usage
+
 
 dotenv.load_dotenv()
 
@@ -145,8 +148,11 @@ print("==========")
 # =========================
 # 3) Agent を作成（response_format で構造化出力）
 # =========================
+MODEL_NAME = os.getenv('OPENAI_MODEL', 'gpt-5.2')
+MODEL_NAME_LIGHT = os.getenv('OPENAI_MODEL_LIGHT', 'gpt-4o-mini')
+
 agent = create_agent(
-    model=f"openai:{os.getenv('OPENAI_MODEL', 'gpt-5.2')}",
+    model=f"openai:{MODEL_NAME}",
     tools=[],
     response_format=LLMDecision,
     system_prompt=SYSTEM_PROMPT,
@@ -154,7 +160,7 @@ agent = create_agent(
 
 # Frame判定用の軽量エージェント
 frame_classifier_agent = create_agent(
-    model=f"openai:{os.getenv('OPENAI_MODEL_LIGHT', 'gpt-4o-mini')}",
+    model=f"openai:{MODEL_NAME_LIGHT}",
     tools=[],
     response_format=FrameDecision,
     system_prompt=FRAME_CLASSIFIER_PROMPT,
@@ -168,7 +174,13 @@ def classify_reference_frame(utterance: str) -> FrameDecision:
     """
     発話から参照フレーム（user/robot）を判定する。
     """
-    result = frame_classifier_agent.invoke({"messages": [{"role": "user", "content": utterance}]})
+    result = invoke_with_usage(
+        frame_classifier_agent,
+        {"messages": [{"role": "user", "content": utterance}]},
+        call="classify_reference_frame",
+        model=MODEL_NAME_LIGHT,
+        model_role="OPENAI_MODEL_LIGHT",
+    )
     
     if isinstance(result, FrameDecision):
         return result
@@ -192,9 +204,18 @@ def classify_reference_frame(utterance: str) -> FrameDecision:
 def decide_selection_rule(llm_input: dict) -> LLMDecision:
     """
     llm_input はサーバが生成した JSON（utterance + objects(features)）をそのまま渡す。
+    プロンプトは prompt_layout でシーン→発話の順に組み直してから送る。
     """
-    content = json.dumps(llm_input, ensure_ascii=False)
-    result = agent.invoke({"messages": [{"role": "user", "content": content}]})
+    messages, prefix_hash = build_selection_messages(llm_input)
+    result = invoke_with_usage(
+        agent,
+        {"messages": messages},
+        call="decide_selection_rule",
+        model=MODEL_NAME,
+        model_role="OPENAI_MODEL",
+        scene_size=len(llm_input.get("objects", []) or []),
+        scene_hash=prefix_hash,
+    )
 
     # create_agent の実装/バージョン差で返り値が「Pydantic直」 or 「state(dict)」になることがあるため、
     # 両対応にしておくのが安全です。
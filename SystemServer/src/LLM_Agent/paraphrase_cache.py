@@ -0,0 +1,269 @@
+"""言い換え（パラフレーズ）を吸収する LLM 判定キャッシュ。
+
+過去に LLM が解決した (発話, シーン, decision) を文字 n-gram TF-IDF で索引し、
+新しい発話が十分似ていて（類似度 >= threshold）シーンも互換なら、
+decide_selection_rule を呼ばずに前回の decision を再利用する。
+
+完全オフライン・依存なし（標準ライブラリのみ）。判定の安全側に倒すため、
+  - 序数・数字（「右から2番目」と「右から3番目」）
+  - 方向語（右/左/手前/奥 ...）
+が一致しない候補は類似度に関係なく採用しない。
+
+索引の元データは CACHE_PATH の JSONL（LLM で解決した分）で、
+paraphrase_report.py で閾値ごとの precision / recall を確認できる。
+キャッシュで再利用した分も "reused": true（類似度・一致したエントリ付き）で同じ JSONL に
+記録する（索引には入れない）。audit_rate の割合で再利用時にも LLM を呼び、その decision を
+"llm_decision" として残すので、本番のヒットの正しさもレポートで確認できる。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from LLM_Agent.prompt_layout import serialize_scene, split_llm_input
+
+CACHE_PATH = Path(
+    os.getenv("PARAPHRASE_CACHE_PATH", str(Path(__file__).resolve().parent / "cache" / "paraphrase_cache.jsonl"))
+)
+DEFAULT_THRESHOLD = float(os.getenv("PARAPHRASE_CACHE_THRESHOLD", "0.85"))
+# シーン互換判定: 各オブジェクトの pos_local の許容ずれ [m]
+DEFAULT_POS_TOLERANCE = float(os.getenv("PARAPHRASE_CACHE_POS_TOL", "0.03"))
+# キャッシュヒットのうち LLM にも解かせて答え合わせする割合（0 で無効）
+DEFAULT_AUDIT_RATE = float(os.getenv("PARAPHRASE_CACHE_AUDIT_RATE", "0.1"))
+
+NGRAM_SIZES = (1, 2, 3)
+
+# 表記ゆれ・同義語の正規化（上から順に置換。長いものを先に）
+SYNONYMS: List[Tuple[str, str]] = [
+    ("いちばん", "一番"),
+    ("一番右", "右端"),
+    ("一番左", "左端"),
+    ("一番手前", "最手前"),
+    ("一番奥", "最奥"),
+    ("右はし", "右端"),
+    ("左はし", "左端"),
+    ("一番", "最"),
+    ("ボックス", "箱"),
+    ("はこ", "箱"),
+    ("キューブ", "箱"),
+    ("ブロック", "箱"),
+    ("まんなか", "中央"),
+    ("真ん中", "中央"),
+    ("みぎ", "右"),
+    ("ひだり", "左"),
+    ("てまえ", "手前"),
+    ("おく", "奥"),
+    ("とって", "取って"),
+    ("ください", ""),
+]
+
+_KANJI_DIGITS = str.maketrans({"一": "1", "二": "2", "三": "3", "四": "4", "五": "5",
+                               "六": "6", "七": "7", "八": "8", "九": "9"})
+_DIRECTION_WORDS = ("右", "左", "手前", "奥", "前", "後", "上", "下", "中央", "端", "最")
+_STRIP_RE = re.compile(r"[\s、。,.!?！？「」『』・ー〜~]")
+
+
+def normalize_utterance(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text).lower()
+    t = _STRIP_RE.sub("", t)
+    for src, dst in SYNONYMS:
+        t = t.replace(src, dst)
+    return t.translate(_KANJI_DIGITS)
+
+
+def utterance_guards(normalized: str) -> Tuple[Tuple[str, ...], frozenset]:
+    """再利用してよいかの必須一致条件（数字列・方向語の集合）。"""
+    digits = tuple(re.findall(r"\d+", normalized))
+    directions = frozenset(w for w in _DIRECTION_WORDS if w in normalized)
+    return digits, directions
+
+
+def char_ngrams(normalized: str) -> Counter:
+    grams: Counter = Counter()
+    for n in NGRAM_SIZES:
+        for i in range(len(normalized) - n + 1):
+            grams[normalized[i:i + n]] += 1
+    return grams
+
+
+def scene_signature(llm_input: Dict[str, Any]) -> Dict[str, Any]:
+    """シーン互換判定用の要約（frame と各オブジェクトのローカル座標）。"""
+    scene, _ = split_llm_input(llm_input)
+    positions: Dict[str, List[float]] = {}
+    for obj in scene.get("objects", []) or []:
+        pos = obj.get("pos_local") or obj.get("pos_user") or obj.get("pos_world")
+        positions[str(obj.get("id"))] = list(pos) if pos is not None else []
+    return {
+        "frame": scene.get("input_frame") or scene.get("available_reference_frames"),
+        "fingerprint": hashlib.sha1(serialize_scene(scene).encode("utf-8")).hexdigest()[:12],
+        "positions": positions,
+    }
+
+
+def scenes_compatible(a: Dict[str, Any], b: Dict[str, Any], pos_tol: float = DEFAULT_POS_TOLERANCE) -> bool:
+    if a["fingerprint"] == b["fingerprint"]:
+        return True
+    if a["frame"] != b["frame"] or a["positions"].keys() != b["positions"].keys():
+        return False
+    for oid, pa in a["positions"].items():
+        pb = b["positions"][oid]
+        if len(pa) != len(pb):
+            return False
+        if any(abs(x - y) > pos_tol for x, y in zip(pa, pb)):
+            return False
+    return True
+
+
+@dataclass
+class ParaphraseHit:
+    similarity: float
+    utterance: str
+    decision: Dict[str, Any]
+    ts: str
+
+
+class ParaphraseCache:
+    def __init__(
+        self,
+        path: Optional[Path] = CACHE_PATH,
+        threshold: float = DEFAULT_THRESHOLD,
+        pos_tol: float = DEFAULT_POS_TOLERANCE,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.pos_tol = pos_tol
+        self.audit_rate = audit_rate
+        self.entries: List[Dict[str, Any]] = []
+        self._grams: List[Counter] = []
+        self._df: Counter = Counter()
+        self._lock = threading.Lock()
+        if path is not None and path.is_file():
+            self._load(path)
+
+    def _load(self, path: Path) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    if entry.get("reused"):
+                        continue  # 再利用の記録は索引に入れない
+                    self._index(entry)
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        print(f"【ParaphraseCache】{len(self.entries)} entries loaded from {path.name}")
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        grams = char_ngrams(normalize_utterance(entry["utterance"]))
+        self.entries.append(entry)
+        self._grams.append(grams)
+        self._df.update(grams.keys())
+
+    def _idf(self, gram: str) -> float:
+        n = len(self.entries)
+        return math.log((1 + n) / (1 + self._df.get(gram, 0))) + 1.0
+
+    def _weights(self, grams: Counter) -> Dict[str, float]:
+        return {g: tf * self._idf(g) for g, tf in grams.items()}
+
+    def _cosine(self, q: Dict[str, float], q_norm: float, grams: Counter) -> float:
+        d = self._weights(grams)
+        d_norm = math.sqrt(sum(w * w for w in d.values()))
+        if q_norm == 0.0 or d_norm == 0.0:
+            return 0.0
+        return sum(w * d[g] for g, w in q.items() if g in d) / (q_norm * d_norm)
+
+    def ranked_candidates(self, utterance: str, sig: Dict[str, Any]) -> List[Tuple[float, int]]:
+        """互換シーンかつガード一致の候補を (類似度, entry index) の降順で返す。"""
+        norm = normalize_utterance(utterance)
+        guards = utterance_guards(norm)
+        q = self._weights(char_ngrams(norm))
+        q_norm = math.sqrt(sum(w * w for w in q.values()))
+
+        scored: List[Tuple[float, int]] = []
+        for i, entry in enumerate(self.entries):
+            if utterance_guards(normalize_utterance(entry["utterance"])) != guards:
+                continue
+            if not scenes_compatible(sig, entry["scene"], self.pos_tol):
+                continue
+            scored.append((self._cosine(q, q_norm, self._grams[i]), i))
+        scored.sort(reverse=True)
+        return scored
+
+    def lookup(self, utterance: str, llm_input: Dict[str, Any]) -> Optional[ParaphraseHit]:
+        with self._lock:
+            if not self.entries:
+                return None
+            ranked = self.ranked_candidates(utterance, scene_signature(llm_input))
+            if not ranked or ranked[0][0] < self.threshold:
+                return None
+            sim, idx = ranked[0]
+            entry = self.entries[idx]
+            return ParaphraseHit(similarity=round(sim, 4), utterance=entry["utterance"], decision=entry["decision"], ts=entry["ts"])
+
+    def add(self, utterance: str, llm_input: Dict[str, Any], decision: Dict[str, Any]) -> None:
+        """LLM で解決した結果を索引と JSONL に追加する。"""
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "utterance": utterance,
+            "scene": scene_signature(llm_input),
+            "decision": decision,
+        }
+        with self._lock:
+            self._index(entry)
+            self._append(entry)
+
+    def should_audit(self) -> bool:
+        """このヒットを LLM でも解いて答え合わせするか（audit_rate の割合で抜き取り）"""
+        return random.random() < self.audit_rate
+
+    def log_hit(
+        self,
+        utterance: str,
+        llm_input: Dict[str, Any],
+        hit: ParaphraseHit,
+        llm_decision: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """キャッシュで再利用した判定を JSONL に記録する。llm_decision は抜き取りで LLM が出した decision"""
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "reused": True,
+            "utterance": utterance,
+            "scene": scene_signature(llm_input),
+            "similarity": hit.similarity,
+            "matched_utterance": hit.utterance,
+            "matched_ts": hit.ts,
+            "decision": hit.decision,
+        }
+        if llm_decision is not None:
+            record["llm_decision"] = llm_decision
+        with self._lock:
+            self._append(record)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _env_enabled() -> bool:
+    return os.getenv("PARAPHRASE_CACHE", "1").strip().lower() not in {"0", "false", "no", "off", ""}
+
+
+paraphrase_cache: Optional[ParaphraseCache] = ParaphraseCache() if _env_enabled() else None
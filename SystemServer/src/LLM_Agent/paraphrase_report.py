@@ -0,0 +1,137 @@
+"""パラフレーズキャッシュの precision / recall をログデータで評価する。
+
+paraphrase_cache.jsonl（LLM で解決した発話と decision の履歴）を時系列順に再生し、
+各発話をそれ以前のエントリだけで作った索引に問い合わせる（本番と同じ条件）。
+
+  hit        : 類似度 >= 閾値 の候補があり、キャッシュが decision を返した
+  correct    : 返した decision の target_id が LLM の target_id と一致
+  opportunity: それ以前に互換シーンで同じ target_id を選んだエントリがある
+  precision  = correct / hit
+  recall     = correct / opportunity
+
+本番で再利用した記録（"reused": true）は再生に使わず、別に集計する:
+  reused     : キャッシュから decision を返した回数（類似度の分布付き）
+  audited    : そのうち抜き取りで LLM にも解かせた回数（"llm_decision" あり）
+  precision  = audited のうち target_id が LLM と一致した割合
+
+Run (SystemServer/src から):
+  python LLM_Agent/paraphrase_report.py
+  python LLM_Agent/paraphrase_report.py --thresholds 0.6 0.7 0.8 0.9
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from LLM_Agent.paraphrase_cache import CACHE_PATH, DEFAULT_POS_TOLERANCE, ParaphraseCache, scenes_compatible
+
+
+def _target(decision: Dict[str, Any]) -> Optional[str]:
+    selections = decision.get("selections") or []
+    if not selections:
+        return None
+    return selections[0].get("target_id")
+
+
+def evaluate(entries: List[Dict[str, Any]], thresholds: List[float], pos_tol: float) -> List[Dict[str, Any]]:
+    # 1 回の再生で各クエリの最上位候補を求め、閾値ごとの集計はその結果から出す
+    cache = ParaphraseCache(path=None, pos_tol=pos_tol)
+    best: List[Optional[tuple]] = []
+    opportunities = 0
+    for entry in entries:
+        truth = _target(entry["decision"])
+        ranked = cache.ranked_candidates(entry["utterance"], entry["scene"])
+        if ranked:
+            sim, idx = ranked[0]
+            best.append((sim, _target(cache.entries[idx]["decision"]) == truth))
+        else:
+            best.append(None)
+        if any(
+            _target(prev["decision"]) == truth and scenes_compatible(entry["scene"], prev["scene"], pos_tol)
+            for prev in cache.entries
+        ):
+            opportunities += 1
+        cache._index(entry)
+
+    rows = []
+    for th in thresholds:
+        hits = [b for b in best if b is not None and b[0] >= th]
+        correct = sum(1 for _, ok in hits if ok)
+        rows.append({
+            "threshold": th,
+            "queries": len(entries),
+            "hits": len(hits),
+            "correct": correct,
+            "opportunities": opportunities,
+            "precision": correct / len(hits) if hits else None,
+            "recall": correct / opportunities if opportunities else None,
+            "llm_calls_saved_pct": 100.0 * len(hits) / len(entries) if entries else 0.0,
+        })
+    return rows
+
+
+def evaluate_reused(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """本番のキャッシュヒットを抜き取りの LLM 判定で答え合わせする"""
+    sims = sorted(r["similarity"] for r in records)
+    audited = [r for r in records if r.get("llm_decision") is not None]
+    correct = sum(1 for r in audited if _target(r["decision"]) == _target(r["llm_decision"]))
+    return {
+        "reused": len(records),
+        "similarity_min": sims[0] if sims else None,
+        "similarity_median": sims[len(sims) // 2] if sims else None,
+        "audited": len(audited),
+        "correct": correct,
+        "precision": correct / len(audited) if audited else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default=str(CACHE_PATH), help="paraphrase cache JSONL のパス")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95])
+    parser.add_argument("--pos-tol", type=float, default=DEFAULT_POS_TOLERANCE)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    path = Path(args.file)
+    if not path.is_file():
+        raise FileNotFoundError(f"Paraphrase cache log not found: {path}")
+
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+
+    reused = [e for e in entries if e.get("reused")]
+    entries = [e for e in entries if not e.get("reused")]
+    rows = evaluate(entries, args.thresholds, args.pos_tol)
+    production = evaluate_reused(reused)
+    if args.json:
+        print(json.dumps({"replay": rows, "production": production}, indent=2, ensure_ascii=False))
+        return 0
+
+    print(f"{len(entries)} logged decisions from {path}")
+    print("threshold  hits  correct  opport.  precision  recall  saved%")
+    for r in rows:
+        p = "-" if r["precision"] is None else f"{r['precision']:.3f}"
+        rc = "-" if r["recall"] is None else f"{r['recall']:.3f}"
+        print(f"{r['threshold']:<9.2f}  {r['hits']:<4}  {r['correct']:<7}  {r['opportunities']:<7}  {p:<9}  {rc:<6}  {r['llm_calls_saved_pct']:.1f}")
+
+    print()
+    print(f"production: {production['reused']} reused decisions, {production['audited']} audited")
+    if production["reused"]:
+        print(f"  similarity min={production['similarity_min']} median={production['similarity_median']}")
+    if production["audited"]:
+        print(f"  precision={production['precision']:.3f} ({production['correct']}/{production['audited']})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
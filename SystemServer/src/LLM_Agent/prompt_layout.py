@@ -0,0 +1,51 @@
+"""プロバイダのプレフィックスキャッシュが効くように LLM 入力を並べ替える。
+
+以前は utterance と objects を 1 つの json.dumps(llm_input) に混ぜていたため、
+発話が変わるとシーン部分もキャッシュ対象のプレフィックスから外れていた。
+ここでは次の順に固定して組み立てる:
+
+  1. system prompt（静的。create_agent 側で先頭に付く）
+  2. シーンブロック（同一セッション中は不変。キー順・オブジェクト順を正規化）
+  3. 発話（毎回変わるので最後）
+
+シーンは sort_keys + 区切り文字固定でシリアライズするので、同じシーンなら
+毎回バイト単位で同一になり、プレフィックスとして再利用される。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+
+
+def split_llm_input(llm_input: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """llm_input を (シーン, 発話) に分ける。utterance 以外はすべてシーン扱い。"""
+    scene = {k: v for k, v in llm_input.items() if k != "utterance"}
+    objects = scene.get("objects")
+    if isinstance(objects, list):
+        scene["objects"] = sorted(objects, key=lambda o: str(o.get("id")) if isinstance(o, dict) else str(o))
+    return scene, str(llm_input.get("utterance", ""))
+
+
+def serialize_scene(scene: Dict[str, Any]) -> str:
+    """同じシーンなら常に同じ文字列になるように正規化して JSON 化する。"""
+    return json.dumps(scene, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def scene_hash(scene_block: str) -> str:
+    return hashlib.sha1(scene_block.encode("utf-8")).hexdigest()[:12]
+
+
+def build_selection_messages(llm_input: Dict[str, Any]) -> Tuple[List[Dict[str, str]], str]:
+    """decide_selection_rule 用のメッセージ列と、シーンブロックのハッシュを返す。
+
+    シーンと発話は別々の user メッセージにする。プレフィックス一致はトークン列で
+    判定されるので、発話だけが末尾で変わる形にしておけばシーンまでキャッシュに乗る。
+    """
+    scene, utterance = split_llm_input(llm_input)
+    scene_block = serialize_scene(scene)
+    messages = [
+        {"role": "user", "content": scene_block},
+        {"role": "user", "content": json.dumps({"utterance": utterance}, ensure_ascii=False)},
+    ]
+    return messages, scene_hash(scene_block)
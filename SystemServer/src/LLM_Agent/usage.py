@@ -0,0 +1,171 @@
+"""LLM 呼び出しごとのトークン使用量・レイテンシを追記型ログ（JSONL）へ記録する。
+
+agent.invoke をそのまま呼ぶ代わりに invoke_with_usage() を通すと、
+prompt/completion/cached トークン数・モデル名・レイテンシ・シーンサイズが
+USAGE_LOG_PATH に 1 行 1 レコードで追記される。集計は usage_report.py で行う。
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+USAGE_LOG_PATH = Path(
+    os.getenv("LLM_USAGE_LOG", str(Path(__file__).resolve().parent / "usage_logs" / "llm_usage.jsonl"))
+)
+
+# USD / 1M tokens（input, cached_input, output）。未登録モデルは cost_usd=None になる。
+# 料金改定時はここか、環境変数 LLM_PRICE_TABLE（同形式の JSON ファイル）で上書きする。
+MODEL_PRICES_PER_1M: Dict[str, Dict[str, float]] = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.00},
+    "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.00},
+    "gpt-5.1": {"input": 1.25, "cached_input": 0.125, "output": 10.00},
+    "gpt-5.2": {"input": 1.75, "cached_input": 0.175, "output": 14.00},   # agent.py の OPENAI_MODEL 既定値
+}
+
+_price_table_path = os.getenv("LLM_PRICE_TABLE")
+if _price_table_path:
+    try:
+        MODEL_PRICES_PER_1M.update(json.loads(Path(_price_table_path).read_text(encoding="utf-8")))
+    except Exception as e:
+        print(f"【LLM Usage】LLM_PRICE_TABLE の読み込みに失敗しました: {e!r}")
+
+# どの HTTP エンドポイントからの呼び出しかを記録するため、サーバ側でセットする
+_current_endpoint: ContextVar[Optional[str]] = ContextVar("llm_usage_endpoint", default=None)
+
+_write_lock = threading.Lock()
+
+
+def set_endpoint(endpoint: Optional[str]) -> None:
+    """以降の LLM 呼び出しを endpoint（例: "/command_cord"）に紐づける。"""
+    _current_endpoint.set(endpoint)
+
+
+def extract_usage(result: Any) -> Dict[str, Any]:
+    """agent.invoke の戻り値から usage_metadata を合算して取り出す。
+
+    create_agent の state(dict) では result["messages"] 内の AIMessage に
+    usage_metadata / response_metadata が付く。Pydantic 直返しの場合は取れないので 0 扱い。
+    """
+    usage = {
+        "input_tokens": 0,
+        "cached_tokens": 0,
+        "output_tokens": 0,
+        "reasoning_tokens": 0,
+        "total_tokens": 0,
+        "response_model": None,
+        "llm_calls": 0,
+    }
+    if not isinstance(result, dict):
+        return usage
+
+    for msg in result.get("messages", []) or []:
+        meta = getattr(msg, "usage_metadata", None)
+        if not meta:
+            continue
+        usage["llm_calls"] += 1
+        usage["input_tokens"] += int(meta.get("input_tokens", 0) or 0)
+        usage["output_tokens"] += int(meta.get("output_tokens", 0) or 0)
+        usage["total_tokens"] += int(meta.get("total_tokens", 0) or 0)
+        in_details = meta.get("input_token_details") or {}
+        usage["cached_tokens"] += int(in_details.get("cache_read", 0) or 0)
+        out_details = meta.get("output_token_details") or {}
+        usage["reasoning_tokens"] += int(out_details.get("reasoning", 0) or 0)
+
+        resp_meta = getattr(msg, "response_metadata", None) or {}
+        if resp_meta.get("model_name"):
+            usage["response_model"] = resp_meta["model_name"]
+    return usage
+
+
+def estimate_cost_usd(model: Optional[str], input_tokens: int, cached_tokens: int, output_tokens: int) -> Optional[float]:
+    """料金表からコストを概算する。日付付きモデル名（gpt-4o-mini-2024-07-18 等）は最長一致で引く。"""
+    if not model:
+        return None
+    name = model.split(":", 1)[-1]
+    matches = [k for k in MODEL_PRICES_PER_1M if name == k or name.startswith(k + "-")]
+    if not matches:
+        return None
+    price = MODEL_PRICES_PER_1M[max(matches, key=len)]
+    uncached = max(input_tokens - cached_tokens, 0)
+    cost = (
+        uncached * price["input"]
+        + cached_tokens * price.get("cached_input", price["input"])
+        + output_tokens * price["output"]
+    ) / 1_000_000
+    return round(cost, 8)
+
+
+def append_usage_record(record: Dict[str, Any], path: Path = USAGE_LOG_PATH) -> None:
+    """1 レコードを JSONL に追記する（既存行は書き換えない）。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def invoke_with_usage(
+    agent: Any,
+    payload: Dict[str, Any],
+    *,
+    call: str,
+    model: str,
+    model_role: str,
+    scene_size: Optional[int] = None,
+    scene_hash: Optional[str] = None,
+) -> Any:
+    """agent.invoke を計測付きで実行し、結果はそのまま返す。
+
+    ログ書き込みに失敗しても推論結果は返す（計測で本処理を止めない）。
+    scene_hash はプロンプトのシーンブロック（prompt_layout）の識別子で、
+    同じシーンでの繰り返し呼び出しのキャッシュヒットを追うのに使う。
+    """
+    t0 = time.perf_counter()
+    error: Optional[str] = None
+    result: Any = None
+    try:
+        result = agent.invoke(payload)
+        return result
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        latency = time.perf_counter() - t0
+        try:
+            usage = extract_usage(result)
+            record = {
+                "ts": datetime.now(timezone.utc).isoformat(),
+                "endpoint": _current_endpoint.get(),
+                "call": call,
+                "model_role": model_role,
+                "model": model,
+                "scene_size": scene_size,
+                "scene_hash": scene_hash,
+                "latency_s": round(latency, 4),
+                **usage,
+                "cost_usd": estimate_cost_usd(
+                    usage["response_model"] or model,
+                    usage["input_tokens"],
+                    usage["cached_tokens"],
+                    usage["output_tokens"],
+                ),
+                "ok": error is None,
+                "error": error,
+            }
+            append_usage_record(record)
+            if usage["input_tokens"]:
+                hit = 100.0 * usage["cached_tokens"] / usage["input_tokens"]
+                print(
+                    f"【LLM Usage】{call}: in={usage['input_tokens']} cached={usage['cached_tokens']} "
+                    f"({hit:.0f}%) out={usage['output_tokens']} {latency:.2f}s"
+                )
+        except Exception as log_err:
+            print(f"【LLM Usage】usage ログの記録に失敗しました: {log_err!r}")
@@ -0,0 +1,144 @@
+"""LLM usage ログ（usage.py が書く JSONL）を集計して表示する。
+
+Run (SystemServer/src から):
+  python LLM_Agent/usage_report.py
+  python LLM_Agent/usage_report.py --by endpoint model
+  python LLM_Agent/usage_report.py --scene-bucket 8 --json
+
+--by を省略すると endpoint / model / scene の 3 表を順に出す。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from LLM_Agent.usage import USAGE_LOG_PATH
+
+GROUP_KEYS = ("endpoint", "call", "model", "scene", "scene_hash")
+
+
+def load_records(path: Path) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"⚠️ skip broken line {lineno}", file=sys.stderr)
+    return records
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    idx = min(len(s) - 1, max(0, int(round(q * (len(s) - 1)))))
+    return s[idx]
+
+
+def _group_value(rec: Dict[str, Any], key: str, scene_bucket: int) -> str:
+    if key == "model":
+        # OPENAI_MODEL / OPENAI_MODEL_LIGHT の区別と実モデル名を併記する
+        return f"{rec.get('model_role')}={rec.get('model')}"
+    if key == "scene":
+        size = rec.get("scene_size")
+        if size is None:
+            return "n/a"
+        lo = (int(size) // scene_bucket) * scene_bucket
+        return f"{lo}-{lo + scene_bucket - 1}"
+    return str(rec.get(key))
+
+
+def aggregate(records: Iterable[Dict[str, Any]], keys: Tuple[str, ...], scene_bucket: int) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for rec in records:
+        groups[tuple(_group_value(rec, k, scene_bucket) for k in keys)].append(rec)
+
+    rows = []
+    for group, recs in sorted(groups.items()):
+        n = len(recs)
+        inp = sum(r.get("input_tokens", 0) for r in recs)
+        cached = sum(r.get("cached_tokens", 0) for r in recs)
+        out = sum(r.get("output_tokens", 0) for r in recs)
+        latencies = [float(r.get("latency_s", 0.0)) for r in recs]
+        costs = [r["cost_usd"] for r in recs if r.get("cost_usd") is not None]
+        rows.append({
+            **dict(zip(keys, group)),
+            "calls": n,
+            "errors": sum(1 for r in recs if not r.get("ok", True)),
+            "avg_input": inp / n,
+            "avg_cached": cached / n,
+            "cache_hit_pct": (100.0 * cached / inp) if inp else 0.0,
+            "avg_output": out / n,
+            "p50_latency_s": _percentile(latencies, 0.50),
+            "p95_latency_s": _percentile(latencies, 0.95),
+            "total_cost_usd": sum(costs) if costs else None,
+        })
+    return rows
+
+
+def print_table(rows: List[Dict[str, Any]], keys: Tuple[str, ...]) -> None:
+    header = list(keys) + ["calls", "err", "avg_in", "avg_cached", "hit%", "avg_out", "p50_s", "p95_s", "cost$"]
+    lines = [header]
+    for r in rows:
+        cost = "-" if r["total_cost_usd"] is None else f"{r['total_cost_usd']:.4f}"
+        lines.append([str(r[k]) for k in keys] + [
+            str(r["calls"]),
+            str(r["errors"]),
+            f"{r['avg_input']:.0f}",
+            f"{r['avg_cached']:.0f}",
+            f"{r['cache_hit_pct']:.1f}",
+            f"{r['avg_output']:.0f}",
+            f"{r['p50_latency_s']:.2f}",
+            f"{r['p95_latency_s']:.2f}",
+            cost,
+        ])
+    widths = [max(len(row[i]) for row in lines) for i in range(len(header))]
+    for i, row in enumerate(lines):
+        print("  ".join(cell.ljust(w) for cell, w in zip(row, widths)))
+        if i == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default=str(USAGE_LOG_PATH), help="usage ログ（JSONL）のパス")
+    parser.add_argument("--by", nargs="+", choices=GROUP_KEYS, help="集計キー（複数指定で組み合わせ）")
+    parser.add_argument("--scene-bucket", type=int, default=5, help="scene_size の区切り幅（オブジェクト数）")
+    parser.add_argument("--json", action="store_true", help="表の代わりに JSON で出力")
+    args = parser.parse_args()
+
+    path = Path(args.file)
+    if not path.is_file():
+        raise FileNotFoundError(f"Usage log not found: {path}")
+
+    records = load_records(path)
+    groupings = [tuple(args.by)] if args.by else [("endpoint",), ("model",), ("scene",)]
+
+    if args.json:
+        print(json.dumps(
+            {"+".join(keys): aggregate(records, keys, args.scene_bucket) for keys in groupings},
+            indent=2,
+            ensure_ascii=False,
+        ))
+        return 0
+
+    print(f"{len(records)} records from {path}")
+    for keys in groupings:
+        print(f"\n=== by {' + '.join(keys)} ===")
+        print_table(aggregate(records, keys, args.scene_bucket), keys)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
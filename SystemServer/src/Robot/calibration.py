@@ -0,0 +1,260 @@
+"""Unity のアンカー座標（qr_grid_config.json の localPos）とロボット座標の変換。
+
+Unity 側は QR アンカー基準の localPos [m]（x, z が水平面、y が上）を、ロボット側は
+grid_pose_map.json の姿勢 [mm] をグリッドセル番号ごとに保存している。同じセル番号同士を
+対応点として、水平面の変換
+  [rx, ry] = M @ [lx, lz] + t
+を当てはめる。
+  "rigid"     : 回転 + 平行移動（スケールは unit_scale 固定。m -> mm なら 1000）
+  "similarity": 回転 + 平行移動 + 一様スケール
+  "affine"    : 一般の 2D アフィン（せん断・軸ごとのスケールも吸収）。3 点以上
+rigid / similarity は鏡映あり・なしの両方を解いて誤差の小さい方を使う（Unity は左手系）。
+高さは rz = z0 + scale * ly、姿勢は対応点の円周平均とする。
+
+外れ値（教示ミス・QR の誤検出）は、誤差が max(outlier_mm, 3 * 1.4826 * 誤差の中央値) を
+超える最悪点を 1 点ずつ除いて当て直す（全体の max_outlier_frac まで）。
+
+  tf = UnityRobotTransform.from_configs(grid_config, pose_map)
+  tf.to_robot([{"x": 0.26, "y": 0.0, "z": 0.21}, (0.37, 0.0, 0.33)])   # -> [[x, y, z, r, p, yaw], ...]
+  tf.fit_stats()                                                       # rms / max / 除外した点
+
+  python -m Robot.calibration saved_grids/qr_grid_config.json robot_grid/grid_pose_map.json
+"""
+from __future__ import annotations
+
+import json
+import math
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from Robot.grid_model import _circular_mean, _solve, cell_key
+
+METHODS = ("rigid", "similarity", "affine")
+CALIBRATION_VERSION = 1
+
+
+def local_xyz(point: Any) -> Tuple[float, float, float]:
+    """{"x", "y", "z"} / (x, y, z) を (x, y, z) にする"""
+    if isinstance(point, dict):
+        return float(point["x"]), float(point.get("y", 0.0)), float(point["z"])
+    x, y, z = point
+    return float(x), float(y), float(z)
+
+
+def match_points(grid_config: Any, pose_map: Dict[str, Sequence[float]]) -> List[Tuple[str, Tuple[float, float, float], List[float]]]:
+    """
+    qr_grid_config.json の点（gridX / gridY / localPos）と pose_map をセル番号で対応付ける。
+    戻り値は [(セルキー, localPos, ロボット姿勢), ...]。片方にしか無いセルは無視する。
+    """
+    points = grid_config.get("points", []) if isinstance(grid_config, dict) else (grid_config or [])
+    matched = []
+    for p in points:
+        try:
+            key = cell_key(p["gridX"], p["gridY"])
+            local = local_xyz(p["localPos"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if key in pose_map:
+            matched.append((key, local, list(pose_map[key])))
+    return matched
+
+
+def _fit_rotation(a: List[Tuple[float, float]], b: List[Tuple[float, float]], scale: Optional[float]) -> Tuple[List[float], float]:
+    """中心化済みの a -> b の回転（+ スケール）。戻り値は ([m00, m01, m10, m11], scale)"""
+    dot = sum(ax * bx + ay * by for (ax, ay), (bx, by) in zip(a, b))
+    cross = sum(ax * by - ay * bx for (ax, ay), (bx, by) in zip(a, b))
+    th = math.atan2(cross, dot)
+    c, s = math.cos(th), math.sin(th)
+    if scale is None:
+        norm = sum(ax * ax + ay * ay for ax, ay in a)
+        scale = (c * dot + s * cross) / norm if norm > 0 else 1.0
+    return [scale * c, -scale * s, scale * s, scale * c], scale
+
+
+def _fit_plane(local: List[Tuple[float, float]], robot: List[Tuple[float, float]], method: str,
+               unit_scale: float) -> Tuple[List[float], float]:
+    """水平面の変換 [m00, m01, tx, m10, m11, ty] と高さ方向のスケールを返す"""
+    n = len(local)
+    if method == "affine":
+        if n < 3:
+            raise ValueError(f"affine fit needs at least 3 points, got {n}")
+        ata = [[0.0] * 3 for _ in range(3)]
+        atb = [[0.0] * 2 for _ in range(3)]
+        for (lx, lz), (rx, ry) in zip(local, robot):
+            t = (lx, lz, 1.0)
+            for r in range(3):
+                for c in range(3):
+                    ata[r][c] += t[r] * t[c]
+                atb[r][0] += t[r] * rx
+                atb[r][1] += t[r] * ry
+        sol = _solve(ata, atb)
+        m = [sol[0][0], sol[1][0], sol[2][0], sol[0][1], sol[1][1], sol[2][1]]
+        return m, math.sqrt(abs(m[0] * m[4] - m[1] * m[3]))
+
+    if n < 2:
+        raise ValueError(f"{method} fit needs at least 2 points, got {n}")
+    ca = (sum(p[0] for p in local) / n, sum(p[1] for p in local) / n)
+    cb = (sum(p[0] for p in robot) / n, sum(p[1] for p in robot) / n)
+    b = [(x - cb[0], y - cb[1]) for x, y in robot]
+    best = None
+    for mirror in (1.0, -1.0):
+        # 鏡映は lz の符号反転として扱う
+        a = [(x - ca[0], mirror * (z - ca[1])) for x, z in local]
+        rot, scale = _fit_rotation(a, b, unit_scale if method == "rigid" else None)
+        sse = sum((rot[0] * ax + rot[1] * ay - bx) ** 2 + (rot[2] * ax + rot[3] * ay - by) ** 2
+                  for (ax, ay), (bx, by) in zip(a, b))
+        if best is None or sse < best[0]:
+            m00, m01, m10, m11 = rot[0], rot[1] * mirror, rot[2], rot[3] * mirror
+            best = (sse, [m00, m01, cb[0] - m00 * ca[0] - m01 * ca[1],
+                          m10, m11, cb[1] - m10 * ca[0] - m11 * ca[1]], scale)
+    return best[1], best[2]
+
+
+class UnityRobotTransform:
+    def __init__(
+        self,
+        matrix: Sequence[float],
+        z0: float,
+        z_scale: float,
+        orientation: Sequence[float],
+        method: str = "rigid",
+        residuals: Optional[Dict[str, float]] = None,
+        outliers: Optional[List[str]] = None,
+    ):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}: {method!r}")
+        # [m00, m01, tx, m10, m11, ty]: rx = m00*lx + m01*lz + tx, ry = m10*lx + m11*lz + ty
+        self.matrix = array("d", matrix)
+        self.z0 = z0
+        self.z_scale = z_scale
+        self.orientation = array("d", orientation)
+        self.method = method
+        self.residuals: Dict[str, float] = dict(residuals or {})
+        self.outliers: List[str] = list(outliers or [])
+
+    # ------------------------------------------------------------------
+    # 当てはめ
+    # ------------------------------------------------------------------
+    @classmethod
+    def fit(
+        cls,
+        matched: List[Tuple[str, Tuple[float, float, float], List[float]]],
+        method: str = "rigid",
+        unit_scale: float = 1000.0,
+        outlier_mm: float = 10.0,
+        max_outlier_frac: float = 0.25,
+    ) -> "UnityRobotTransform":
+        """matched は match_points() の戻り値"""
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}: {method!r}")
+        inliers = list(matched)
+        outliers: List[str] = []
+        min_points = 3 if method == "affine" else 2
+        max_drop = int(len(matched) * max_outlier_frac)
+        while True:
+            m, scale = _fit_plane([(l[0], l[2]) for _, l, _ in inliers], [(p[0], p[1]) for _, _, p in inliers],
+                                  method, unit_scale)
+            res = {key: math.hypot(m[0] * l[0] + m[1] * l[2] + m[2] - p[0], m[3] * l[0] + m[4] * l[2] + m[5] - p[1])
+                   for key, l, p in inliers}
+            if len(outliers) >= max_drop or len(inliers) - 1 < max(min_points, 3):
+                break
+            med = sorted(res.values())[len(res) // 2]
+            worst = max(res, key=res.get)
+            if res[worst] <= max(outlier_mm, 3 * 1.4826 * med):
+                break
+            outliers.append(worst)
+            inliers = [e for e in inliers if e[0] != worst]
+
+        z0 = sum(p[2] - scale * l[1] for _, l, p in inliers) / len(inliers)
+        orientation = [_circular_mean([p[a] for _, _, p in inliers]) for a in (3, 4, 5)]
+        tf = cls(m, z0, scale, orientation, method=method, residuals=res, outliers=outliers)
+        # 除外した点の誤差も最終モデルで記録する
+        for key, l, p in matched:
+            if key in outliers:
+                q = tf.to_robot_one(l)
+                tf.residuals[key] = math.hypot(q[0] - p[0], q[1] - p[1])
+        return tf
+
+    @classmethod
+    def from_configs(cls, grid_config: Any, pose_map: Dict[str, Sequence[float]], **kwargs) -> "UnityRobotTransform":
+        """qr_grid_config.json の内容と pose_map から当てはめる"""
+        return cls.fit(match_points(grid_config, pose_map), **kwargs)
+
+    # ------------------------------------------------------------------
+    # 変換
+    # ------------------------------------------------------------------
+    def to_robot_one(self, point: Any) -> List[float]:
+        lx, ly, lz = local_xyz(point)
+        m = self.matrix
+        return [m[0] * lx + m[1] * lz + m[2], m[3] * lx + m[4] * lz + m[5],
+                self.z0 + self.z_scale * ly] + list(self.orientation)
+
+    def to_robot(self, points: Sequence[Any]) -> List[List[float]]:
+        """localPos の列をまとめてロボット姿勢 [x, y, z, roll, pitch, yaw] に変換する"""
+        m00, m01, tx, m10, m11, ty = self.matrix
+        z0, zs, orient = self.z0, self.z_scale, list(self.orientation)
+        out = []
+        for p in points:
+            lx, ly, lz = local_xyz(p)
+            out.append([m00 * lx + m01 * lz + tx, m10 * lx + m11 * lz + ty, z0 + zs * ly] + orient)
+        return out
+
+    def fit_stats(self) -> Dict[str, Any]:
+        inl = [r for k, r in self.residuals.items() if k not in self.outliers]
+        return {
+            "method": self.method,
+            "points": len(inl),
+            "rms_mm": math.sqrt(sum(r * r for r in inl) / len(inl)) if inl else 0.0,
+            "max_mm": max(inl) if inl else 0.0,
+            "scale": self.z_scale,
+            "outliers": {k: self.residuals.get(k) for k in self.outliers},
+        }
+
+    # ------------------------------------------------------------------
+    # 保存
+    # ------------------------------------------------------------------
+    def to_dict(self) -> dict:
+        return {
+            "version": CALIBRATION_VERSION,
+            "method": self.method,
+            "matrix": list(self.matrix),
+            "z0": self.z0,
+            "z_scale": self.z_scale,
+            "orientation": list(self.orientation),
+            "residuals": self.residuals,
+            "outliers": self.outliers,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UnityRobotTransform":
+        if data.get("version") != CALIBRATION_VERSION:
+            raise ValueError(f"unsupported calibration version: {data.get('version')}")
+        return cls(data["matrix"], data["z0"], data["z_scale"], data["orientation"],
+                   method=data.get("method", "rigid"), residuals=data.get("residuals"),
+                   outliers=data.get("outliers"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="qr_grid_config.json と grid_pose_map.json から座標変換を当てはめる")
+    parser.add_argument("grid_config", help="qr_grid_config.json（Unity 側）")
+    parser.add_argument("pose_map", help="grid_pose_map.json（ロボット側）")
+    parser.add_argument("--method", choices=METHODS, default="rigid")
+    parser.add_argument("--outlier-mm", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(args.grid_config, "r", encoding="utf-8") as f:
+        grid_config = json.load(f)
+    if isinstance(grid_config, str):
+        grid_config = json.loads(grid_config)
+    with open(args.pose_map, "r", encoding="utf-8") as f:
+        pose_map = json.load(f)
+
+    tf = UnityRobotTransform.from_configs(grid_config, pose_map, method=args.method, outlier_mm=args.outlier_mm)
+    for key, r in sorted(tf.residuals.items(), key=lambda kv: -kv[1]):
+        mark = "  (outlier)" if key in tf.outliers else ""
+        print(f"  {key:>6}: {r:6.2f} mm{mark}")
+    stats = tf.fit_stats()
+    print(f"method={stats['method']} scale={stats['scale']:.1f} rms={stats['rms_mm']:.2f} mm "
+          f"max={stats['max_mm']:.2f} mm ({stats['points']} points, {len(tf.outliers)} outliers)")
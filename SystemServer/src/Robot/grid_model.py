@@ -0,0 +1,265 @@
+"""教示済みセルから当てはめるグリッド姿勢モデル。
+
+grid_pose_map.json（"x,y" -> [x, y, z, roll, pitch, yaw]）の全セルを教示する代わりに、
+教示セルから
+  位置 p(i, j) = origin + i * col_vec + j * row_vec (+ i * j * twist)
+を最小二乗で求め、任意の（小数を含む）セルの姿勢を O(1) で返す。
+  "affine"  : 平面 + 格子ベクトル。3 セル以上（同一直線上でないこと）
+  "bilinear": affine + ねじれ項。4 隅が平行四辺形でないトレイ用。4 セル以上
+姿勢（roll / pitch / yaw）は教示セルの円周平均を使う。
+
+教示セルは常にモデルより優先する（教示した値をそのまま返す）。小数セルは、周囲 4 セルが
+すべて教示済みならその双一次補間、そうでなければモデル値を返す。
+係数は array('d') で保持し、to_dict() / save() で JSON に書き出せる。
+
+  model = GridPoseModel.fit(pose_map)              # 教示マップから当てはめ
+  model.pose(1.5, 2)                               # -> [x, y, z, roll, pitch, yaw]
+  model.residuals()                                # 教示セルごとの当てはめ誤差 [mm]
+
+  python -m Robot.grid_model robot_grid/grid_pose_map.json [--method bilinear] [--size 8,8]
+"""
+from __future__ import annotations
+
+import json
+import math
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+METHODS = ("affine", "bilinear")
+MODEL_VERSION = 1
+
+
+def parse_cell(key) -> Tuple[float, float]:
+    """"x,y" / (x, y) をセル座標 (float, float) にする。形や値が不正なら ValueError"""
+    try:
+        parts = key.split(",") if isinstance(key, str) else list(key)
+        if len(parts) != 2:
+            raise ValueError
+        return float(parts[0]), float(parts[1])
+    except (TypeError, ValueError):
+        raise ValueError(f"cell must be 'x,y' or (x, y): {key!r}") from None
+
+
+def cell_key(x, y) -> str:
+    """セル座標を pose_map のキー形式にする（整数値なら "1,2"、小数なら "1.5,2"）。数値でなければ ValueError"""
+    def fmt(v) -> str:
+        try:
+            v = float(v)
+        except (TypeError, ValueError):
+            raise ValueError(f"cell coordinates must be numbers: ({x!r}, {y!r})") from None
+        if not math.isfinite(v):
+            raise ValueError(f"cell coordinates must be finite: ({x!r}, {y!r})")
+        return str(int(v)) if v.is_integer() else f"{v:g}"
+    return f"{fmt(x)},{fmt(y)}"
+
+
+def _terms(i: float, j: float, n: int) -> Tuple[float, ...]:
+    return (1.0, i, j, i * j)[:n]
+
+
+def _solve(a: List[List[float]], b: List[List[float]]) -> List[List[float]]:
+    """a x = b を部分ピボット付きガウス消去で解く（a: n x n, b: n x m）"""
+    n = len(a)
+    m = [row[:] + rhs[:] for row, rhs in zip(a, b)]
+    for col in range(n):
+        piv = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[piv][col]) < 1e-9:
+            raise ValueError("taught cells are degenerate (collinear or too few)")
+        m[col], m[piv] = m[piv], m[col]
+        for r in range(n):
+            if r != col:
+                f = m[r][col] / m[col][col]
+                m[r] = [x - f * y for x, y in zip(m[r], m[col])]
+    return [[v / m[r][r] for v in m[r][n:]] for r in range(n)]
+
+
+def _circular_mean(angles: Sequence[float]) -> float:
+    s = sum(math.sin(math.radians(a)) for a in angles)
+    c = sum(math.cos(math.radians(a)) for a in angles)
+    return math.degrees(math.atan2(s, c))
+
+
+class GridPoseModel:
+    def __init__(
+        self,
+        coef: Sequence[float],
+        orientation: Sequence[float],
+        method: str = "affine",
+        taught: Optional[Dict[str, Sequence[float]]] = None,
+        size: Optional[Tuple[int, int]] = None,
+    ):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}: {method!r}")
+        n = len(_terms(0, 0, 4 if method == "bilinear" else 3))
+        if len(coef) != 3 * n:
+            raise ValueError(f"{method} model needs {3 * n} coefficients, got {len(coef)}")
+        self.method = method
+        self._n = n
+        # coef[k * n + t]: 座標 k（x/y/z）の項 t（1, i, j, ij）の係数
+        self.coef = array("d", coef)
+        self.orientation = array("d", orientation)
+        self.taught: Dict[str, List[float]] = {cell_key(*parse_cell(k)): list(v) for k, v in (taught or {}).items()}
+        self.size = tuple(size) if size else None
+        cells = [parse_cell(k) for k in self.taught]
+        # 教示セルの範囲 (min_x, max_x, min_y, max_y)。size 未設定時の contains に使う
+        self._extent = ((min(c[0] for c in cells), max(c[0] for c in cells),
+                         min(c[1] for c in cells), max(c[1] for c in cells)) if cells else None)
+
+    # ------------------------------------------------------------------
+    # 当てはめ
+    # ------------------------------------------------------------------
+    @classmethod
+    def fit(
+        cls,
+        pose_map: Dict[str, Sequence[float]],
+        method: str = "affine",
+        size: Optional[Tuple[int, int]] = None,
+    ) -> "GridPoseModel":
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}: {method!r}")
+        n = 4 if method == "bilinear" else 3
+        cells = [(parse_cell(k), v) for k, v in pose_map.items()]
+        if len(cells) < n:
+            raise ValueError(f"{method} fit needs at least {n} taught cells, got {len(cells)}")
+
+        # 正規方程式 (A^T A) c = A^T p を x / y / z まとめて解く
+        ata = [[0.0] * n for _ in range(n)]
+        atp = [[0.0] * 3 for _ in range(n)]
+        for (i, j), pose in cells:
+            t = _terms(i, j, n)
+            for r in range(n):
+                for c in range(n):
+                    ata[r][c] += t[r] * t[c]
+                for k in range(3):
+                    atp[r][k] += t[r] * pose[k]
+        sol = _solve(ata, atp)
+        coef = [sol[t][k] for k in range(3) for t in range(n)]
+        orientation = [_circular_mean([v[a] for _, v in cells]) for a in (3, 4, 5)]
+        return cls(coef, orientation, method=method, taught=pose_map, size=size)
+
+    # ------------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------------
+    @property
+    def origin(self) -> List[float]:
+        return [self.coef[k * self._n] for k in range(3)]
+
+    @property
+    def col_vec(self) -> List[float]:
+        """セル x 方向 1 つ分の移動量 [mm]"""
+        return [self.coef[k * self._n + 1] for k in range(3)]
+
+    @property
+    def row_vec(self) -> List[float]:
+        """セル y 方向 1 つ分の移動量 [mm]"""
+        return [self.coef[k * self._n + 2] for k in range(3)]
+
+    def contains(self, x: float, y: float) -> bool:
+        """size（列数, 行数）の範囲内か。size 未設定なら教示セルの範囲で判定する"""
+        if self.size:
+            return 0 <= x <= self.size[0] - 1 and 0 <= y <= self.size[1] - 1
+        if self._extent is None:
+            return True
+        x0, x1, y0, y1 = self._extent
+        return x0 <= x <= x1 and y0 <= y <= y1
+
+    def model_pose(self, x: float, y: float) -> List[float]:
+        """モデルだけから求めた姿勢（教示値を使わない）"""
+        t = _terms(x, y, self._n)
+        n, c = self._n, self.coef
+        xyz = [sum(c[k * n + m] * t[m] for m in range(n)) for k in range(3)]
+        return xyz + list(self.orientation)
+
+    def pose(self, x, y=None) -> List[float]:
+        """
+        セル (x, y)（"x,y" 文字列も可）の姿勢。教示セルは教示値、小数セルは周囲 4 セルが
+        教示済みなら双一次補間、それ以外はモデル値。
+        """
+        if y is None:
+            x, y = parse_cell(x)
+        x, y = float(x), float(y)
+        taught = self.taught.get(cell_key(x, y))
+        if taught is not None:
+            return list(taught)
+        x0, y0 = math.floor(x), math.floor(y)
+        corners = [self.taught.get(cell_key(x0 + dx, y0 + dy)) for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1))]
+        if all(c is not None for c in corners):
+            fx, fy = x - x0, y - y0
+            w = ((1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy)
+            xyz = [sum(wi * c[k] for wi, c in zip(w, corners)) for k in range(3)]
+            return xyz + list(self.orientation)
+        return self.model_pose(x, y)
+
+    def residuals(self) -> Dict[str, float]:
+        """教示セルごとのモデル誤差（xyz のユークリッド距離 [mm]）"""
+        out = {}
+        for key, pose in self.taught.items():
+            fit = self.model_pose(*parse_cell(key))
+            out[key] = math.dist(fit[:3], pose[:3])
+        return out
+
+    def fit_stats(self) -> Dict[str, float]:
+        res = list(self.residuals().values())
+        if not res:
+            return {"cells": 0, "rms_mm": 0.0, "max_mm": 0.0}
+        return {
+            "cells": len(res),
+            "rms_mm": math.sqrt(sum(r * r for r in res) / len(res)),
+            "max_mm": max(res),
+        }
+
+    # ------------------------------------------------------------------
+    # 保存
+    # ------------------------------------------------------------------
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "method": self.method,
+            "coef": list(self.coef),
+            "orientation": list(self.orientation),
+            "size": list(self.size) if self.size else None,
+            "taught": self.taught,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GridPoseModel":
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError(f"unsupported grid model version: {data.get('version')}")
+        return cls(data["coef"], data["orientation"], method=data.get("method", "affine"),
+                   taught=data.get("taught"), size=data.get("size"))
+
+    def save(self, path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path) -> "GridPoseModel":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="grid_pose_map.json からグリッドモデルを当てはめる")
+    parser.add_argument("pose_map", help="grid_pose_map.json")
+    parser.add_argument("--method", choices=METHODS, default="affine")
+    parser.add_argument("--size", help="グリッドの列数,行数（例: 8,8）")
+    parser.add_argument("--out", help="モデルの保存先（省略時は保存しない）")
+    args = parser.parse_args()
+
+    with open(args.pose_map, "r", encoding="utf-8") as f:
+        pose_map = json.load(f)
+    size = tuple(int(v) for v in args.size.split(",")) if args.size else None
+    model = GridPoseModel.fit(pose_map, method=args.method, size=size)
+
+    print(f"method={model.method} origin={[round(v, 2) for v in model.origin]}")
+    print(f"col_vec={[round(v, 2) for v in model.col_vec]} row_vec={[round(v, 2) for v in model.row_vec]}")
+    for key, r in sorted(model.residuals().items(), key=lambda kv: -kv[1]):
+        print(f"  {key:>6}: {r:6.2f} mm")
+    stats = model.fit_stats()
+    print(f"rms={stats['rms_mm']:.2f} mm  max={stats['max_mm']:.2f} mm  ({stats['cells']} cells)")
+    if args.out:
+        model.save(Path(args.out))
+        print(f"saved {args.out}")
@@ -0,0 +1,190 @@
+"""xArm の接続・コントローラ状態をバックグラウンドで監視する。
+
+一定周期（interval 秒）で RobotStateCache と arm.connected を確認し、
+  - 通信断を検知したら指数バックオフで XArmOperator.reconnect() を繰り返す
+    （姿勢が安全高さ以上なら再ホーミングせずにその場で再開する）
+  - コントローラエラー / 停止状態（衝突検知・非常停止など）は error として公開するだけで、
+    自動では解除しない。操作者が確認してから clear_error() を呼ぶ（POST /robot/clear_error）。
+    auto_clear=True で従来の自動解除に戻せるが、非常停止の解除直後に待ち中のピックが動き出す
+状態は snapshot() / is_ready() でサーバーに公開し、ピックの受付可否判定に使う。
+
+レポートが stale_s 秒以上途絶えたときだけ get_state() で生存確認する（通常は RPC を出さない）。
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# 公開する健全性ステータス
+STATUS_OK = "ok"                      # ピック可能
+STATUS_ERROR = "error"                # 接続中だがコントローラエラー / 停止状態
+STATUS_RECONNECTING = "reconnecting"  # 通信断からの再接続中
+STATUS_DISCONNECTED = "disconnected"  # 未接続（監視開始前・停止後を含む）
+
+STATE_STOPPED = 4
+
+
+class RobotHealthMonitor:
+    def __init__(
+        self,
+        operator: Any,
+        interval: float = 1.0,
+        backoff_initial: float = 0.5,
+        backoff_max: float = 10.0,
+        stale_s: float = 3.0,
+        auto_clear: bool = False,
+    ):
+        self.operator = operator
+        self.interval = interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stale_s = stale_s
+        self.auto_clear = auto_clear
+
+        self.status = STATUS_DISCONNECTED
+        self.reason = "not started"
+        self.since = time.time()
+        self.last_ok: Optional[float] = None
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.last_error: Optional[str] = None
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 起動・停止
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="xarm-health", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._set_status(STATUS_DISCONNECTED, "monitor stopped")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = repr(e)
+                print(f"[Health] check failed: {e!r}")
+            if self.status == STATUS_RECONNECTING:
+                continue  # 待ちは _reconnect のバックオフで行う
+            self._stop.wait(self.interval)
+
+    # ------------------------------------------------------------------
+    # 判定
+    # ------------------------------------------------------------------
+    def _set_status(self, status: str, reason: str) -> None:
+        with self._cond:
+            if status != self.status:
+                print(f"[Health] {self.status} -> {status} ({reason})")
+                self.since = time.time()
+            self.status = status
+            self.reason = reason
+            if status == STATUS_OK:
+                self.last_ok = time.time()
+            self._cond.notify_all()
+
+    def _link_alive(self) -> bool:
+        op = self.operator
+        arm = op.arm
+        if arm is None or not op.connected:
+            return False
+        if not getattr(arm, "connected", True) or not op.state.connected:
+            return False
+        cache = op.state
+        last_seen = max(cache.pose_ts, cache.state_ts, cache.error_ts)
+        if cache.now() - last_seen <= self.stale_s:
+            return True
+        # レポートが途絶えているときだけ RPC で生存確認
+        code, _ = arm.get_state()
+        return code == 0
+
+    def check(self) -> str:
+        """1 回分の監視処理。現在のステータスを返す"""
+        if not self._link_alive():
+            self._reconnect()
+            return self.status
+
+        cache = self.operator.state
+        if cache.has_error or cache.state == STATE_STOPPED:
+            reason = f"controller error={cache.error_code} state={cache.state}"
+            if self.auto_clear and self.operator.is_idle():
+                ok, msg = self.operator.clear_error()
+                if ok:
+                    self._set_status(STATUS_OK, "error cleared")
+                    return self.status
+                reason += f" (clear failed: {msg})"
+            self._set_status(STATUS_ERROR, reason)
+            return self.status
+
+        self._set_status(STATUS_OK, "connected")
+        return self.status
+
+    def _reconnect(self) -> None:
+        """成功するか stop() されるまで指数バックオフで再接続する"""
+        delay = self.backoff_initial
+        self.reconnect_attempts = 0
+        while not self._stop.is_set():
+            self.reconnect_attempts += 1
+            self._set_status(STATUS_RECONNECTING, f"link down, attempt {self.reconnect_attempts}")
+            ok, msg = self.operator.reconnect()
+            if ok:
+                self.reconnects += 1
+                self._set_status(STATUS_OK, msg)
+                return
+            self.last_error = msg
+            print(f"[Health] reconnect failed: {msg} (retry in {delay:.1f}s)")
+            self._stop.wait(delay)
+            delay = min(delay * 2.0, self.backoff_max)
+
+    # ------------------------------------------------------------------
+    # 公開
+    # ------------------------------------------------------------------
+    def clear_error(self) -> tuple[bool, str]:
+        """操作者の確認後にコントローラエラーを解除して Ready に戻す（動作中は何もしない）"""
+        if not self.operator.is_idle():
+            return False, "robot is moving"
+        ok, msg = self.operator.clear_error()
+        self.check()
+        return ok, msg
+
+    def is_ready(self) -> tuple[bool, str]:
+        with self._cond:
+            return self.status == STATUS_OK, f"{self.status}: {self.reason}"
+
+    def wait_ready(self, timeout: float) -> bool:
+        """ステータスが ok になるまで最大 timeout 秒待つ"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.status == STATUS_OK, timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        cache = self.operator.state
+        with self._cond:
+            return {
+                "status": self.status,
+                "reason": self.reason,
+                "since": self.since,
+                "last_ok": self.last_ok,
+                "reconnects": self.reconnects,
+                "reconnect_attempts": self.reconnect_attempts,
+                "last_error": self.last_error,
+                "monitoring": bool(self._thread and self._thread.is_alive()),
+                "controller": {
+                    "connected": cache.connected,
+                    "state": cache.state,
+                    "error_code": cache.error_code,
+                    "warn_code": cache.warn_code,
+                    "pose": cache.pose,
+                },
+            }
@@ -0,0 +1,96 @@
+"""xArm の動作時間モデル（台形速度プロファイル）。
+
+シミュレータ（sim_xarm.py）とピック計画（所要時間の見積もり）で共用する。
+速度・加速度の既定値は xArm Python SDK の初期値に合わせている。
+"""
+from __future__ import annotations
+
+import math
+from typing import Sequence
+
+# xArm SDK の既定値（set_position / set_servo_angle で speed, mvacc 未指定時）
+DEFAULT_TCP_SPEED = 100.0     # mm/s
+DEFAULT_TCP_ACC = 2000.0      # mm/s^2
+DEFAULT_JOINT_SPEED = 20.0    # deg/s
+DEFAULT_JOINT_ACC = 500.0     # deg/s^2
+
+# グリッパー: 位置単位 (0-850) / s = speed(r/min) * GRIPPER_UNITS_PER_SPEED
+DEFAULT_GRIPPER_SPEED = 1500.0
+GRIPPER_UNITS_PER_SPEED = 0.5
+
+
+def trapezoid_time(dist: float, speed: float, acc: float) -> float:
+    """距離 dist を最高速度 speed・加速度 acc の台形（または三角）プロファイルで動く時間"""
+    dist = abs(dist)
+    if dist <= 0.0:
+        return 0.0
+    if speed <= 0.0 or acc <= 0.0:
+        raise ValueError(f"speed/acc must be positive (speed={speed}, acc={acc})")
+    ramp_dist = speed * speed / acc  # 加速 + 減速で進む距離
+    if dist <= ramp_dist:
+        return 2.0 * math.sqrt(dist / acc)
+    return 2.0 * speed / acc + (dist - ramp_dist) / speed
+
+
+def trapezoid_fraction(t: float, dist: float, speed: float, acc: float) -> float:
+    """時刻 t（動作開始からの経過）での進捗率 0..1"""
+    dist = abs(dist)
+    total = trapezoid_time(dist, speed, acc)
+    if total <= 0.0 or t >= total:
+        return 1.0
+    if t <= 0.0:
+        return 0.0
+    ramp_dist = speed * speed / acc
+    if dist <= ramp_dist:
+        v_peak = math.sqrt(dist * acc)
+        t_acc = v_peak / acc
+    else:
+        v_peak = speed
+        t_acc = speed / acc
+    if t < t_acc:
+        s = 0.5 * acc * t * t
+    elif t < total - t_acc:
+        s = 0.5 * acc * t_acc * t_acc + v_peak * (t - t_acc)
+    else:
+        td = total - t
+        s = dist - 0.5 * acc * td * td
+    return min(max(s / dist, 0.0), 1.0)
+
+
+def blend_overlap(speed: float, acc: float, dur_a: float, dur_b: float) -> float:
+    """
+    コーナーブレンドで短縮される時間の近似。
+    減速→停止→再加速の代わりに速度を保ったまま曲がるので、およそ speed/acc 短くなる。
+    どちらかの区間の半分を超えては重ねない。
+    """
+    return max(0.0, min(speed / acc, 0.5 * dur_a, 0.5 * dur_b))
+
+
+def linear_distance(p0: Sequence[float], p1: Sequence[float]) -> float:
+    """TCP の並進距離 (mm)。姿勢変化は無視する"""
+    return math.sqrt(sum((b - a) ** 2 for a, b in zip(p0[:3], p1[:3])))
+
+
+def angle_diff(a: float, b: float) -> float:
+    """a → b の最短角度差 (deg)"""
+    return (b - a + 180.0) % 360.0 - 180.0
+
+
+def joint_distance(j0: Sequence[float], j1: Sequence[float]) -> float:
+    """関節移動の律速となる最大関節変位 (deg)"""
+    return max((abs(b - a) for a, b in zip(j0, j1)), default=0.0)
+
+
+def linear_move_time(p0: Sequence[float], p1: Sequence[float],
+                     speed: float = DEFAULT_TCP_SPEED, acc: float = DEFAULT_TCP_ACC) -> float:
+    return trapezoid_time(linear_distance(p0, p1), speed, acc)
+
+
+def joint_move_time(j0: Sequence[float], j1: Sequence[float],
+                    speed: float = DEFAULT_JOINT_SPEED, acc: float = DEFAULT_JOINT_ACC) -> float:
+    return trapezoid_time(joint_distance(j0, j1), speed, acc)
+
+
+def gripper_move_time(pos0: float, pos1: float, speed: float = DEFAULT_GRIPPER_SPEED) -> float:
+    rate = max(speed * GRIPPER_UNITS_PER_SPEED, 1e-6)
+    return abs(pos1 - pos0) / rate
@@ -0,0 +1,141 @@
+"""複数セルのピック順序を決める（小規模 TSP）。
+
+各アイテムは「セル上空へ移動 → 下降・把持 → 上昇 → 置き場所へ運ぶ → 解放」の順で処理する。
+順序に依存するのは UP_Z での水平移動だけなので、移動コストは motion_model の
+直線移動時間（台形プロファイル）で見積もる。travel を渡せば別のコスト
+（関節移動時間など。その場合 start / targets / place は関節角）を使える。
+
+  place あり: 開始位置 → c1 → place → c2 → place ... → cn → place
+  place なし: 各アイテムを元のセルに戻す（動作確認用）。開始位置 → c1 → c2 ... の開路
+
+どちらも「遷移コスト行列 + 開始コスト + 終了コスト」の開路 TSP に帰着させ、
+EXACT_LIMIT 個以下は Held-Karp（動的計画法）で厳密解、それより多い場合は
+最近傍法 + 2-opt で近似解を求める。
+"""
+from __future__ import annotations
+
+import itertools
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from Robot.motion_model import DEFAULT_TCP_ACC, DEFAULT_TCP_SPEED, trapezoid_time
+
+# Held-Karp は O(n^2 2^n)。12 個で数十 ms 程度
+EXACT_LIMIT = 12
+
+
+def travel_time(p0: Sequence[float], p1: Sequence[float],
+                speed: float = DEFAULT_TCP_SPEED, acc: float = DEFAULT_TCP_ACC) -> float:
+    """UP_Z での水平移動時間（xy 平面の直線距離から見積もる）"""
+    dist = ((p1[0] - p0[0]) ** 2 + (p1[1] - p0[1]) ** 2) ** 0.5
+    return trapezoid_time(dist, speed, acc)
+
+
+@dataclass
+class PickPlan:
+    order: List[str]                    # 実行順のセルキー
+    travel_s: float                     # 水平移動の見積もり合計
+    legs_s: List[float] = field(default_factory=list)  # 各アイテムまでの移動見積もり
+    method: str = "exact"
+
+
+def _path_cost(order: Sequence[int], start: List[float], trans: List[List[float]], end: List[float]) -> float:
+    cost = start[order[0]] + end[order[-1]]
+    for a, b in zip(order, order[1:]):
+        cost += trans[a][b]
+    return cost
+
+
+def _held_karp(start: List[float], trans: List[List[float]], end: List[float]) -> List[int]:
+    n = len(start)
+    # best[(mask, last)] = (cost, prev)
+    best: Dict[tuple, tuple] = {(1 << i, i): (start[i], -1) for i in range(n)}
+    for size in range(2, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            mask = sum(1 << i for i in subset)
+            for last in subset:
+                prev_mask = mask & ~(1 << last)
+                best[(mask, last)] = min(
+                    (best[(prev_mask, k)][0] + trans[k][last], k)
+                    for k in subset if k != last
+                )
+    full = (1 << n) - 1
+    _, last = min((best[(full, i)][0] + end[i], i) for i in range(n))
+    order, mask = [], full
+    while last != -1:
+        order.append(last)
+        _, prev = best[(mask, last)]
+        mask &= ~(1 << last)
+        last = prev
+    return order[::-1]
+
+
+def _nearest_two_opt(start: List[float], trans: List[List[float]], end: List[float]) -> List[int]:
+    n = len(start)
+    remaining = set(range(n))
+    cur = min(remaining, key=lambda i: start[i])
+    order = [cur]
+    remaining.discard(cur)
+    while remaining:
+        cur = min(remaining, key=lambda i: trans[order[-1]][i])
+        order.append(cur)
+        remaining.discard(cur)
+
+    # 非対称コストでも使えるよう、区間反転後のコストは毎回計算し直す
+    improved = True
+    best = _path_cost(order, start, trans, end)
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                cand = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                cost = _path_cost(cand, start, trans, end)
+                if cost < best - 1e-9:
+                    order, best, improved = cand, cost, True
+    return order
+
+
+def plan_pick_order(
+    start: Sequence[float],
+    targets: Dict[str, Sequence[float]],
+    place: Optional[Sequence[float]] = None,
+    speed: float = DEFAULT_TCP_SPEED,
+    acc: float = DEFAULT_TCP_ACC,
+    travel: Optional[Callable[[Sequence[float], Sequence[float]], float]] = None,
+) -> PickPlan:
+    """
+    start: 現在の TCP 姿勢、targets: セルキー -> 姿勢、place: 置き場所の姿勢（None で元のセルへ戻す）
+    水平移動時間の合計が最小になる順序を返す。
+    """
+    keys = list(targets)
+    if not keys:
+        return PickPlan(order=[], travel_s=0.0)
+
+    def t(a: Sequence[float], b: Sequence[float]) -> float:
+        if travel is not None:
+            return travel(a, b)
+        return travel_time(a, b, speed, acc)
+
+    pts = [targets[k] for k in keys]
+    n = len(keys)
+    start_cost = [t(start, p) for p in pts]
+    if place is None:
+        trans = [[t(pts[i], pts[j]) for j in range(n)] for i in range(n)]
+        end_cost = [0.0] * n
+    else:
+        to_place = [t(p, place) for p in pts]
+        trans = [[to_place[i] + t(place, pts[j]) for j in range(n)] for i in range(n)]
+        end_cost = to_place
+
+    if n <= EXACT_LIMIT:
+        idx, method = _held_karp(start_cost, trans, end_cost), "exact"
+    else:
+        idx, method = _nearest_two_opt(start_cost, trans, end_cost), "2opt"
+
+    legs = [start_cost[idx[0]]] + [trans[a][b] for a, b in zip(idx, idx[1:])]
+    return PickPlan(
+        order=[keys[i] for i in idx],
+        travel_s=_path_cost(idx, start_cost, trans, end_cost),
+        legs_s=legs,
+        method=method,
+    )
@@ -0,0 +1,209 @@
+"""xArm のエラー復帰手順を 1 か所にまとめたもの。
+
+固定 sleep を挟む代わりに、コントローラ state / エラーコードの実際の遷移を待つ。
+試行回数（max_attempts）と全体の制限時間（timeout_s）で打ち切るので、復帰処理で
+ハングしない。結果は RecoveryResult で返す（例外は投げない）。
+
+  recovery = ArmRecovery(arm, state_cache=cache)   # cache は任意（あれば RPC を減らせる）
+  result = recovery.recover_arm(mode=0)            # エラー解除 → 有効化 → モード → Ready
+  result = recovery.ensure_ready()                 # 既に Ready なら何もしない
+  result = recovery.move_gripper(850)              # グリッパー指令（失敗時は復帰して再試行）
+
+コントローラ state の遷移（xArm）:
+  STOPPED(4) --set_state(0)--> READY(2) --動作指令--> MOVING(1) --> READY(2)
+  エラー発生時は STOPPED(4) になり、clean_error しない限り set_state(0) は効かない。
+  set_mode() の後も STOPPED になるため、必ず set_state(0) を送る。
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import asdict, dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ControllerState(IntEnum):
+    MOVING = 1
+    READY = 2
+    PAUSED = 3
+    STOPPED = 4
+
+    @classmethod
+    def commandable(cls, state: Optional[int]) -> bool:
+        return state in (cls.MOVING, cls.READY)
+
+
+@dataclass
+class RecoveryResult:
+    ok: bool
+    action: str                         # "arm" / "gripper" / "ensure_ready" など
+    reason: str = ""
+    attempts: int = 0
+    elapsed_s: float = 0.0
+    state: Optional[int] = None
+    error_code: int = 0
+    steps: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["elapsed_s"] = round(self.elapsed_s, 4)
+        return d
+
+
+class ArmRecovery:
+    def __init__(
+        self,
+        arm: Any,
+        state_cache: Any = None,
+        max_attempts: int = 3,
+        timeout_s: float = 5.0,
+        step_timeout_s: float = 1.0,
+        poll_s: float = 0.02,
+    ):
+        self.arm = arm
+        self.cache = state_cache
+        self.max_attempts = max_attempts
+        self.timeout_s = timeout_s
+        self.step_timeout_s = step_timeout_s
+        self.poll_s = poll_s
+        # シミュレータでは仮想時計で待つ
+        self._clock: Callable[[], float] = getattr(arm, "sim_clock", None) or time.monotonic
+        self._sleep: Callable[[float], None] = getattr(arm, "sim_sleep", None) or time.sleep
+
+    # ------------------------------------------------------------------
+    # 状態の読み出し・待ち
+    # ------------------------------------------------------------------
+    def _use_cache(self) -> bool:
+        return self.cache is not None and self.cache.connected
+
+    def read(self) -> tuple[Optional[int], int]:
+        """(state, error_code)。キャッシュが使えればそれを、無ければ RPC で読む"""
+        if self._use_cache():
+            return self.cache.state, self.cache.error_code
+        code, state = self.arm.get_state()
+        if code != 0:
+            return None, code
+        code, err_warn = self.arm.get_err_warn_code()
+        return state, (err_warn[0] if code == 0 else code)
+
+    def wait_until(self, predicate: Callable[[Optional[int], int], bool], timeout: float) -> bool:
+        """predicate(state, error_code) が真になるまで待つ"""
+        if self._use_cache():
+            return self.cache.wait_for(lambda: predicate(self.cache.state, self.cache.error_code), timeout)
+        t_end = self._clock() + timeout
+        while True:
+            if predicate(*self.read()):
+                return True
+            if self._clock() >= t_end:
+                return False
+            self._sleep(self.poll_s)
+
+    # ------------------------------------------------------------------
+    # アーム
+    # ------------------------------------------------------------------
+    def ensure_ready(self, mode: Optional[int] = None, force: bool = False) -> RecoveryResult:
+        """
+        エラーが無く動作指令を受け付ける状態なら何もしない。そうでなければ recover_arm する。
+        force=True のときは Ready でも set_state(0) を送り直す（グリッパーエラー後など）。
+        """
+        state, err = self.read()
+        if err == 0 and ControllerState.commandable(state) and not force:
+            return RecoveryResult(ok=True, action="ensure_ready", reason="already ready", state=state)
+        if err == 0 and force and state is not None:
+            t0 = self._clock()
+            self.arm.set_state(0)
+            if self.wait_until(lambda s, e: e == 0 and ControllerState.commandable(s), self.step_timeout_s):
+                return RecoveryResult(ok=True, action="ensure_ready", reason="state reset", attempts=1,
+                                      elapsed_s=self._clock() - t0, state=self.read()[0], steps=["set_state(0)"])
+        return self.recover_arm(mode=mode)
+
+    def recover_arm(self, mode: Optional[int] = None) -> RecoveryResult:
+        """エラー解除 → モーション有効化 →（モード変更時は STOP →）モード設定 → Ready 要求 を、遷移を確認しながら行う"""
+        t0 = self._clock()
+        if mode is None:
+            mode = getattr(self.arm, "mode", 0) or 0
+        steps: List[str] = []
+        attempts = 0
+        reason = ""
+        while attempts < self.max_attempts and self._clock() - t0 < self.timeout_s:
+            attempts += 1
+            state, err = self.read()
+            if err != 0:
+                self.arm.clean_error()
+                self.arm.clean_warn()
+                steps.append(f"clean_error({err})")
+                if not self.wait_until(lambda s, e: e == 0, self.step_timeout_s):
+                    reason = f"error {self.read()[1]} did not clear"
+                    continue
+            self.arm.motion_enable(enable=True)
+            steps.append("motion_enable")
+            if getattr(self.arm, "mode", mode) != mode or attempts > 1:
+                # 動作中（サーボモードの送信中など）にモードを変えないよう、先に STOP して停止を確認する
+                if self.read()[0] != ControllerState.STOPPED:
+                    self.arm.set_state(ControllerState.STOPPED)
+                    steps.append("set_state(4)")
+                    if not self.wait_until(lambda s, e: s == ControllerState.STOPPED, self.step_timeout_s):
+                        reason = f"state={self.read()[0]} did not stop before set_mode({mode})"
+                        continue
+                self.arm.set_mode(mode)
+                steps.append(f"set_mode({mode})")
+            self.arm.set_state(0)
+            steps.append("set_state(0)")
+            if self.wait_until(lambda s, e: e == 0 and ControllerState.commandable(s), self.step_timeout_s):
+                state, err = self.read()
+                return RecoveryResult(ok=True, action="arm", reason="ready", attempts=attempts,
+                                      elapsed_s=self._clock() - t0, state=state, error_code=err, steps=steps)
+            state, err = self.read()
+            reason = f"state={state} error={err} after set_state(0)"
+
+        state, err = self.read()
+        if not reason:
+            reason = "timed out"
+        return RecoveryResult(ok=False, action="arm", reason=reason, attempts=attempts,
+                              elapsed_s=self._clock() - t0, state=state, error_code=err, steps=steps)
+
+    # ------------------------------------------------------------------
+    # グリッパー
+    # ------------------------------------------------------------------
+    def recover_gripper(self, gripper_mode: int = 0) -> RecoveryResult:
+        t0 = self._clock()
+        steps: List[str] = []
+        attempts = 0
+        err = 0
+        while attempts < self.max_attempts and self._clock() - t0 < self.timeout_s:
+            attempts += 1
+            self.arm.clean_gripper_error()
+            self.arm.set_gripper_mode(gripper_mode)
+            self.arm.set_gripper_enable(True)
+            steps.append("clean_gripper_error/enable")
+            code, err = self.arm.get_gripper_err_code()
+            if code == 0 and err == 0:
+                return RecoveryResult(ok=True, action="gripper", reason="gripper ready", attempts=attempts,
+                                      elapsed_s=self._clock() - t0, steps=steps)
+        return RecoveryResult(ok=False, action="gripper", reason=f"gripper error {err} remains",
+                              attempts=attempts, elapsed_s=self._clock() - t0, error_code=err, steps=steps)
+
+    def move_gripper(self, pos: float, wait: bool = True, **kwargs) -> RecoveryResult:
+        """
+        set_gripper_position を実行し、失敗したらグリッパー（必要ならアームも）を復帰して再試行する。
+        """
+        t0 = self._clock()
+        steps: List[str] = []
+        code = 0
+        for attempt in range(1, self.max_attempts + 1):
+            code = self.arm.set_gripper_position(pos, wait=wait, **kwargs)
+            if code == 0:
+                return RecoveryResult(ok=True, action="gripper_move", reason=f"moved to {pos}",
+                                      attempts=attempt, elapsed_s=self._clock() - t0, steps=steps)
+            steps.append(f"set_gripper_position -> {code}")
+            if self._clock() - t0 >= self.timeout_s:
+                break
+            _, err = self.read()
+            if err != 0:
+                arm_result = self.recover_arm()
+                steps += arm_result.steps
+            grip_result = self.recover_gripper()
+            steps += grip_result.steps
+        return RecoveryResult(ok=False, action="gripper_move", reason=f"gripper command failed (code={code})",
+                              attempts=len([s for s in steps if s.startswith("set_gripper_position")]),
+                              elapsed_s=self._clock() - t0, error_code=code, steps=steps)
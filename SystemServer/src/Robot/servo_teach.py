@@ -0,0 +1,307 @@
+"""ティーチング用のデカルト・サーボループ（mode=1）。
+
+従来はティックごとに get_position -> get_inverse_kinematics -> set_servo_angle_j と
+3 回コントローラへ問い合わせていた。ここでは指令姿勢を手元で積算し、
+set_servo_cartesian だけを固定周期で送る（1 ティック 1 RPC）。
+
+  - 入力側は set_velocity(vx, vy, vz) [mm/s] で目標速度を渡すだけ。ループは max_acc で
+    速度をなめらかに追従させ、指令姿勢 += 速度 * dt を送る
+  - ワークスペース制限（WorkspaceLimits）は送る前に手元でクランプする
+  - 実測姿勢（RobotStateCache）との同期は resync_s ごと。停止中に resync_tol_mm 以上、
+    または移動中に max_lag_mm 以上ずれていたら指令姿勢を実測に合わせる
+  - move_to(pose) で指定位置まで直線で移動させられる（検証スイープなど）。
+    速度入力（0 以外の set_velocity）や halt() で打ち切る
+  - ループ周期のばらつき（ジッタ）を記録し、stats() で返す
+
+  loop = ServoTeachLoop(arm, state_cache=cache, rate_hz=100)
+  loop.start()                      # 別スレッドで回す（step() を自前で呼んでもよい）
+  loop.set_velocity(-133, 0, 0)     # キー入力など
+  loop.stop(); print(loop.stats())
+
+アームは事前に set_mode(1) / set_state(0) しておくこと。
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+STATE_MOVING = 1
+
+
+@dataclass
+class WorkspaceLimits:
+    """TCP 位置の許容範囲 [mm]。None の辺は制限しない"""
+    x_min: Optional[float] = 200.0
+    x_max: Optional[float] = None
+    y_min: Optional[float] = -310.0
+    y_max: Optional[float] = None
+    z_min: Optional[float] = 80.0
+    z_max: Optional[float] = None
+
+    def clamp(self, pose: List[float]) -> bool:
+        """pose の xyz をその場でクランプする。クランプしたら True"""
+        limited = False
+        for k, (lo, hi) in enumerate(((self.x_min, self.x_max), (self.y_min, self.y_max), (self.z_min, self.z_max))):
+            if lo is not None and pose[k] < lo:
+                pose[k], limited = lo, True
+            if hi is not None and pose[k] > hi:
+                pose[k], limited = hi, True
+        return limited
+
+
+class ServoTeachLoop:
+    def __init__(
+        self,
+        arm: Any,
+        state_cache: Any = None,
+        rate_hz: float = 100.0,
+        max_speed: float = 200.0,
+        max_acc: float = 1000.0,
+        limits: Optional[WorkspaceLimits] = None,
+        resync_s: float = 1.0,
+        resync_tol_mm: float = 2.0,
+        max_lag_mm: float = 30.0,
+        jitter_window: int = 2000,
+    ):
+        self.arm = arm
+        self.cache = state_cache
+        self.dt = 1.0 / rate_hz
+        self.max_speed = max_speed
+        self.max_acc = max_acc
+        self.limits = limits or WorkspaceLimits()
+        self.resync_s = resync_s
+        self.resync_tol_mm = resync_tol_mm
+        self.max_lag_mm = max_lag_mm
+        # シミュレータでは仮想時計で回す
+        self._clock: Callable[[], float] = getattr(arm, "sim_clock", None) or time.perf_counter
+        self._sleep: Callable[[float], None] = getattr(arm, "sim_sleep", None) or time.sleep
+
+        self._lock = threading.Lock()
+        self.commanded: Optional[List[float]] = None
+        self._target_v = [0.0, 0.0, 0.0]
+        self._v = [0.0, 0.0, 0.0]
+        self._goal: Optional[List[float]] = None
+        self._goal_speed = max_speed
+        self.limited = False
+        self.last_code = 0
+
+        self._last_resync = 0.0
+        self._last_tick: Optional[float] = None
+        self._periods = array("d", bytes(8 * jitter_window))
+        self._n_periods = 0
+        self.ticks = 0
+        self.sent = 0
+        self.resyncs = 0
+        self.overruns = 0
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 入力
+    # ------------------------------------------------------------------
+    def set_velocity(self, vx: float, vy: float, vz: float) -> None:
+        """目標速度 [mm/s]。max_speed を超える分は縮める"""
+        norm = math.sqrt(vx * vx + vy * vy + vz * vz)
+        if norm > self.max_speed:
+            s = self.max_speed / norm
+            vx, vy, vz = vx * s, vy * s, vz * s
+        with self._lock:
+            if norm > 0.0:
+                self._goal = None   # 操作者の入力を優先する
+            if self._goal is None:
+                self._target_v = [vx, vy, vz]
+
+    def halt(self) -> None:
+        """すぐに止める（減速なし）"""
+        with self._lock:
+            self._target_v = [0.0, 0.0, 0.0]
+            self._v = [0.0, 0.0, 0.0]
+            self._goal = None
+
+    def move_to(self, pose: List[float], speed: Optional[float] = None) -> None:
+        """指令姿勢の xyz を pose の xyz まで直線で動かし、着いたら止める（姿勢角は変えない）"""
+        goal = [float(v) for v in pose[:3]]
+        self.limits.clamp(goal)   # 制限の外なら届かないので、先に寄せておく
+        with self._lock:
+            self._goal = goal
+            self._goal_speed = min(speed or self.max_speed, self.max_speed)
+
+    @property
+    def arrived(self) -> bool:
+        """move_to の目標に着いた（または打ち切られた）"""
+        return self._goal is None
+
+    @property
+    def moving(self) -> bool:
+        return any(self._v) or any(self._target_v) or self._goal is not None
+
+    # ------------------------------------------------------------------
+    # 実測との同期
+    # ------------------------------------------------------------------
+    def measured_pose(self) -> Optional[List[float]]:
+        if self.cache is not None:
+            pose = self.cache.get_pose(max_age=max(2 * self.dt, 0.05))
+            if pose is not None:
+                return pose
+        code, pose = self.arm.get_position()
+        return list(pose) if code == 0 else None
+
+    def resync(self, stop: bool = True) -> bool:
+        """指令姿勢を実測姿勢に合わせる。stop=True なら目標速度も 0 にする"""
+        pose = self.measured_pose()
+        if pose is None:
+            return False
+        with self._lock:
+            self.commanded = list(pose[:6])
+            self._v = [0.0, 0.0, 0.0]
+            if stop:
+                self._target_v = [0.0, 0.0, 0.0]
+                self._goal = None
+        self._last_resync = self._clock()
+        self.resyncs += 1
+        return True
+
+    def _check_sync(self, now: float) -> None:
+        if now - self._last_resync < self.resync_s:
+            return
+        self._last_resync = now
+        pose = self.measured_pose()
+        if pose is None or self.commanded is None:
+            return
+        err = math.dist(pose[:3], self.commanded[:3])
+        if err > (self.max_lag_mm if self.moving else self.resync_tol_mm):
+            print(f"[Servo] resync: commanded pose is {err:.1f} mm off the measured pose")
+            self.resync()
+
+    # ------------------------------------------------------------------
+    # ループ
+    # ------------------------------------------------------------------
+    def step(self) -> int:
+        """1 ティック分: 速度を更新し、姿勢が変わっていれば set_servo_cartesian を送る"""
+        now = self._clock()
+        if self._last_tick is not None:
+            self._record_period(now - self._last_tick)
+        self._last_tick = now
+        self.ticks += 1
+
+        if self.cache is not None and self.cache.has_error:
+            # エラー中は指令を積算しない（復帰後に実測から再開する）
+            self.halt()
+            self.commanded = None
+            return 0
+        if self.commanded is None and not self.resync(stop=False):
+            return 0
+        self._check_sync(now)
+
+        with self._lock:
+            changed = self._steer_to_goal()
+            if not changed:
+                dv = self.max_acc * self.dt
+                for k in range(3):
+                    self._v[k] += max(-dv, min(dv, self._target_v[k] - self._v[k]))
+                    if self._v[k]:
+                        self.commanded[k] += self._v[k] * self.dt
+                        changed = True
+            if not changed:
+                return 0
+            before = self.commanded[:3]
+            self.limited = self.limits.clamp(self.commanded)
+            if self.limited:
+                # 制限に当たった軸は速度も捨てる（押し続けても張り付くだけ）
+                for k in range(3):
+                    if self.commanded[k] != before[k]:
+                        self._v[k] = 0.0
+            pose = list(self.commanded)
+
+        code = self.arm.set_servo_cartesian(pose, is_radian=False)
+        self.last_code = code
+        self.sent += 1
+        if code != 0:
+            print(f"[Servo] set_servo_cartesian failed (code: {code}); resync")
+            self.commanded = None
+        return code
+
+    def _steer_to_goal(self) -> bool:
+        """
+        move_to の目標へ向かう目標速度を決める（_lock 内で呼ぶ）。
+        このティックで届くなら指令姿勢を目標に合わせて True を返す
+        """
+        if self._goal is None:
+            return False
+        d = [g - c for g, c in zip(self._goal, self.commanded)]
+        dist = math.sqrt(sum(x * x for x in d))
+        # 残り距離を max_acc で止まれる速度に抑える
+        speed = min(self._goal_speed, math.sqrt(2.0 * self.max_acc * dist))
+        if dist <= max(speed * self.dt, 1e-3):
+            self.commanded[:3] = self._goal
+            self._v = [0.0, 0.0, 0.0]
+            self._target_v = [0.0, 0.0, 0.0]
+            self._goal = None
+            return True
+        self._target_v = [x / dist * speed for x in d]
+        return False
+
+    def run(self) -> None:
+        """stop() まで rate_hz で step() を回す（締め切り基準でドリフトさせない）"""
+        next_t = self._clock()
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                print(f"[Servo] tick failed: {e!r}")
+                self.commanded = None
+            next_t += self.dt
+            delay = next_t - self._clock()
+            if delay > 0:
+                self._sleep(delay)
+            else:
+                self.overruns += 1
+                if delay < -self.dt:
+                    next_t = self._clock()   # 大きく遅れたら追いつこうとしない
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._last_tick = None
+        self._thread = threading.Thread(target=self.run, name="xarm-servo", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self.halt()
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------------
+    def _record_period(self, period: float) -> None:
+        self._periods[self._n_periods % len(self._periods)] = period
+        self._n_periods += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """直近 jitter_window ティックの周期 [ms] と、送信・同期の回数"""
+        n = min(self._n_periods, len(self._periods))
+        periods = sorted(self._periods[:n])
+        out: Dict[str, Any] = {
+            "ticks": self.ticks,
+            "sent": self.sent,
+            "resyncs": self.resyncs,
+            "overruns": self.overruns,
+            "target_ms": round(1000 * self.dt, 3),
+        }
+        if periods:
+            mean = sum(periods) / n
+            out.update({
+                "mean_ms": round(1000 * mean, 3),
+                "jitter_ms": round(1000 * math.sqrt(sum((p - mean) ** 2 for p in periods) / n), 3),
+                "p99_ms": round(1000 * periods[min(n - 1, int(0.99 * n))], 3),
+                "max_ms": round(1000 * periods[-1], 3),
+            })
+        return out
@@ -0,0 +1,744 @@
+"""xArm 実機なしで動作・サイクルタイムを検証するための XArmAPI 代替（シミュレータ）。
+
+XArmOperator や XArm/ 以下のスクリプトが使う XArmAPI のメソッドを同じシグネチャ・
+同じ戻り値形式 (code, value) で実装し、動作時間は motion_model の台形プロファイル
+から計算する。時間は仮想時計で進むので、既定では実時間を待たずに一瞬で終わる
+（realtime=True にすると time_scale 倍の実時間で sleep する）。
+
+仮想時計:
+  - 動作コマンド（wait=False）はキューに積まれ、終了時刻だけが決まる
+  - wait=True / sim_sleep() / 各 RPC の往復遅延 (rpc_latency) で時計が進む
+  - 時計が進む間、report_hz ごとに位置レポートのコールバックを発火する
+
+フォルト注入:
+  - inject_error(code)            : 即座にコントローラエラー（state=4, 動作停止）
+  - schedule_error(delay_s, code) : 仮想時間 delay_s 後にエラー
+  - fail_next(method, code, n)    : 次の n 回の method 呼び出しを code で失敗させる
+  - inject_gripper_error(code)    : グリッパーエラー
+  - inject_disconnect()           : 接続断
+
+把持対象物:
+  - 既定ではどこでグリッパーを閉じても物体があるものとして扱う（default_object_width で止まる）
+  - place_object() / clear_objects() を呼ぶと、登録した物体の真上で閉じたときだけ掴める
+    （空振りの検証用）。掴んだ物体はグリッパーを開くとその場に置かれる
+  - get_gripper_current() は把持中に大きくなる模擬電流を返す（実機 SDK には無い拡張）
+
+関節角は実機の運動学ではなく、位置↔関節が 1 対 1 に対応する疑似 IK で計算する
+（J1 = 方位角、J2 = 水平到達距離、J3 = 高さ、J4-J6 = 姿勢）。関節移動の時間比較の
+目安にはなるが、実機の関節値とは一致しない。
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from Robot.motion_model import (
+    DEFAULT_GRIPPER_SPEED,
+    DEFAULT_JOINT_ACC,
+    DEFAULT_JOINT_SPEED,
+    DEFAULT_TCP_ACC,
+    DEFAULT_TCP_SPEED,
+    angle_diff,
+    blend_overlap,
+    gripper_move_time,
+    joint_distance,
+    linear_distance,
+    trapezoid_fraction,
+    trapezoid_time,
+)
+
+# SDK の戻り値コード（xarm.core.config.x_config.APIState / コントローラ応答）
+CODE_OK = 0
+CODE_HAS_ERROR = 1          # 未解除のエラーがある
+CODE_NOT_READY = 9          # state が動作可能でない
+CODE_NOT_CONNECTED = -1
+
+# コントローラ state
+STATE_MOVING = 1
+STATE_READY = 2             # 動作可能・停止中
+STATE_PAUSED = 3
+STATE_STOPPED = 4
+
+INITIAL_POSE = [206.0, 0.0, 272.9, -179.96, 0.0, 0.38]
+
+
+def sim_inverse_kinematics(pose: List[float]) -> List[float]:
+    x, y, z, roll, pitch, yaw = pose[:6]
+    j1 = math.degrees(math.atan2(y, x))
+    reach = math.hypot(x, y)
+    return [j1, (reach - 300.0) / 5.0, (z - 250.0) / 5.0, roll, pitch, yaw - j1, 0.0]
+
+
+def sim_forward_kinematics(joints: List[float]) -> List[float]:
+    j1, j2, j3, j4, j5, j6 = joints[:6]
+    reach = j2 * 5.0 + 300.0
+    a = math.radians(j1)
+    return [reach * math.cos(a), reach * math.sin(a), j3 * 5.0 + 250.0, j4, j5, j6 + j1]
+
+
+@dataclass
+class _Segment:
+    kind: str               # "linear" / "joint"
+    t0: float
+    t1: float
+    p0: List[float]
+    p1: List[float]
+    j0: List[float]
+    j1: List[float]
+    dist: float
+    speed: float
+    acc: float
+    radius: Optional[float]
+
+    def at(self, t: float) -> tuple[List[float], List[float]]:
+        s = trapezoid_fraction(t - self.t0, self.dist, self.speed, self.acc)
+        if self.kind == "joint":
+            joints = [a + (b - a) * s for a, b in zip(self.j0, self.j1)]
+            return sim_forward_kinematics(joints), joints
+        pose = [a + (b - a) * s for a, b in zip(self.p0[:3], self.p1[:3])]
+        pose += [a + angle_diff(a, b) * s for a, b in zip(self.p0[3:6], self.p1[3:6])]
+        return pose, sim_inverse_kinematics(pose)
+
+
+class SimXArmAPI:
+    """XArmAPI 互換のシミュレータ"""
+
+    def __init__(
+        self,
+        port: str = "sim",
+        *,
+        realtime: bool = False,
+        time_scale: float = 1.0,
+        rpc_latency: float = 0.002,
+        report_hz: float = 100.0,
+        initial_pose: Optional[List[float]] = None,
+        **kwargs,
+    ):
+        self.port = port
+        self.realtime = realtime
+        self.time_scale = time_scale
+        self.rpc_latency = rpc_latency
+        self.report_dt = 1.0 / report_hz if report_hz > 0 else 0.0
+
+        self._lock = threading.RLock()
+        self._t = 0.0
+        self._next_report = 0.0
+        self._connected = False
+
+        self._mode = 0
+        self._state = STATE_STOPPED
+        self._enabled = False
+        self._error_code = 0
+        self._warn_code = 0
+
+        self._pose = list(initial_pose or INITIAL_POSE)
+        self._joints = sim_inverse_kinematics(self._pose)
+        self._segments: List[_Segment] = []
+
+        self._tcp_speed = DEFAULT_TCP_SPEED
+        self._tcp_acc = DEFAULT_TCP_ACC
+        self._joint_speed = DEFAULT_JOINT_SPEED
+        self._joint_acc = DEFAULT_JOINT_ACC
+
+        self._grip_enabled = False
+        self._grip_mode = 0
+        self._grip_speed = DEFAULT_GRIPPER_SPEED
+        self._grip_err = 0
+        self._grip_from = 850.0
+        self._grip_to = 850.0
+        self._grip_t0 = 0.0
+        self._grip_t1 = 0.0
+
+        # 把持対象物（None: どこでも物体あり / list: 登録した物体だけ）
+        self._objects: Optional[List[Dict[str, float]]] = None
+        self._held: Optional[Dict[str, float]] = None
+        self.default_object_width = 500.0   # 物体を掴んだときに止まるグリッパー位置
+        self.grasp_radius = 15.0            # 物体中心からの許容ずれ (mm)
+        self.grasp_height = 20.0            # 物体の把持高さからの許容 (mm)
+
+        self._failures: Dict[str, List[int]] = {}
+        self._scheduled_errors: List[tuple[float, int]] = []
+
+        self._report_callbacks: List[Callable[[dict], Any]] = []
+        self._state_callbacks: List[Callable[[dict], Any]] = []
+        self._error_callbacks: List[Callable[[dict], Any]] = []
+        self._connect_callbacks: List[Callable[[dict], Any]] = []
+
+        # 呼び出し回数（RPC 削減の効果確認用）
+        self.call_counts: Dict[str, int] = {}
+
+    # ==================================================================
+    # 仮想時計
+    # ==================================================================
+    def sim_clock(self) -> float:
+        return self._t
+
+    def sim_sleep(self, seconds: float) -> None:
+        with self._lock:
+            self._advance(self._t + max(seconds, 0.0))
+
+    def _advance(self, t_target: float) -> None:
+        start = self._t
+        if self.report_dt > 0.0:
+            while self._next_report <= t_target:
+                self._t = max(self._t, self._next_report)
+                self._update()
+                self._emit_report()
+                self._next_report += self.report_dt
+        self._t = max(self._t, t_target)
+        self._update()
+        if self.realtime and self._t > start:
+            time.sleep((self._t - start) * self.time_scale)
+
+    def _rpc(self, name: str) -> Optional[int]:
+        """全 API 共通の前処理。往復遅延を進め、注入された失敗があればそのコードを返す"""
+        self.call_counts[name] = self.call_counts.get(name, 0) + 1
+        self._advance(self._t + self.rpc_latency)
+        pending = self._failures.get(name)
+        if pending:
+            return pending.pop(0)
+        if not self._connected and name not in ("connect",):
+            return CODE_NOT_CONNECTED
+        return None
+
+    def _update(self) -> None:
+        for t_err, code in list(self._scheduled_errors):
+            if t_err <= self._t:
+                self._scheduled_errors.remove((t_err, code))
+                self._raise_error(code)
+        while self._segments and self._segments[0].t1 <= self._t:
+            seg = self._segments.pop(0)
+            self._pose, self._joints = list(seg.p1), list(seg.j1)
+        if self._segments and self._segments[0].t0 <= self._t:
+            self._pose, self._joints = self._segments[0].at(self._t)
+            self._set_state(STATE_MOVING)
+        elif self._state == STATE_MOVING:
+            self._set_state(STATE_READY)
+
+    def _set_state(self, state: int) -> None:
+        if state != self._state:
+            self._state = state
+            for cb in list(self._state_callbacks):
+                cb({"state": state})
+
+    def _emit_report(self) -> None:
+        if not self._connected:
+            return
+        for cb in list(self._report_callbacks):
+            cb({"cartesian": list(self._pose), "joints": list(self._joints)})
+
+    def _emit_error(self) -> None:
+        for cb in list(self._error_callbacks):
+            cb({"error_code": self._error_code, "warn_code": self._warn_code})
+
+    def _stop_motion(self) -> None:
+        """キュー済みの動作を破棄し、現在位置で止める"""
+        if self._segments and self._segments[0].t0 <= self._t:
+            self._pose, self._joints = self._segments[0].at(self._t)
+        self._segments.clear()
+
+    def _raise_error(self, code: int) -> None:
+        self._stop_motion()
+        self._error_code = code
+        self._set_state(STATE_STOPPED)
+        self._emit_error()
+
+    # ==================================================================
+    # フォルト注入（シミュレータ専用）
+    # ==================================================================
+    def inject_error(self, code: int = 22) -> None:
+        with self._lock:
+            self._raise_error(code)
+
+    def schedule_error(self, delay_s: float, code: int = 22) -> None:
+        with self._lock:
+            self._scheduled_errors.append((self._t + delay_s, code))
+
+    def fail_next(self, method: str, code: int = 1, times: int = 1) -> None:
+        with self._lock:
+            self._failures.setdefault(method, []).extend([code] * times)
+
+    def inject_gripper_error(self, code: int = 22) -> None:
+        with self._lock:
+            self._grip_err = code
+
+    def inject_disconnect(self) -> None:
+        with self._lock:
+            self._set_connected(False)
+
+    def place_object(self, x: float, y: float, z: float = 180.0, width: Optional[float] = None) -> None:
+        """(x, y) に物体を置く。z は掴めるときの TCP 高さ、width は掴んだときのグリッパー位置"""
+        with self._lock:
+            if self._objects is None:
+                self._objects = []
+            self._objects.append({"x": x, "y": y, "z": z,
+                                  "width": self.default_object_width if width is None else width})
+
+    def clear_objects(self) -> None:
+        """物体を全て取り除く（以後は place_object した物体だけが掴める）"""
+        with self._lock:
+            self._objects = []
+
+    @property
+    def held_object(self) -> Optional[Dict[str, float]]:
+        return self._held
+
+    def _object_at_tcp(self) -> Optional[Dict[str, float]]:
+        x, y, z = self._pose[:3]
+        if self._objects is None:
+            return {"x": x, "y": y, "z": z, "width": self.default_object_width}
+        for obj in self._objects:
+            if math.hypot(obj["x"] - x, obj["y"] - y) <= self.grasp_radius and z <= obj["z"] + self.grasp_height:
+                return obj
+        return None
+
+    # ==================================================================
+    # 接続・状態
+    # ==================================================================
+    def _set_connected(self, connected: bool) -> None:
+        if connected == self._connected:
+            return
+        self._connected = connected
+        if not connected:
+            self._stop_motion()
+        for cb in list(self._connect_callbacks):
+            cb({"connected": connected, "reported": connected})
+
+    def connect(self, port: Optional[str] = None, **kwargs) -> None:
+        with self._lock:
+            if self._rpc("connect") is not None:
+                return  # XArmAPI と同様、失敗しても例外は出さず未接続のまま
+            self._set_connected(True)
+
+    def disconnect(self) -> None:
+        with self._lock:
+            self._set_connected(False)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    @property
+    def state(self) -> int:
+        return self._state
+
+    @property
+    def mode(self) -> int:
+        return self._mode
+
+    @property
+    def error_code(self) -> int:
+        return self._error_code
+
+    @property
+    def warn_code(self) -> int:
+        return self._warn_code
+
+    @property
+    def has_error(self) -> bool:
+        return self._error_code != 0
+
+    @property
+    def position(self) -> List[float]:
+        return list(self._pose)
+
+    @property
+    def angles(self) -> List[float]:
+        return list(self._joints)
+
+    def get_state(self):
+        with self._lock:
+            code = self._rpc("get_state")
+            if code is not None:
+                return code, None
+            return CODE_OK, self._state
+
+    def set_state(self, state: int = 0):
+        with self._lock:
+            code = self._rpc("set_state")
+            if code is not None:
+                return code
+            if state == 0:
+                if self._error_code == 0 and self._enabled:
+                    self._set_state(STATE_MOVING if self._segments else STATE_READY)
+            elif state == STATE_STOPPED:
+                self._stop_motion()
+                self._set_state(STATE_STOPPED)
+            elif state == STATE_PAUSED:
+                self._set_state(STATE_PAUSED)
+            return CODE_OK
+
+    def set_mode(self, mode: int = 0, **kwargs):
+        with self._lock:
+            code = self._rpc("set_mode")
+            if code is not None:
+                return code
+            self._mode = mode
+            # 実機同様、モード変更後は set_state(0) が必要
+            self._stop_motion()
+            self._set_state(STATE_STOPPED)
+            return CODE_OK
+
+    def motion_enable(self, enable: bool = True, servo_id: Optional[int] = None):
+        with self._lock:
+            code = self._rpc("motion_enable")
+            if code is not None:
+                return code
+            self._enabled = bool(enable)
+            if not enable:
+                self._stop_motion()
+                self._set_state(STATE_STOPPED)
+            return CODE_OK
+
+    def clean_error(self):
+        with self._lock:
+            code = self._rpc("clean_error")
+            if code is not None:
+                return code
+            if self._error_code:
+                self._error_code = 0
+                self._emit_error()
+            return CODE_OK
+
+    def clean_warn(self):
+        with self._lock:
+            code = self._rpc("clean_warn")
+            if code is not None:
+                return code
+            if self._warn_code:
+                self._warn_code = 0
+                self._emit_error()
+            return CODE_OK
+
+    def get_err_warn_code(self, show: bool = False, lang: str = "en"):
+        with self._lock:
+            code = self._rpc("get_err_warn_code")
+            if code is not None:
+                return code, [0, 0]
+            return CODE_OK, [self._error_code, self._warn_code]
+
+    def get_is_moving(self) -> bool:
+        with self._lock:
+            self._rpc("get_is_moving")
+            return self._state == STATE_MOVING
+
+    # ==================================================================
+    # 位置・関節
+    # ==================================================================
+    def get_position(self, is_radian: Optional[bool] = None):
+        with self._lock:
+            code = self._rpc("get_position")
+            if code is not None:
+                return code, list(self._pose)
+            return CODE_OK, list(self._pose)
+
+    def get_servo_angle(self, servo_id: Optional[int] = None, is_radian: Optional[bool] = None):
+        with self._lock:
+            code = self._rpc("get_servo_angle")
+            if code is not None:
+                return code, list(self._joints)
+            if servo_id is not None and 1 <= servo_id <= 7:
+                return CODE_OK, self._joints[servo_id - 1]
+            return CODE_OK, list(self._joints)
+
+    def get_inverse_kinematics(self, pose, input_is_radian: Optional[bool] = None, return_is_radian: Optional[bool] = None):
+        with self._lock:
+            code = self._rpc("get_inverse_kinematics")
+            if code is not None:
+                return code, []
+            return CODE_OK, sim_inverse_kinematics(list(pose))
+
+    def get_forward_kinematics(self, angles, input_is_radian: Optional[bool] = None, return_is_radian: Optional[bool] = None):
+        with self._lock:
+            code = self._rpc("get_forward_kinematics")
+            if code is not None:
+                return code, []
+            return CODE_OK, sim_forward_kinematics(list(angles))
+
+    # ==================================================================
+    # 動作
+    # ==================================================================
+    def _motion_code(self, mode: int) -> Optional[int]:
+        if self._error_code:
+            return CODE_HAS_ERROR
+        if self._state not in (STATE_READY, STATE_MOVING) or self._mode != mode:
+            return CODE_NOT_READY
+        return None
+
+    def _queue_end(self) -> tuple[List[float], List[float]]:
+        if self._segments:
+            return list(self._segments[-1].p1), list(self._segments[-1].j1)
+        return list(self._pose), list(self._joints)
+
+    def _enqueue(self, seg_kind: str, p1: List[float], j1: List[float], dist: float,
+                 speed: float, acc: float, radius: Optional[float]) -> None:
+        p0, j0 = self._queue_end()
+        dur = trapezoid_time(dist, speed, acc)
+        start = self._t
+        if self._segments:
+            prev = self._segments[-1]
+            start = max(self._t, prev.t1)
+            # 前の区間が radius 付きで、まだ終わっていなければコーナーブレンドで重ねる
+            if prev.radius is not None and prev.radius > 0 and prev.t1 > self._t:
+                start = max(self._t, prev.t1 - blend_overlap(speed, acc, prev.t1 - prev.t0, dur))
+        self._segments.append(_Segment(seg_kind, start, start + dur, p0, list(p1), j0, list(j1),
+                                       dist, speed, acc, radius))
+        self._update()
+
+    def _wait_motion(self, timeout: Optional[float] = None) -> None:
+        if self._segments:
+            end = self._segments[-1].t1
+            if timeout is not None:
+                end = min(end, self._t + timeout)
+            self._advance(end)
+
+    def set_position(self, x=None, y=None, z=None, roll=None, pitch=None, yaw=None, radius=None,
+                     speed=None, mvacc=None, mvtime=None, relative=False, is_radian=None,
+                     wait=False, timeout=None, **kwargs):
+        with self._lock:
+            code = self._rpc("set_position")
+            if code is not None:
+                return code
+            code = self._motion_code(0)
+            if code is not None:
+                return code
+            if speed is not None:
+                self._tcp_speed = float(speed)
+            if mvacc is not None:
+                self._tcp_acc = float(mvacc)
+            p0, _ = self._queue_end()
+            target = [x, y, z, roll, pitch, yaw]
+            if relative:
+                p1 = [a + (b or 0.0) for a, b in zip(p0, target)]
+            else:
+                p1 = [a if b is None else float(b) for a, b in zip(p0, target)]
+            self._enqueue("linear", p1, sim_inverse_kinematics(p1), linear_distance(p0, p1),
+                          self._tcp_speed, self._tcp_acc, radius)
+            if wait:
+                self._wait_motion(timeout)
+                if self._error_code:
+                    return CODE_HAS_ERROR
+            return CODE_OK
+
+    def set_servo_angle(self, servo_id=None, angle=None, speed=None, mvacc=None, mvtime=None,
+                        relative=False, is_radian=None, wait=False, timeout=None, radius=None, **kwargs):
+        with self._lock:
+            code = self._rpc("set_servo_angle")
+            if code is not None:
+                return code
+            code = self._motion_code(0)
+            if code is not None:
+                return code
+            if speed is not None:
+                self._joint_speed = float(speed)
+            if mvacc is not None:
+                self._joint_acc = float(mvacc)
+            _, j0 = self._queue_end()
+            j1 = list(j0)
+            if servo_id is not None and not isinstance(angle, (list, tuple)):
+                j1[servo_id - 1] = (j0[servo_id - 1] if relative else 0.0) + float(angle)
+            else:
+                for i, a in enumerate(list(angle or [])[:7]):
+                    j1[i] = (j0[i] if relative else 0.0) + float(a)
+            self._enqueue("joint", sim_forward_kinematics(j1), j1, joint_distance(j0, j1),
+                          self._joint_speed, self._joint_acc, radius)
+            if wait:
+                self._wait_motion(timeout)
+                if self._error_code:
+                    return CODE_HAS_ERROR
+            return CODE_OK
+
+    def move_gohome(self, speed=None, mvacc=None, mvtime=None, is_radian=None, wait=False, timeout=None, **kwargs):
+        return self.set_servo_angle(angle=[0.0] * 7, speed=speed, mvacc=mvacc, wait=wait, timeout=timeout)
+
+    def set_servo_angle_j(self, angles, speed=None, mvacc=None, mvtime=None, is_radian=None, **kwargs):
+        """サーボモード (mode=1) の即時関節指令"""
+        with self._lock:
+            code = self._rpc("set_servo_angle_j")
+            if code is not None:
+                return code
+            code = self._motion_code(1)
+            if code is not None:
+                return code
+            joints = list(self._joints)
+            for i, a in enumerate(list(angles)[:7]):
+                joints[i] = float(a)
+            self._joints = joints
+            self._pose = sim_forward_kinematics(joints)
+            return CODE_OK
+
+    def set_servo_cartesian(self, mvpose, speed=None, mvacc=None, mvtime=0, is_radian=None, is_tool_coord=False, **kwargs):
+        """サーボモード (mode=1) の即時デカルト指令"""
+        with self._lock:
+            code = self._rpc("set_servo_cartesian")
+            if code is not None:
+                return code
+            code = self._motion_code(1)
+            if code is not None:
+                return code
+            self._pose = [float(v) for v in list(mvpose)[:6]]
+            self._joints = sim_inverse_kinematics(self._pose)
+            return CODE_OK
+
+    # ==================================================================
+    # グリッパー
+    # ==================================================================
+    def _gripper_pos(self) -> float:
+        if self._t >= self._grip_t1 or self._grip_t1 <= self._grip_t0:
+            return self._grip_to
+        s = (self._t - self._grip_t0) / (self._grip_t1 - self._grip_t0)
+        return self._grip_from + (self._grip_to - self._grip_from) * s
+
+    def set_gripper_enable(self, enable: bool = True, **kwargs):
+        with self._lock:
+            code = self._rpc("set_gripper_enable")
+            if code is not None:
+                return code
+            self._grip_enabled = bool(enable)
+            return CODE_OK
+
+    def set_gripper_mode(self, mode: int = 0, **kwargs):
+        with self._lock:
+            code = self._rpc("set_gripper_mode")
+            if code is not None:
+                return code
+            self._grip_mode = mode
+            return CODE_OK
+
+    def set_gripper_speed(self, speed, **kwargs):
+        with self._lock:
+            code = self._rpc("set_gripper_speed")
+            if code is not None:
+                return code
+            self._grip_speed = float(speed)
+            return CODE_OK
+
+    def clean_gripper_error(self, **kwargs):
+        with self._lock:
+            code = self._rpc("clean_gripper_error")
+            if code is not None:
+                return code
+            self._grip_err = 0
+            return CODE_OK
+
+    def get_gripper_err_code(self, **kwargs):
+        with self._lock:
+            code = self._rpc("get_gripper_err_code")
+            if code is not None:
+                return code, 0
+            return CODE_OK, self._grip_err
+
+    def get_gripper_position(self, **kwargs):
+        with self._lock:
+            code = self._rpc("get_gripper_position")
+            if code is not None:
+                return code, None
+            return CODE_OK, self._gripper_pos()
+
+    def get_gripper_current(self, **kwargs):
+        """模擬グリッパー電流 [A]。物体を掴んで止まっている間は大きい"""
+        with self._lock:
+            code = self._rpc("get_gripper_current")
+            if code is not None:
+                return code, None
+            if self._t < self._grip_t1:
+                return CODE_OK, 0.2
+            return CODE_OK, 0.45 if self._held is not None else 0.05
+
+    def set_gripper_position(self, pos, wait=False, speed=None, auto_enable=False, timeout=None, **kwargs):
+        with self._lock:
+            code = self._rpc("set_gripper_position")
+            if code is not None:
+                return code
+            if auto_enable:
+                self._grip_enabled = True
+            if self._grip_err:
+                return self._grip_err
+            if not self._grip_enabled:
+                return CODE_NOT_READY
+            if speed is not None:
+                self._grip_speed = float(speed)
+            current = self._gripper_pos()
+            target = float(pos)
+            if target < current:
+                # 閉じる: 指の間に物体があればその幅で止まる
+                if self._held is None:
+                    self._held = self._object_at_tcp()
+                    if self._held is not None and self._objects is not None:
+                        self._objects.remove(self._held)
+                if self._held is not None:
+                    target = max(target, self._held["width"])
+            elif self._held is not None and target > self._held["width"]:
+                # 開く: 把持中の物体をその場に置く
+                obj, self._held = self._held, None
+                if self._objects is not None:
+                    self._objects.append({**obj, "x": self._pose[0], "y": self._pose[1]})
+            self._grip_from, self._grip_to = current, target
+            self._grip_t0 = self._t
+            self._grip_t1 = self._t + gripper_move_time(current, target, self._grip_speed)
+            if wait:
+                end = self._grip_t1 if timeout is None else min(self._grip_t1, self._t + timeout)
+                self._advance(end)
+            return CODE_OK
+
+    # ==================================================================
+    # レポートコールバック（XArmAPI と同名）
+    # ==================================================================
+    def register_report_location_callback(self, callback=None, report_cartesian=True, report_joints=True):
+        self._report_callbacks.append(callback)
+        return True
+
+    def release_report_location_callback(self, callback=None):
+        self._release(self._report_callbacks, callback)
+        return True
+
+    def register_state_changed_callback(self, callback=None):
+        self._state_callbacks.append(callback)
+        return True
+
+    def release_state_changed_callback(self, callback=None):
+        self._release(self._state_callbacks, callback)
+        return True
+
+    def register_error_warn_changed_callback(self, callback=None):
+        self._error_callbacks.append(callback)
+        return True
+
+    def release_error_warn_changed_callback(self, callback=None):
+        self._release(self._error_callbacks, callback)
+        return True
+
+    def register_connect_changed_callback(self, callback=None):
+        self._connect_callbacks.append(callback)
+        return True
+
+    def release_connect_changed_callback(self, callback=None):
+        self._release(self._connect_callbacks, callback)
+        return True
+
+    @staticmethod
+    def _release(callbacks: List[Callable], callback) -> None:
+        if callback is None:
+            callbacks.clear()
+        elif callback in callbacks:
+            callbacks.remove(callback)
+
+
+def is_sim_address(ip: str) -> bool:
+    return str(ip).strip().lower() in ("sim", "simulator") or str(ip).startswith("sim://")
+
+
+def create_arm(ip: str, **sim_options):
+    """ip が "sim" ならシミュレータ、それ以外は実機の XArmAPI を返す"""
+    if is_sim_address(ip):
+        return SimXArmAPI(ip, **sim_options)
+    from xarm.wrapper import XArmAPI
+    # レポート周期（RobotStateCache の鮮度）は report_type で決まる。"real" で約 100Hz
+    report_type = os.getenv("XARM_REPORT_TYPE")
+    if report_type:
+        return XArmAPI(ip, report_type=report_type)
+    return XArmAPI(ip)
@@ -0,0 +1,256 @@
+"""xArm のレポートストリームを購読して最新状態をメモリに保持するキャッシュ。
+
+get_position() / get_err_warn_code() などを毎回コントローラへ問い合わせる代わりに、
+SDK のレポートコールバック（位置・state・エラー/警告・接続）で更新された値を読む。
+各値には受信時刻が付いており、max_age より古ければ None を返すので、呼び出し側は
+そのときだけ RPC にフォールバックすればよい。
+
+イベント待ち:
+  token = cache.motion_token()
+  ... 動作コマンド ...
+  cache.wait_motion_finished(token, timeout=10.0)   # 「動作完了」
+  cache.wait_error(timeout=1.0)                     # 「エラー発生」
+
+レポート周期は XArmAPI の report_type に依存する（"real" で約 100Hz）。
+create_arm() は環境変数 XARM_REPORT_TYPE を XArmAPI に渡す。
+シミュレータ（SimXArmAPI）では仮想時計を進めながら待つ。
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+STATE_MOVING = 1
+
+
+class RobotStateCache:
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._arm: Any = None
+        self._sim_sleep: Optional[Callable[[float], None]] = None
+
+        self.pose: Optional[List[float]] = None
+        self.pose_ts = 0.0
+        self.joints: Optional[List[float]] = None
+        self.joints_ts = 0.0
+        self.state: Optional[int] = None
+        self.state_ts = 0.0
+        self.error_code = 0
+        self.warn_code = 0
+        self.error_ts = 0.0
+        self.connected = False
+        self.connected_ts = 0.0
+        self.gripper_pos: Optional[float] = None
+        self.gripper_ts = 0.0
+
+        # state が MOVING から抜けるたび / エラーが立つたびに増える
+        self._idle_seq = 0
+        self._error_seq = 0
+        self._listeners: List[Callable[["RobotStateCache", str], None]] = []
+
+    # ------------------------------------------------------------------
+    # 購読
+    # ------------------------------------------------------------------
+    def attach(self, arm: Any) -> None:
+        """arm のレポートを購読し、初期値を 1 回だけ RPC で埋める"""
+        self.detach()
+        self._arm = arm
+        sim_clock = getattr(arm, "sim_clock", None)
+        if sim_clock:
+            self._clock = sim_clock
+        self._sim_sleep = getattr(arm, "sim_sleep", None)
+
+        arm.register_report_location_callback(self._on_report, report_cartesian=True, report_joints=True)
+        arm.register_state_changed_callback(self._on_state)
+        arm.register_error_warn_changed_callback(self._on_error_warn)
+        arm.register_connect_changed_callback(self._on_connect)
+
+        self.refresh()
+
+    def detach(self) -> None:
+        """購読をやめる。以後レポートは届かないので未接続として扱う"""
+        arm, self._arm = self._arm, None
+        if arm is None:
+            return
+        if self.connected:
+            self._on_connect({"connected": False})
+        for release, cb in (
+            ("release_report_location_callback", self._on_report),
+            ("release_state_changed_callback", self._on_state),
+            ("release_error_warn_changed_callback", self._on_error_warn),
+            ("release_connect_changed_callback", self._on_connect),
+        ):
+            try:
+                getattr(arm, release)(cb)
+            except Exception:
+                pass
+
+    def refresh(self) -> None:
+        """RPC で全項目を取り直す（接続直後・再接続後用）"""
+        arm = self._arm
+        if arm is None:
+            return
+        code, pose = arm.get_position()
+        if code == 0:
+            self._on_report({"cartesian": pose})
+        code, joints = arm.get_servo_angle()
+        if code == 0:
+            self._on_report({"joints": joints})
+        code, state = arm.get_state()
+        if code == 0:
+            self._on_state({"state": state})
+        code, err_warn = arm.get_err_warn_code()
+        if code == 0:
+            self._on_error_warn({"error_code": err_warn[0], "warn_code": err_warn[1]})
+        self._on_connect({"connected": bool(getattr(arm, "connected", True))})
+
+    def add_listener(self, fn: Callable[["RobotStateCache", str], None]) -> None:
+        """更新のたびに fn(cache, kind) を呼ぶ。kind は report/state/error/connect/gripper"""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn: Callable[["RobotStateCache", str], None]) -> None:
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _notify(self, kind: str) -> None:
+        self._cond.notify_all()
+        for fn in list(self._listeners):
+            try:
+                fn(self, kind)
+            except Exception as e:
+                print(f"[StateCache] listener error: {e!r}")
+
+    # ------------------------------------------------------------------
+    # コールバック（SDK のレポートスレッドから呼ばれる）
+    # ------------------------------------------------------------------
+    def _on_report(self, data: Dict[str, Any]) -> None:
+        with self._cond:
+            now = self._clock()
+            if data.get("cartesian") is not None:
+                self.pose = list(data["cartesian"])
+                self.pose_ts = now
+            if data.get("joints") is not None:
+                self.joints = list(data["joints"])
+                self.joints_ts = now
+            self._notify("report")
+
+    def _on_state(self, data: Dict[str, Any]) -> None:
+        with self._cond:
+            state = data.get("state")
+            if self.state == STATE_MOVING and state != STATE_MOVING:
+                self._idle_seq += 1
+            self.state = state
+            self.state_ts = self._clock()
+            self._notify("state")
+
+    def _on_error_warn(self, data: Dict[str, Any]) -> None:
+        with self._cond:
+            err = data.get("error_code", 0) or 0
+            if err and err != self.error_code:
+                self._error_seq += 1
+            self.error_code = err
+            self.warn_code = data.get("warn_code", 0) or 0
+            self.error_ts = self._clock()
+            self._notify("error")
+
+    def _on_connect(self, data: Dict[str, Any]) -> None:
+        with self._cond:
+            self.connected = bool(data.get("connected"))
+            self.connected_ts = self._clock()
+            self._notify("connect")
+
+    def update_gripper(self, pos: Optional[float]) -> None:
+        """グリッパー位置はレポートに含まれないため、指令側・読み出し側から更新する"""
+        with self._cond:
+            self.gripper_pos = pos
+            self.gripper_ts = self._clock()
+            self._notify("gripper")
+
+    # ------------------------------------------------------------------
+    # 読み出し
+    # ------------------------------------------------------------------
+    def now(self) -> float:
+        return self._clock()
+
+    def get_pose(self, max_age: Optional[float] = None) -> Optional[List[float]]:
+        with self._cond:
+            if self.pose is None:
+                return None
+            if max_age is not None and self._clock() - self.pose_ts > max_age:
+                return None
+            return list(self.pose)
+
+    def get_joints(self, max_age: Optional[float] = None) -> Optional[List[float]]:
+        with self._cond:
+            if self.joints is None:
+                return None
+            if max_age is not None and self._clock() - self.joints_ts > max_age:
+                return None
+            return list(self.joints)
+
+    @property
+    def has_error(self) -> bool:
+        return self.error_code != 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "t": self._clock(),
+                "pose": list(self.pose) if self.pose is not None else None,
+                "joints": list(self.joints) if self.joints is not None else None,
+                "state": self.state,
+                "error_code": self.error_code,
+                "warn_code": self.warn_code,
+                "gripper_pos": self.gripper_pos,
+                "connected": self.connected,
+            }
+
+    # ------------------------------------------------------------------
+    # イベント待ち
+    # ------------------------------------------------------------------
+    def wait_for(self, predicate: Callable[[], bool], timeout: Optional[float] = None, poll: float = 0.005) -> bool:
+        """predicate() が真になるまで待つ。シミュレータでは仮想時計を進めて待つ"""
+        t_end = None if timeout is None else self._clock() + timeout
+        if self._sim_sleep is not None:
+            while not predicate():
+                if t_end is not None and self._clock() >= t_end:
+                    return False
+                self._sim_sleep(poll)
+            return True
+        with self._cond:
+            while not predicate():
+                remaining = None if t_end is None else t_end - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.5)
+            return True
+
+    def motion_token(self) -> int:
+        """動作コマンドを送る直前に取得し、wait_motion_finished に渡す"""
+        return self._idle_seq
+
+    def wait_motion_finished(self, token: int, timeout: Optional[float] = None, start_grace: float = 0.2) -> bool:
+        """
+        token 取得後に始まった動作の完了を待つ。
+        start_grace 秒たっても MOVING にならなければ（動作がすぐ終わった/始まらなかった）完了とみなす。
+        エラーが立った場合も待ちを打ち切って False を返す。
+        """
+        t0 = self._clock()
+        err_seq = self._error_seq
+
+        def done() -> bool:
+            if self._error_seq != err_seq:
+                return True
+            if self._idle_seq != token:
+                return True
+            return self.state != STATE_MOVING and self._clock() - t0 >= start_grace
+
+        ok = self.wait_for(done, timeout)
+        return ok and self._error_seq == err_seq
+
+    def wait_error(self, timeout: Optional[float] = None) -> bool:
+        """新しいエラーが立つまで待つ（既に立っていれば即 True）"""
+        seq = self._error_seq
+        return self.wait_for(lambda: self._error_seq != seq or self.has_error, timeout)
@@ -0,0 +1,218 @@
+"""動作テレメトリの記録（固定長リングバッファ）。
+
+RobotStateCache のリスナーとして、レポートが届くたび（実機で約 100Hz）に
+  時刻・TCP 姿勢・関節角・グリッパー位置・state・エラーコード・ピック番号・フェーズ
+を 1 行として記録する。バッファは起動時に capacity 行分を array('d') で確保し、
+一杯になったら古い行から上書きする（記録中にメモリ確保しない）。
+
+フェーズは XArmOperator._phase() が mark() で付ける（0 = フェーズ外）。
+ピック番号は begin_pick() ごとに増え、ピック外は 0。
+
+  rec = TelemetryRecorder(capacity=60000)   # 100Hz で 10 分
+  rec.attach(operator.state)
+  ...
+  rec.save("pick.xtel")                      # 独自バイナリ（.npz なら numpy があれば npz）
+  cols, meta = TelemetryRecorder.load("pick.xtel")
+
+解析: python test/analyzeTelemetry.py pick.xtel
+"""
+from __future__ import annotations
+
+import json
+import struct
+import sys
+import threading
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+FIELDS = (
+    "t",
+    "x", "y", "z", "roll", "pitch", "yaw",
+    "j1", "j2", "j3", "j4", "j5", "j6", "j7",
+    "gripper", "state", "error", "pick", "phase",
+)
+NF = len(FIELDS)
+
+MAGIC = b"XTEL1\n"
+NAN = float("nan")
+
+
+class TelemetryRecorder:
+    def __init__(self, capacity: int = 60000):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive: {capacity}")
+        self.capacity = capacity
+        self._buf = array("d", bytes(8 * capacity * NF))
+        self._head = 0          # 次に書く行
+        self._count = 0         # 有効な行数（<= capacity）
+        self.dropped = 0        # 上書きで失った行数
+        self._lock = threading.Lock()
+        self._cache: Any = None
+
+        # フェーズ名 <-> 番号（0 はフェーズ外）
+        self.phase_names: List[str] = [""]
+        self._phase_code: Dict[str, int] = {"": 0}
+        self._phase = 0
+        self._pick = 0
+        self.pick_labels: Dict[int, str] = {}
+
+    # ------------------------------------------------------------------
+    # 購読
+    # ------------------------------------------------------------------
+    def attach(self, cache: Any) -> None:
+        self.detach()
+        self._cache = cache
+        cache.add_listener(self._on_update)
+
+    def detach(self) -> None:
+        cache, self._cache = self._cache, None
+        if cache is not None:
+            cache.remove_listener(self._on_update)
+
+    def _on_update(self, cache: Any, kind: str) -> None:
+        if kind != "connect":
+            self.sample()
+
+    # ------------------------------------------------------------------
+    # 記録
+    # ------------------------------------------------------------------
+    def sample(self) -> None:
+        """キャッシュの現在値を 1 行書く"""
+        cache = self._cache
+        if cache is None:
+            return
+        pose = cache.pose or ()
+        joints = cache.joints or ()
+        gripper = cache.gripper_pos
+        state = cache.state
+        with self._lock:
+            base = self._head * NF
+            buf = self._buf
+            buf[base] = cache.now()
+            for k in range(6):
+                buf[base + 1 + k] = pose[k] if k < len(pose) else NAN
+            for k in range(7):
+                buf[base + 7 + k] = joints[k] if k < len(joints) else NAN
+            buf[base + 14] = gripper if gripper is not None else NAN
+            buf[base + 15] = state if state is not None else NAN
+            buf[base + 16] = cache.error_code
+            buf[base + 17] = self._pick
+            buf[base + 18] = self._phase
+            self._head = (self._head + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+            else:
+                self.dropped += 1
+
+    def mark(self, phase: Optional[str]) -> None:
+        """以降の行にフェーズを付ける（None でフェーズ外）。境界を残すため 1 行書く"""
+        name = phase or ""
+        with self._lock:
+            code = self._phase_code.get(name)
+            if code is None:
+                code = self._phase_code[name] = len(self.phase_names)
+                self.phase_names.append(name)
+            self._phase = code
+        self.sample()
+
+    def begin_pick(self, label: str = "") -> int:
+        with self._lock:
+            self._pick = max(self.pick_labels, default=0) + 1
+            self.pick_labels[self._pick] = label
+        self.sample()
+        return self._pick
+
+    def end_pick(self) -> None:
+        self.sample()
+        with self._lock:
+            self._pick = 0
+            self._phase = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._head = self._count = self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ------------------------------------------------------------------
+    # 取り出し
+    # ------------------------------------------------------------------
+    def rows(self, since: Optional[float] = None) -> array:
+        """古い順に並べた行（平坦な array('d')、1 行 NF 要素）。since 以降の時刻だけに絞れる"""
+        with self._lock:
+            start = (self._head - self._count) % self.capacity
+            if start + self._count <= self.capacity:
+                out = self._buf[start * NF:(start + self._count) * NF]
+            else:
+                out = self._buf[start * NF:] + self._buf[:self._head * NF]
+        if since is not None:
+            n = len(out) // NF
+            first = next((i for i in range(n) if out[i * NF] >= since), n)
+            out = out[first * NF:]
+        return out
+
+    def meta(self, rows: int) -> Dict[str, Any]:
+        return {
+            "fields": list(FIELDS),
+            "phases": list(self.phase_names),
+            "picks": {str(k): v for k, v in self.pick_labels.items()},
+            "rows": rows,
+            "capacity": self.capacity,
+            "dropped": self.dropped,
+            "byteorder": sys.byteorder,
+        }
+
+    def columns(self, since: Optional[float] = None) -> Dict[str, List[float]]:
+        data = self.rows(since)
+        return {name: list(data[i::NF]) for i, name in enumerate(FIELDS)}
+
+    # ------------------------------------------------------------------
+    # 保存・読み込み
+    # ------------------------------------------------------------------
+    def save(self, path, since: Optional[float] = None) -> Path:
+        """
+        .npz なら numpy の npz（numpy が無ければ ImportError）、それ以外は独自バイナリ:
+          MAGIC | uint32 ヘッダ長 | ヘッダ JSON | float64 x rows x NF
+        """
+        path = Path(path)
+        data = self.rows(since)
+        meta = self.meta(len(data) // NF)
+        if path.suffix == ".npz":
+            import numpy as np
+
+            np.savez_compressed(path, data=np.frombuffer(data, dtype=np.float64).reshape(-1, NF),
+                                meta=np.array(json.dumps(meta)))
+            return path
+        header = json.dumps(meta).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(data.tobytes())
+        return path
+
+    @staticmethod
+    def load(path) -> Tuple[Dict[str, List[float]], Dict[str, Any]]:
+        """save() したファイルを (列名 -> 値のリスト, メタ情報) にする"""
+        path = Path(path)
+        if path.suffix == ".npz":
+            import numpy as np
+
+            with np.load(path) as z:
+                meta = json.loads(str(z["meta"]))
+                data = array("d")
+                data.frombytes(z["data"].astype(np.float64).ravel().tobytes())
+        else:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"not a telemetry file: {path}")
+                (n,) = struct.unpack("<I", f.read(4))
+                meta = json.loads(f.read(n).decode("utf-8"))
+                data = array("d")
+                data.frombytes(f.read())
+            if meta.get("byteorder", sys.byteorder) != sys.byteorder:
+                data.byteswap()
+        nf = len(meta["fields"])
+        return {name: list(data[i::nf]) for i, name in enumerate(meta["fields"])}, meta
@@ -0,0 +1,358 @@
+"""テレオペ軌道の記録と、時間スケール付きの再生。
+
+記録: TrajectoryRecorder を RobotStateCache のリスナーにし、レポートごと（実機で約 100Hz）に
+  t, x, y, z, roll, pitch, yaw, j1..j7, gripper
+を array('d') に追記する。グリッパーはレポートに含まれないので、指令側が
+cache.update_gripper() した値（指令位置）を記録する。stop() で静止区間の途中の行を
+間引く（両端の行は残すので、止まっていた時間はそのまま再現できる）。
+
+再生: TrajectoryPlayer は軌道をウェイポイントに単純化して mode 0（位置制御）で流す。
+  - 折れ線を Ramer-Douglas-Peucker（tol_mm）で間引く
+  - dwell_s 以上の静止・グリッパー動作の位置では止まる（radius なし・完了待ち）
+  - それ以外は radius=blend_mm 付き・wait=False でキューし、コーナーで減速停止させない
+  - 区間の速度 = 区間長 / (記録上の所要時間 / time_scale)（min_speed..max_speed にクランプ）
+  - 静止時間も 1/time_scale 倍（keep_dwell=False なら待たない）
+
+  rec = TrajectoryRecorder()
+  rec.attach(cache); rec.start()
+  ...
+  rec.stop().save("demo.xtrj")
+  TrajectoryPlayer(arm, time_scale=2.0, blend_mm=5.0).play(Trajectory.load("demo.xtrj"), repeat=3)
+"""
+from __future__ import annotations
+
+import json
+import math
+import struct
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+FIELDS = (
+    "t",
+    "x", "y", "z", "roll", "pitch", "yaw",
+    "j1", "j2", "j3", "j4", "j5", "j6", "j7",
+    "gripper",
+)
+NF = len(FIELDS)
+POSE = slice(1, 7)
+JOINTS = slice(7, 14)
+GRIPPER = 14
+
+MAGIC = b"XTRJ1\n"
+NAN = float("nan")
+
+
+def _same(a: float, b: float, tol: float) -> bool:
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return abs(a - b) <= tol
+
+
+class Trajectory:
+    """記録した軌道（平坦な array('d')、1 行 NF 要素。t は記録開始からの秒）"""
+
+    def __init__(self, data: Optional[array] = None, meta: Optional[Dict[str, Any]] = None):
+        self.data = data if data is not None else array("d")
+        if len(self.data) % NF:
+            raise ValueError(f"trajectory data length must be a multiple of {NF}")
+        self.meta: Dict[str, Any] = dict(meta or {})
+
+    def __len__(self) -> int:
+        return len(self.data) // NF
+
+    def row(self, i: int) -> List[float]:
+        return list(self.data[i * NF:(i + 1) * NF])
+
+    def column(self, name: str) -> List[float]:
+        return list(self.data[FIELDS.index(name)::NF])
+
+    @property
+    def duration(self) -> float:
+        return self.data[(len(self) - 1) * NF] - self.data[0] if len(self) > 1 else 0.0
+
+    def compact(self, still_mm: float = 0.05, still_grip: float = 0.5) -> int:
+        """前後の行と同じ（静止中）行を間引く。消した行数を返す"""
+        n = len(self)
+        if n < 3:
+            return 0
+        rows = [self.row(i) for i in range(n)]
+
+        def same(a: List[float], b: List[float]) -> bool:
+            return (math.dist(a[1:4], b[1:4]) <= still_mm
+                    and _same(a[GRIPPER], b[GRIPPER], still_grip))
+
+        keep = [0] + [i for i in range(1, n - 1)
+                      if not (same(rows[i - 1], rows[i]) and same(rows[i], rows[i + 1]))] + [n - 1]
+        out = array("d")
+        for i in keep:
+            out.extend(rows[i])
+        self.data = out
+        return n - len(keep)
+
+    # ------------------------------------------------------------------
+    # 保存・読み込み（MAGIC | uint32 ヘッダ長 | ヘッダ JSON | float64 x rows x NF）
+    # ------------------------------------------------------------------
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header = json.dumps(dict(self.meta, fields=list(FIELDS), rows=len(self),
+                                 byteorder=sys.byteorder)).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(self.data.tobytes())
+        return path
+
+    @classmethod
+    def load(cls, path) -> "Trajectory":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"not a trajectory file: {path}")
+            (n,) = struct.unpack("<I", f.read(4))
+            meta = json.loads(f.read(n).decode("utf-8"))
+            data = array("d")
+            data.frombytes(f.read())
+        if meta.get("byteorder", sys.byteorder) != sys.byteorder:
+            data.byteswap()
+        if meta.get("fields", list(FIELDS)) != list(FIELDS):
+            raise ValueError(f"unsupported trajectory fields: {meta.get('fields')}")
+        return cls(data, meta)
+
+
+class TrajectoryRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = array("d")
+        self._cache: Any = None
+        self._t0: Optional[float] = None
+        self.recording = False
+
+    # ------------------------------------------------------------------
+    # 購読
+    # ------------------------------------------------------------------
+    def attach(self, cache: Any) -> None:
+        self.detach()
+        self._cache = cache
+        cache.add_listener(self._on_update)
+
+    def detach(self) -> None:
+        cache, self._cache = self._cache, None
+        if cache is not None:
+            cache.remove_listener(self._on_update)
+
+    def _on_update(self, cache: Any, kind: str) -> None:
+        if self.recording and kind in ("report", "gripper"):
+            self.sample()
+
+    # ------------------------------------------------------------------
+    # 記録
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        with self._lock:
+            self._data = array("d")
+            self._t0 = None
+            self.recording = True
+        self.sample()
+
+    def sample(self) -> None:
+        cache = self._cache
+        if cache is None or cache.pose is None:
+            return
+        pose = cache.pose
+        joints = cache.joints or ()
+        gripper = cache.gripper_pos
+        now = cache.now()
+        with self._lock:
+            if not self.recording:
+                return
+            if self._t0 is None:
+                self._t0 = now
+            self._data.append(now - self._t0)
+            self._data.extend(pose[:6])
+            self._data.extend(joints[k] if k < len(joints) else NAN for k in range(7))
+            self._data.append(gripper if gripper is not None else NAN)
+
+    def stop(self, compact: bool = True) -> Trajectory:
+        """記録を止めて Trajectory を返す"""
+        self.sample()
+        with self._lock:
+            self.recording = False
+            traj = Trajectory(self._data, {"recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            self._data = array("d")
+        raw = len(traj)
+        removed = traj.compact() if compact else 0
+        traj.meta.update({"raw_rows": raw, "compacted": removed})
+        return traj
+
+
+# ----------------------------------------------------------------------
+# 再生
+# ----------------------------------------------------------------------
+@dataclass
+class Waypoint:
+    pose: List[float]
+    t: float                          # 記録上の時刻
+    stop: bool = False                # ここで止まる（ブレンドしない）
+    gripper: Optional[float] = None   # 着いたらこの位置へグリッパーを動かす
+    dwell: float = 0.0                # 次のウェイポイントまで（記録上）止まっていた時間
+
+
+def _rdp(points: List[List[float]], lo: int, hi: int, tol: float, out: List[int]) -> None:
+    """points[lo..hi] の折れ線を tol 以内で近似する頂点（lo, hi を除く）を out に足す"""
+    if hi - lo < 2:
+        return
+    a, b = points[lo], points[hi]
+    ab = [q - p for p, q in zip(a, b)]
+    norm2 = sum(v * v for v in ab)
+    worst, idx = -1.0, -1
+    for i in range(lo + 1, hi):
+        ap = [q - p for p, q in zip(a, points[i])]
+        if norm2 > 0.0:
+            s = max(0.0, min(1.0, sum(u * v for u, v in zip(ap, ab)) / norm2))
+            d = math.dist(points[i], [p + s * v for p, v in zip(a, ab)])
+        else:
+            d = math.dist(points[i], a)
+        if d > worst:
+            worst, idx = d, i
+    if worst > tol:
+        _rdp(points, lo, idx, tol, out)
+        out.append(idx)
+        _rdp(points, idx, hi, tol, out)
+
+
+class TrajectoryPlayer:
+    def __init__(
+        self,
+        arm: Any,
+        time_scale: float = 1.0,
+        blend_mm: float = 5.0,
+        tol_mm: float = 1.0,
+        dwell_s: float = 0.3,
+        still_mm: float = 0.5,
+        keep_dwell: bool = True,
+        min_speed: float = 5.0,
+        max_speed: float = 500.0,
+        acc: float = 2000.0,
+        joint_speed: float = 30.0,
+    ):
+        if time_scale <= 0:
+            raise ValueError(f"time_scale must be positive: {time_scale}")
+        self.arm = arm
+        self.time_scale = time_scale
+        self.blend_mm = blend_mm
+        self.tol_mm = tol_mm
+        self.dwell_s = dwell_s
+        self.still_mm = still_mm
+        self.keep_dwell = keep_dwell
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.acc = acc
+        self.joint_speed = joint_speed
+        self._clock: Callable[[], float] = getattr(arm, "sim_clock", None) or time.perf_counter
+        self._sleep: Callable[[float], None] = getattr(arm, "sim_sleep", None) or time.sleep
+
+    # ------------------------------------------------------------------
+    # 計画
+    # ------------------------------------------------------------------
+    def plan(self, traj: Trajectory) -> List[Waypoint]:
+        n = len(traj)
+        if n == 0:
+            return []
+        rows = [traj.row(i) for i in range(n)]
+        xyz = [r[1:4] for r in rows]
+
+        # 区切り: 端・グリッパーが変わった行・dwell_s 以上の静止区間の両端
+        breaks = {0, n - 1}
+        grip_at: Dict[int, float] = {}
+        for i in range(1, n):
+            g0, g1 = rows[i - 1][GRIPPER], rows[i][GRIPPER]
+            if not math.isnan(g1) and not _same(g0, g1, 0.5):
+                grip_at[i] = g1
+                breaks.add(i)
+        i = 0
+        while i < n - 1:
+            j = i
+            while j + 1 < n and math.dist(xyz[i], xyz[j + 1]) <= self.still_mm:
+                j += 1
+            if j > i and rows[j][0] - rows[i][0] >= self.dwell_s:
+                breaks.update((i, j))
+            i = max(j, i + 1)
+
+        keys = sorted(breaks)
+        idx = set(keys)
+        for lo, hi in zip(keys, keys[1:]):
+            extra: List[int] = []
+            _rdp(xyz, lo, hi, self.tol_mm, extra)
+            idx.update(extra)
+
+        out = [Waypoint(pose=rows[i][1:7], t=rows[i][0], stop=i in breaks, gripper=grip_at.get(i))
+               for i in sorted(idx)]
+        for wp, nxt in zip(out, out[1:]):
+            if wp.stop and math.dist(wp.pose[:3], nxt.pose[:3]) <= self.still_mm:
+                wp.dwell = nxt.t - wp.t
+        return out
+
+    # ------------------------------------------------------------------
+    # 実行
+    # ------------------------------------------------------------------
+    def _check(self, code: int, what: str) -> None:
+        if code != 0:
+            raise RuntimeError(f"{what} failed (code: {code})")
+
+    def move_to_start(self, traj: Trajectory) -> None:
+        """記録開始時の関節角（無ければ TCP 姿勢）へ関節補間で移動し、グリッパーも合わせる"""
+        first = traj.row(0)
+        joints = first[JOINTS]
+        if not any(math.isnan(j) for j in joints[:6]):
+            if math.isnan(joints[6]):
+                joints = joints[:6]
+            code = self.arm.set_servo_angle(angle=joints, speed=self.joint_speed, wait=True)
+            self._check(code, "set_servo_angle (start)")
+        else:
+            code = self.arm.set_position(*first[POSE], speed=self.max_speed, mvacc=self.acc, wait=True)
+            self._check(code, "set_position (start)")
+        if not math.isnan(first[GRIPPER]):
+            self._check(self.arm.set_gripper_position(first[GRIPPER], wait=True), "set_gripper_position (start)")
+
+    def run_once(self, waypoints: List[Waypoint]) -> None:
+        for prev, wp in zip(waypoints, waypoints[1:]):
+            dist = math.dist(prev.pose[:3], wp.pose[:3])
+            # 止まる点では、キュー済みの動作の完了を待つため距離 0 でも送る
+            if dist > 1e-3 or (wp.stop and not prev.stop):
+                dt = max((wp.t - prev.t) / self.time_scale, 1e-3)
+                speed = max(self.min_speed, min(self.max_speed, dist / dt))
+                code = self.arm.set_position(*wp.pose, speed=speed, mvacc=self.acc,
+                                             radius=None if wp.stop else self.blend_mm, wait=wp.stop)
+                self._check(code, "set_position")
+            t_arrive = self._clock()
+            if wp.gripper is not None:
+                self._check(self.arm.set_gripper_position(wp.gripper, wait=True), "set_gripper_position")
+            if wp.dwell and self.keep_dwell:
+                # グリッパーの動作時間も静止時間に含まれている
+                remaining = wp.dwell / self.time_scale - (self._clock() - t_arrive)
+                if remaining > 0:
+                    self._sleep(remaining)
+
+    def play(self, traj: Trajectory, repeat: int = 1) -> Dict[str, Any]:
+        """repeat 回再生する（毎回開始姿勢へ戻る）。アームは mode 0 / state 0 にしておくこと"""
+        waypoints = self.plan(traj)
+        runs = []
+        for _ in range(repeat):
+            self.move_to_start(traj)
+            t0 = self._clock()
+            self.run_once(waypoints)
+            runs.append(round(self._clock() - t0, 3))
+        return {
+            "rows": len(traj),
+            "waypoints": len(waypoints),
+            "stops": sum(1 for w in waypoints if w.stop),
+            "recorded_s": round(traj.duration, 3),
+            "target_s": round(traj.duration / self.time_scale, 3),
+            "runs_s": runs,
+        }
@@ -1,11 +1,86 @@
+import hashlib
 import json
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from xarm.wrapper import XArmAPI
+
+from Robot.motion_model import (
+    DEFAULT_TCP_ACC,
+    DEFAULT_TCP_SPEED,
+    gripper_move_time,
+    joint_move_time,
+    trapezoid_time,
+)
+from Robot.calibration import UnityRobotTransform
+from Robot.grid_model import GridPoseModel, cell_key
+from Robot.pick_planner import plan_pick_order
+from Robot.recovery import ArmRecovery
+from Robot.sim_xarm import SimXArmAPI, create_arm
+from Robot.state_cache import RobotStateCache
+from Robot.telemetry import TelemetryRecorder
+from utils import load_latest_grid_json
+
+# pick_at の動作モード
+#   "stepwise": 各ウェイポイントで wait=True（従来動作。毎回停止する）
+#   "blended" : 上昇→横移動をコーナーブレンド（radius）付きで非同期にキューし、
+#               グリッパーが動く直前だけ完了待ちする
+MOTION_MODES = ("stepwise", "blended")
+
+# アームの実体
+#   "real": xArm SDK の XArmAPI（実機）
+#   "sim" : Robot.sim_xarm.SimXArmAPI（タイミングモデル付きシミュレータ）
+BACKENDS = ("real", "sim")
+
+# レポートストリームのポーズをこの秒数まで新しいとみなす（古ければ get_position にフォールバック）
+POSE_MAX_AGE = 0.1
+
+# 関節角キャッシュの形式が変わったら上げる（古いキャッシュを無効化する）
+JOINT_CACHE_VERSION = 1
+
+# 把持判定の既定値（robot_grid/grasp_profiles.json の "default" と物体タイプ別の値で上書き）
+#   close_pos    : 閉じる目標位置
+#   empty_margin : close_pos + empty_margin 以下まで閉じたら「何も掴んでいない」
+#   max_pos      : これより開いたまま止まったら異常（ずれて挟んだ・2 個掴んだ）。None で無効
+#   min_current  : グリッパー電流の下限 [A]。バックエンドが電流を返す場合のみ使う。None で無効
+DEFAULT_GRASP_PROFILE = {
+    "close_pos": 350,
+    "empty_margin": 10,
+    "max_pos": None,
+    "min_current": None,
+    "max_retries": 2,
+    "retry_lift_mm": 15.0,
+    "retry_offsets_mm": [[8.0, 0.0], [-8.0, 0.0], [0.0, 8.0], [0.0, -8.0]],
+}
+
+
+class GraspError(Exception):
+    """再試行しても把持できなかった（アームは UP_Z に退避済み・グリッパーは開）"""
+
 
 class XArmOperator:
-    def __init__(self, ip: str = '192.168.1.199', json_file: str | None = None):
+    def __init__(
+        self,
+        ip: str = '192.168.1.199',
+        json_file: str | None = None,
+        motion_mode: str = "stepwise",
+        backend: str = "real",
+        sim_options: dict | None = None,
+        gripper_overlap: bool = True,
+        joint_traverse: bool = True,
+        grid_size: tuple[int, int] | None = None,
+        grid_method: str = "affine",
+        calibration_method: str = "rigid",
+        telemetry: bool = False,
+        telemetry_dir: str | None = None,
+    ):
+        if motion_mode not in MOTION_MODES:
+            raise ValueError(f"motion_mode must be one of {MOTION_MODES}: {motion_mode!r}")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}: {backend!r}")
         self.ip = ip
+        self.backend = backend
+        self.sim_options = dict(sim_options or {})
         # ポーズファイルのパス解決
         if json_file is None:
             current_dir = Path(__file__).resolve().parent
@@ -20,11 +95,74 @@ class XArmOperator:
             
         self.arm = None
         self.pose_map = {}
+        # 教示セルから当てはめたグリッドモデル（教示していないセル・小数セルの姿勢を求める）
+        # grid_size（列数, 行数）を指定すると教示範囲の外のセルも受け付ける
+        self.grid_model: GridPoseModel | None = None
+        self.grid_size = tuple(grid_size) if grid_size else None
+        self.grid_method = grid_method
+        # Unity の localPos -> ロボット座標の変換（saved_grids/qr_grid_config.json と pose_map から当てはめ）
+        self.calibration: UnityRobotTransform | None = None
+        self.calibration_method = calibration_method
+        # localPos から求めた位置は、教示セルの範囲をこの余白 [mm] 以上はみ出したら拒否する
+        self.local_margin_mm = 50.0
         self.connected = False
+        # 位置・state・エラーはレポートコールバックで更新されるキャッシュから読む
+        self.state = RobotStateCache()
+        # ピック動作・再接続・エラークリアを直列化する（ヘルスモニタのスレッドと共有）
+        self.motion_lock = threading.RLock()
+        # エラー復帰（state 遷移を待つ。arm 生成時に作り直す）
+        self.recovery: ArmRecovery | None = None
+        self._recoveries: list[dict] = []
         
         # 【重要】安全高さの設定 (mm)
         # 机や障害物にぶつからない十分な高さを設定してください
         self.SAFE_HEIGHT = 200.0 
+
+        # ピック動作の高さ (mm)
+        self.DOWN_Z = 179.3   # 下降時の高さ
+        self.UP_Z = 290.0     # 上昇・移動時の高さ
+
+        self.motion_mode = motion_mode
+        # blended モードのコーナーブレンド半径 (mm)
+        self.blend_radius = 30.0
+
+        # グリッパーの開動作を横移動中に先行させ、完了は位置フィードバックで判定する
+        # （False で従来どおり到着後に開き、固定 sleep を入れる）
+        self.gripper_overlap = gripper_overlap
+        self.gripper_tolerance = 5.0     # 目標位置とみなす誤差（グリッパー単位）
+        self.gripper_poll_s = 0.02       # 位置フィードバックの問い合わせ周期
+        self.gripper_stall_s = 0.1       # この間ほぼ動かなければ停止（物体に当たった）とみなす
+        self.gripper_timeout_s = 5.0
+
+        # UP_Z での横移動を関節補間（set_servo_angle）で行う。関節角は load_poses が
+        # grid_pose_map.joints.json から読み、無ければ接続後に get_inverse_kinematics で作る
+        # 関節補間の経路は直線ではないため、UP_Z は障害物から十分離しておくこと
+        self.joint_traverse = joint_traverse
+        self.joint_speed = 60.0    # deg/s
+        self.joint_acc = 500.0     # deg/s^2
+        self.joint_map: dict[str, dict[str, list]] = {}
+
+        # 把持判定（位置・電流）と空振り時の再試行
+        self.verify_grasp = True
+        self.grasp_profiles: dict[str, dict] = {}
+        self._grasp_profile: dict = dict(DEFAULT_GRASP_PROFILE)
+        self._grasp_result: dict | None = None
+        self.load_grasp_profiles()
+
+        # 直近の pick_at のフェーズ別所要時間など（サイクルタイム比較用）
+        self.last_pick_report: dict = {}
+        self.last_pick_many_report: dict = {}
+        self.current_phase: str | None = None
+        self._phase_times: dict[str, float] = {}
+        # グリッパーが物を持っているか（True / False / None=不明）。
+        # 空だと分かっているときだけ、横移動中にグリッパーを開き始める
+        self.holding: bool | None = None
+
+        # 動作テレメトリ（任意）。失敗したピックは telemetry_dir に自動で書き出す
+        self.telemetry: TelemetryRecorder | None = None
+        self.telemetry_dir = Path(telemetry_dir) if telemetry_dir else None
+        if telemetry:
+            self.enable_telemetry()
         
         self.load_poses()
 
@@ -39,6 +177,173 @@ class XArmOperator:
             print(f"Loaded {len(self.pose_map)} poses.")
         except Exception as e:
             print(f"Failed to load poses: {e}")
+            return
+        self.fit_grid_model()
+        self.load_calibration()
+        self.load_joint_cache()
+
+    def fit_grid_model(self) -> GridPoseModel | None:
+        """pose_map からグリッドモデルを当てはめ、教示セルとの誤差を表示する"""
+        self.grid_model = None
+        try:
+            self.grid_model = GridPoseModel.fit(self.pose_map, method=self.grid_method, size=self.grid_size)
+        except ValueError as e:
+            print(f"Grid model not available: {e}")
+            return None
+        stats = self.grid_model.fit_stats()
+        print(f"Grid model ({self.grid_method}): rms {stats['rms_mm']:.2f} mm, max {stats['max_mm']:.2f} mm")
+        return self.grid_model
+
+    def load_calibration(self, grid_config=None) -> UnityRobotTransform | None:
+        """
+        Unity の qr_grid_config（省略時は saved_grids から読む）と pose_map を同じセル番号で
+        対応付けて座標変換を当てはめる。Unity がグリッドを保存し直したら呼び直す。
+        当てはめに失敗したときは、それまでの変換をそのまま使い続ける。
+        """
+        if grid_config is None:
+            saved = load_latest_grid_json()
+            if saved is None:
+                return self.calibration
+            grid_config = saved["data"]
+        try:
+            calibration = UnityRobotTransform.from_configs(
+                grid_config, self.pose_map, method=self.calibration_method
+            )
+        except (ValueError, ZeroDivisionError) as e:
+            kept = "keeping the previous transform" if self.calibration is not None else "no transform"
+            print(f"Unity calibration not available ({kept}): {e}")
+            return self.calibration
+        self.calibration = calibration
+        stats = self.calibration.fit_stats()
+        print(f"Unity calibration ({stats['method']}): rms {stats['rms_mm']:.2f} mm, max {stats['max_mm']:.2f} mm, "
+              f"outliers {list(stats['outliers'])}")
+        return self.calibration
+
+    def local_poses(self, points: list) -> list[tuple[str, list]]:
+        """Unity の localPos の列を (キー, 姿勢) の列にまとめて変換する"""
+        if self.calibration is None:
+            raise ValueError("Unity calibration not available")
+        poses = self.calibration.to_robot(points)
+        xs = [v[0] for v in self.pose_map.values()]
+        ys = [v[1] for v in self.pose_map.values()]
+        m = self.local_margin_mm
+        for point, p in zip(points, poses):
+            if not (min(xs) - m <= p[0] <= max(xs) + m and min(ys) - m <= p[1] <= max(ys) + m):
+                raise ValueError(f"localPos {point} -> ({p[0]:.1f}, {p[1]:.1f}) is outside the taught workspace")
+        return [(f"@{p[0]:.1f},{p[1]:.1f}", p) for p in poses]
+
+    def cell_pose(self, cell) -> tuple[str, list]:
+        """
+        セル（"x,y" / (x, y)。小数可）を (キー, 姿勢) に解決する。
+        教示セルは pose_map の値、それ以外はグリッドモデルの値。範囲外なら ValueError。
+        {"x", "y", "z"}（Unity の localPos）は座標変換で直接ロボット姿勢にする。
+        """
+        if isinstance(cell, dict):
+            return self.local_poses([cell])[0]
+        if isinstance(cell, str):
+            key = cell
+        else:
+            try:
+                key = cell_key(*cell)
+            except TypeError:   # 要素数が 2 でない・反復できない
+                raise ValueError(f"Invalid grid cell {cell!r}") from None
+        if key in self.pose_map:
+            return key, list(self.pose_map[key])
+        try:
+            x, y = (float(v) for v in key.split(","))
+        except ValueError:
+            raise ValueError(f"Invalid grid cell {key!r}")
+        key = cell_key(x, y)
+        if key in self.pose_map:
+            return key, list(self.pose_map[key])
+        if self.grid_model is None or not self.grid_model.contains(x, y):
+            raise ValueError(f"Grid {key} not found")
+        return key, self.grid_model.pose(x, y)
+
+    def load_grasp_profiles(self) -> None:
+        path = Path(self.json_file).parent / "grasp_profiles.json"
+        if not path.is_file():
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.grasp_profiles = json.load(f)
+            print(f"Loaded grasp profiles: {list(self.grasp_profiles)}")
+        except Exception as e:
+            print(f"Failed to load grasp profiles: {e}")
+
+    def grasp_profile(self, object_type: str | None = None) -> dict:
+        """既定値 <- "default" <- 物体タイプ別 の順に重ねた把持判定パラメータ"""
+        profile = dict(DEFAULT_GRASP_PROFILE)
+        profile.update(self.grasp_profiles.get("default", {}))
+        if object_type:
+            if object_type not in self.grasp_profiles:
+                print(f"Unknown object type {object_type!r}; using default grasp profile")
+            profile.update(self.grasp_profiles.get(object_type, {}))
+        return profile
+
+    # ------------------------------------------------------------------
+    # 関節角キャッシュ
+    # ------------------------------------------------------------------
+    @property
+    def joint_cache_file(self) -> Path:
+        return Path(self.json_file).with_suffix(".joints.json")
+
+    def _pose_map_hash(self) -> str:
+        """ポーズマップと高さ設定から作るキャッシュの有効性ハッシュ"""
+        src = json.dumps(
+            {"v": JOINT_CACHE_VERSION, "poses": self.pose_map, "up_z": self.UP_Z, "down_z": self.DOWN_Z},
+            sort_keys=True,
+        )
+        return hashlib.sha1(src.encode("utf-8")).hexdigest()
+
+    def load_joint_cache(self) -> bool:
+        """ハッシュが一致するキャッシュがあれば joint_map に読み込む"""
+        self.joint_map = {}
+        path = self.joint_cache_file
+        if not path.is_file():
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Failed to load joint cache: {e}")
+            return False
+        if data.get("hash") != self._pose_map_hash():
+            print(f"Joint cache is stale (pose map or Z changed): {path.name}")
+            return False
+        self.joint_map = data.get("joints", {})
+        print(f"Loaded joint cache for {len(self.joint_map)} poses.")
+        return True
+
+    def build_joint_cache(self) -> int:
+        """
+        足りないセルの関節角（UP_Z / DOWN_Z）を get_inverse_kinematics で求めて保存する。
+        接続後に呼ぶ。戻り値は新たに計算したセル数。
+        """
+        if not self.connected or not self.arm:
+            return 0
+        added = 0
+        for key, pose in self.pose_map.items():
+            if key in self.joint_map:
+                continue
+            entry = {}
+            for level, z in (("up", self.UP_Z), ("down", self.DOWN_Z)):
+                code, joints = self.arm.get_inverse_kinematics([pose[0], pose[1], z, pose[3], pose[4], pose[5]])
+                if code != 0:
+                    print(f"IK failed for {key} at Z={z} (code: {code})")
+                    break
+                entry[level] = [round(float(a), 6) for a in joints]
+            else:
+                self.joint_map[key] = entry
+                added += 1
+        if added:
+            try:
+                with open(self.joint_cache_file, 'w', encoding='utf-8') as f:
+                    json.dump({"hash": self._pose_map_hash(), "joints": self.joint_map}, f, indent=2)
+                print(f"Saved joint cache ({added} new poses) to {self.joint_cache_file.name}")
+            except Exception as e:
+                print(f"Failed to save joint cache: {e}")
+        return added
     
 
     def go_to_initial_pos(self) -> tuple[bool, str]:
@@ -77,40 +382,105 @@ class XArmOperator:
     def connect(self) -> tuple[bool, str]:
         """ロボットへの接続と初期化"""
         try:
-            self.arm = XArmAPI(self.ip)
+            self.arm = self._create_arm()
             self.arm.connect()
+            self.state.attach(self.arm)
+            self.recovery = ArmRecovery(self.arm, state_cache=self.state)
             
             # エラー解除とモーション有効化
-            self.arm.clean_error()
-            self.arm.clean_gripper_error()
-            self.arm.motion_enable(enable=True)
-            self.arm.set_mode(0)
-            self.arm.set_state(state=0)
+            self._enable_motion()
             
             # グリッパー設定
             self.arm.set_gripper_mode(0)
             self.arm.set_gripper_enable(True)
             self.arm.set_gripper_position(self.gripper_open_pos, wait=True)
+            self.holding = False
             self.connected = True
             print("Connected to xArm.")
+
+            if self.joint_traverse:
+                self.build_joint_cache()
             
             # 接続後にホームポジションへ移動
             self.go_to_initial_pos()
             
             return True, "ok"
         except Exception as e:
+            self.state.detach()
             self.connected = False
             self.arm = None
             return False, str(e)
 
+    def _enable_motion(self) -> None:
+        self.arm.clean_gripper_error()
+        result = self.recovery.recover_arm(mode=0)
+        if not result.ok:
+            raise Exception(f"Recovery failed: {result.reason}")
+
+    def is_pose_safe(self, pose: list | None) -> bool:
+        """安全高さ以上にいれば、再接続後に初期姿勢へ戻さずそのまま再開してよい"""
+        return pose is not None and pose[2] >= self.SAFE_HEIGHT
+
+    def reconnect(self) -> tuple[bool, str]:
+        """
+        通信断からの復帰（ヘルスモニタから呼ばれる）。
+        同じ arm インスタンスで再接続し、エラー解除とモーション有効化だけ行う。
+        グリッパーは動かさない（把持中の物を落とさない）。
+        姿勢が安全高さ以上ならその場で再開し、そうでなければ初期姿勢へ戻す。
+        """
+        if self.arm is None:
+            return self.connect()
+        with self.motion_lock:
+            try:
+                self.arm.connect()
+                if not getattr(self.arm, "connected", True):
+                    raise ConnectionError(f"cannot reach {self.ip}")
+                self.state.attach(self.arm)
+                self._enable_motion()
+                self.connected = True
+            except Exception as e:
+                self.connected = False
+                return False, f"Reconnect failed: {e}"
+
+            pose = self.state.get_pose()
+            if self.is_pose_safe(pose):
+                return True, "Reconnected (resumed in place)"
+            print(f"Pose after reconnect is below SAFE_HEIGHT: {pose}")
+            ok, msg = self.go_to_initial_pos()
+            if not ok:
+                return False, f"Reconnected but homing failed: {msg}"
+            return True, "Reconnected (re-homed)"
+
+    def is_idle(self) -> bool:
+        """ピック等の動作シーケンスを実行していなければ True"""
+        if not self.motion_lock.acquire(blocking=False):
+            return False
+        self.motion_lock.release()
+        return self.state.state != 1
+
+    def clear_error(self) -> tuple[bool, str]:
+        """停止中に残っているコントローラエラーを解除して Ready に戻す"""
+        if not self.connected or not self.arm:
+            return False, "Robot not connected"
+        with self.motion_lock:
+            result = self.recovery.recover_arm(mode=0)
+            return result.ok, result.reason
+
+    def _create_arm(self):
+        if self.backend == "sim":
+            return SimXArmAPI(self.ip, **self.sim_options)
+        return create_arm(self.ip)
+
     def disconnect(self):
         """切断処理"""
         try:
+            # 先に切断して connect_changed を受けてから購読をやめる
             if self.arm:
                 self.arm.disconnect()
         except Exception:
             pass
         finally:
+            self.state.detach()
             self.arm = None
             self.connected = False
             print("Disconnected.")
@@ -154,6 +524,7 @@ class XArmOperator:
             return False, "Robot not connected"
         try:
             self.arm.set_gripper_position(self.gripper_open_pos, wait=True)
+            self.holding = False
             return True, "Gripper opened"
         except Exception as e:
             return False, str(e)
@@ -164,37 +535,461 @@ class XArmOperator:
             return False, "Robot not connected"
         try:
             self.arm.set_gripper_position(self.gripper_close_pos, wait=True)
+            self.holding = None   # 何か掴んだかは分からない
             return True, "Gripper closed"
         except Exception as e:
             return False, str(e)
 
-    def pick_at(self, x: int, y: int) -> tuple[bool, str]:
+    # ------------------------------------------------------------------
+    # 計測ヘルパー
+    # ------------------------------------------------------------------
+    # シミュレータ使用時は仮想時計で計測・待機する（実時間を待たずにサイクルタイムが出る）
+    def _now(self) -> float:
+        sim_clock = getattr(self.arm, "sim_clock", None)
+        return sim_clock() if sim_clock else time.perf_counter()
+
+    def _sleep(self, seconds: float) -> None:
+        sim_sleep = getattr(self.arm, "sim_sleep", None)
+        if sim_sleep:
+            sim_sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    @contextmanager
+    def _phase(self, name: str):
+        """pick の各フェーズの所要時間を _phase_times に積算する（テレメトリにも印を付ける）"""
+        self.current_phase = name
+        if self.telemetry:
+            self.telemetry.mark(name)
+        t0 = self._now()
+        try:
+            yield
+        finally:
+            self._phase_times[name] = self._phase_times.get(name, 0.0) + (self._now() - t0)
+            self.current_phase = None
+            if self.telemetry:
+                self.telemetry.mark(None)
+
+    # ------------------------------------------------------------------
+    # テレメトリ
+    # ------------------------------------------------------------------
+    def enable_telemetry(self, capacity: int = 60000) -> TelemetryRecorder:
+        """レポートごとの状態をリングバッファに記録する（100Hz で capacity / 100 秒分）"""
+        if self.telemetry is None or self.telemetry.capacity != capacity:
+            self.disable_telemetry()
+            self.telemetry = TelemetryRecorder(capacity)
+            self.telemetry.attach(self.state)
+        return self.telemetry
+
+    def disable_telemetry(self) -> None:
+        if self.telemetry is not None:
+            self.telemetry.detach()
+            self.telemetry = None
+
+    def dump_telemetry(self, path=None, since: float | None = None) -> Path | None:
+        """テレメトリをファイルに書き出す。path 省略時は telemetry_dir に時刻入りの名前で保存"""
+        if self.telemetry is None:
+            return None
+        if path is None:
+            if self.telemetry_dir is None:
+                return None
+            self.telemetry_dir.mkdir(parents=True, exist_ok=True)
+            path = self.telemetry_dir / f"telemetry_{time.strftime('%Y%m%d_%H%M%S')}.xtel"
+        try:
+            saved = self.telemetry.save(path, since=since)
+        except Exception as e:
+            print(f"Failed to save telemetry: {e}")
+            return None
+        print(f"Saved telemetry to {saved}")
+        return saved
+
+    def _current_pose(self) -> list:
+        """現在の TCP 姿勢。キャッシュが新しければ RPC を省く"""
+        pose = self.state.get_pose(max_age=POSE_MAX_AGE)
+        if pose is not None:
+            return pose
+        code, pose = self.arm.get_position()
+        if code != 0: raise Exception(f"Get position failed (code: {code})")
+        return pose
+
+    def _error_code(self) -> int:
+        """現在のエラーコード。エラー/警告の変化はプッシュされるので接続中はキャッシュを信頼する"""
+        if self.state.connected:
+            return self.state.error_code
+        code, err_warn = self.arm.get_err_warn_code()
+        return err_warn[0] if code == 0 else code
+
+    def _start_gripper(self, pos: float) -> None:
+        """グリッパー動作を非同期で開始する（完了は _wait_gripper で待つ）。失敗時は復帰して再試行"""
+        result = self.recovery.move_gripper(pos, wait=False)
+        if result.attempts > 1:
+            self._recoveries.append(result.to_dict())
+        if not result.ok: raise Exception(f"Gripper command failed ({result.reason})")
+
+    def _wait_gripper(self, target: float) -> float:
+        """
+        グリッパー位置をポーリングし、目標に達するか停止（把持で止まった）したら返す。
+        固定 sleep の代わりに使う。戻り値は最終位置。
+        """
+        t0 = self._now()
+        t_end = t0 + self.gripper_timeout_s
+        start_pos = last_pos = None
+        still_since = t0
+        while True:
+            code, pos = self.arm.get_gripper_position()
+            if code != 0: raise Exception(f"Get gripper position failed (code: {code})")
+            self.state.update_gripper(pos)
+            now = self._now()
+            if abs(pos - target) <= self.gripper_tolerance:
+                return pos
+            if start_pos is None:
+                start_pos = pos
+            if last_pos is None or abs(pos - last_pos) > 1.0:
+                last_pos, still_since = pos, now
+            elif now - still_since >= self.gripper_stall_s:
+                # 動き出す前の停止は把持とみなさない（指令の立ち上がり遅れ対策）
+                moved = abs(pos - start_pos) > self.gripper_tolerance
+                if moved or now - t0 >= 3 * self.gripper_stall_s:
+                    return pos
+            if now >= t_end:
+                raise Exception(f"Gripper did not reach {target} (pos: {pos})")
+            self._sleep(self.gripper_poll_s)
+
+    def _traverse_to(self, x, y, roll, pitch, yaw, key: str | None = None, wait: bool = True) -> int:
+        """UP_Z での横移動。関節角キャッシュがあれば関節補間、無ければ直線補間"""
+        joints = self.joint_map.get(key, {}).get("up") if (key and self.joint_traverse) else None
+        if joints is not None:
+            return self.arm.set_servo_angle(angle=joints, speed=self.joint_speed,
+                                            mvacc=self.joint_acc, wait=wait)
+        return self.arm.set_position(x=x, y=y, z=self.UP_Z,
+                                     roll=roll, pitch=pitch, yaw=yaw, wait=wait)
+
+    def _preopen_gripper(self) -> bool:
+        """gripper_overlap でグリッパーが空と分かっていれば開き始めて True（移動中に物を落とさない）"""
+        if self.gripper_overlap and self.holding is False:
+            self._start_gripper(self.gripper_open_pos)
+            return True
+        return False
+
+    def _recover_if_error(self, force_ready: bool = False) -> None:
+        """
+        エラーがあればクリアしてモーションを再有効化する（force_ready ならエラーが無くても Ready を要求）。
+        復帰できなければ例外でピックを中断する。
+        """
+        err_code = self._error_code()
+        if err_code != 0: # エラーがある場合
+            print(f"Error detected: {err_code}")
+        result = self.recovery.ensure_ready(mode=0, force=force_ready)
+        if err_code != 0 or not result.ok:
+            self._recoveries.append(result.to_dict())
+        if not result.ok: raise Exception(f"Recovery failed: {result.reason}")
+
+    # ------------------------------------------------------------------
+    # 把持確認
+    # ------------------------------------------------------------------
+    def check_grasp(self, profile: dict | None = None) -> dict:
+        """
+        閉じた後のグリッパー位置（と電流）から把持を判定する。
+        電流はバックエンドが get_gripper_current を持つ場合のみ使う（xArm SDK 標準には無い）。
+        """
+        profile = profile or self._grasp_profile
+        code, pos = self.arm.get_gripper_position()
+        if code != 0: raise Exception(f"Get gripper position failed (code: {code})")
+        self.state.update_gripper(pos)
+
+        current = None
+        get_current = getattr(self.arm, "get_gripper_current", None)
+        if get_current is not None:
+            code, value = get_current()
+            current = value if code == 0 else None
+
+        reason = "grasped"
+        if pos <= profile["close_pos"] + profile["empty_margin"]:
+            reason = "closed on nothing"
+        elif profile.get("max_pos") is not None and pos > profile["max_pos"]:
+            reason = "stopped too wide"
+        elif profile.get("min_current") is not None and current is not None and current < profile["min_current"]:
+            reason = "no holding current"
+        return {
+            "ok": reason == "grasped",
+            "reason": reason,
+            "gripper_pos": round(float(pos), 2),
+            "current": current,
+        }
+
+    def _ensure_grasp(self, tx, ty, tr, tp, tyaw) -> None:
+        """
+        把持を確認し、空振りなら retry_offsets_mm だけずらして再下降・再把持する（最大 max_retries 回）。
+        結果は _grasp_result に残す。全て失敗したら開いて UP_Z に戻り GraspError を送出する。
+        """
+        profile = self._grasp_profile
+        if not self.verify_grasp:
+            return
+        check = self.check_grasp(profile)
+        checks = [check]
+        offsets = profile["retry_offsets_mm"][:profile["max_retries"]]
+        lift_z = self.DOWN_Z + profile["retry_lift_mm"]
+        for dx, dy in offsets:
+            if check["ok"]:
+                break
+            print(f"Grasp miss ({check['reason']}, pos={check['gripper_pos']}); retry with offset ({dx}, {dy})")
+            self._start_gripper(self.gripper_open_pos)
+            self._wait_gripper(self.gripper_open_pos)
+            for z in (lift_z, self.DOWN_Z):
+                code = self.arm.set_position(x=tx + dx, y=ty + dy, z=z,
+                                        roll=tr, pitch=tp, yaw=tyaw, wait=True)
+                if code != 0: raise Exception(f"Grasp retry move failed (code: {code})")
+            self._start_gripper(profile["close_pos"])
+            self._wait_gripper(profile["close_pos"])
+            check = self.check_grasp(profile)
+            check["offset_mm"] = [dx, dy]
+            checks.append(check)
+
+        self._grasp_result = {**check, "attempts": len(checks), "checks": checks}
+        if check["ok"]:
+            return
+
+        # クリーンに中断: 開いて UP_Z へ退避
+        print(f"Grasp failed after {len(checks)} attempts: {check['reason']}")
+        self._start_gripper(self.gripper_open_pos)
+        self._wait_gripper(self.gripper_open_pos)
+        self.holding = False
+        code = self.arm.set_position(x=tx, y=ty, z=self.UP_Z,
+                                roll=tr, pitch=tp, yaw=tyaw, wait=True)
+        if code != 0: raise Exception(f"Retreat after grasp failure failed (code: {code})")
+        raise GraspError(f"Grasp failed: {check['reason']} (gripper_pos={check['gripper_pos']}, attempts={len(checks)})")
+
+    def pick_at(self, x: float, y: float, object_type: str | None = None) -> tuple[bool, str]:
         """
         指定座標(x,y)のアイテムをピックする。
         【動作フロー】: (現在地) -> UP_Zへ移動 -> 横移動(UP_Z維持) -> DOWN_Zへ下降 -> 掴む -> UP_Zへ上昇
+        掴んだ後にグリッパー位置（と電流）で把持を確認し、空振りなら少しずらして掴み直す。
+        object_type で grasp_profiles.json の判定パラメータを選ぶ。結果は last_pick_report["grasp"]。
+        教示していないセル・小数セルはグリッドモデルの姿勢を使う。
         """
         if not self.connected or not self.arm:
             return False, "Robot not connected"
 
-        key = f"{x},{y}"
-        if key not in self.pose_map:
-            return False, f"Grid {key} not found"
+        try:
+            key, pose = self.cell_pose((x, y))
+        except ValueError as e:
+            return False, str(e)
+
+        with self.motion_lock:
+            return self._pick_pose(key, pose, object_type)
+
+    def pick_local(self, point, object_type: str | None = None) -> tuple[bool, str]:
+        """Unity の localPos（{"x", "y", "z"} [m]）の位置にあるアイテムをピックする"""
+        if not self.connected or not self.arm:
+            return False, "Robot not connected"
+        try:
+            key, pose = self.cell_pose(dict(point) if isinstance(point, dict) else dict(zip("xyz", point)))
+        except (ValueError, KeyError, TypeError) as e:
+            return False, f"Invalid localPos {point!r}: {e}"
 
-        # 設定値の固定
-        DOWN_Z = 179.3   # 下降時の高さ
-        UP_Z = 290.0     # 上昇・移動時の高さ
+        with self.motion_lock:
+            return self._pick_pose(key, pose, object_type)
 
+    def _pick_pose(self, key: str, target_pose: list, object_type: str | None = None) -> tuple[bool, str]:
+        """target_pose のアイテムを現在のモードでピックし、last_pick_report を更新する"""
         # 目標座標の取得 (x, y, roll, pitch, yaw を利用)
-        target_pose = self.pose_map[key]
         tx, ty, _, tr, tp, tyaw = target_pose 
 
+        self._phase_times = {}
+        self._recoveries = []
+        self._grasp_profile = self.grasp_profile(object_type)
+        self._grasp_result = None
+        if self.telemetry:
+            self.telemetry.begin_pick(key)
+        t_start = self._now()
         try:
-            # -------------------------------------------------
-            # 1. 安全高さへ移動 (Safety Lift) -> UP_Zへ
-            # -------------------------------------------------
-            code, curr_pose = self.arm.get_position()
-            if code != 0: raise Exception(f"Get position failed (code: {code})")
-            
+            if self.motion_mode == "blended":
+                self._pick_blended(tx, ty, tr, tp, tyaw, key)
+            else:
+                self._pick_stepwise(tx, ty, tr, tp, tyaw, key)
+            ok, msg = True, "Success"
+            if self._grasp_result and self._grasp_result["attempts"] > 1:
+                msg = f"Success (grasped on retry {self._grasp_result['attempts'] - 1})"
+        except Exception as e:
+            print(f"Pick Error: {e}")
+            ok, msg = False, str(e)
+        if self.telemetry:
+            self.telemetry.end_pick()
+            if not ok:
+                # 失敗したピックの直前から書き出す（原因調査用）
+                self.dump_telemetry(since=self.state.now() - (self._now() - t_start) - 1.0)
+
+        self.last_pick_report = {
+            "cell": key,
+            "object_type": object_type,
+            "grasp": self._grasp_result,
+            "mode": self.motion_mode,
+            "gripper_overlap": self.gripper_overlap,
+            "joint_traverse": self.joint_traverse and key in self.joint_map,
+            "ok": ok,
+            "total_s": round(self._now() - t_start, 4),
+            "phases_s": {k: round(v, 4) for k, v in self._phase_times.items()},
+            "recoveries": self._recoveries,
+        }
+        print(f"Pick cycle ({self.motion_mode}): {self.last_pick_report['total_s']:.2f}s {self.last_pick_report['phases_s']}")
+        return ok, msg
+
+    # ------------------------------------------------------------------
+    # 複数ピック
+    # ------------------------------------------------------------------
+    def _resolve_place(self, place) -> tuple[list | None, str | None]:
+        """
+        place をグリッドキー / (x, y) / 姿勢リストから ([x, y, z, roll, pitch, yaw], グリッドキー) に解決する
+        """
+        if place is None:
+            return None, None
+        if isinstance(place, str) or (isinstance(place, (list, tuple)) and len(place) == 2):
+            try:
+                key, pose = self.cell_pose(place)
+            except ValueError as e:
+                raise ValueError(f"Place: {e}")
+            pose[2] = self.DOWN_Z
+            return pose, key
+        if len(place) != 6:
+            raise ValueError(f"place must be a grid key or [x, y, z, roll, pitch, yaw]: {place!r}")
+        return list(place), None
+
+    def estimate_item_time(self) -> float:
+        """1 アイテムあたりの順序に依存しない時間（ピック・プレースの上下動とグリッパー）の見積もり"""
+        vertical = trapezoid_time(self.UP_Z - self.DOWN_Z, DEFAULT_TCP_SPEED, DEFAULT_TCP_ACC)
+        grip = gripper_move_time(self.gripper_open_pos, self.gripper_close_pos)
+        # ピック前の開動作は gripper_overlap 時は横移動に隠れる
+        pick = 2 * vertical + grip + (0.0 if self.gripper_overlap else grip)
+        place = 2 * vertical + grip
+        return pick + place
+
+    def _place_at(self, pose: list, key: str | None = None) -> None:
+        """把持中のアイテムを pose へ運んで離し、UP_Z へ戻る"""
+        px, py, pz, pr, pp, pyaw = pose
+        with self._phase("place"):
+            code = self._traverse_to(px, py, pr, pp, pyaw, key)
+            if code != 0: raise Exception(f"Move to place failed (code: {code})")
+            code = self.arm.set_position(x=px, y=py, z=pz,
+                                    roll=pr, pitch=pp, yaw=pyaw, wait=True)
+            if code != 0: raise Exception(f"Place descend failed (code: {code})")
+            if self.gripper_overlap:
+                self._start_gripper(self.gripper_open_pos)
+                self._wait_gripper(self.gripper_open_pos)
+            else:
+                self.arm.set_gripper_position(self.gripper_open_pos, wait=True)
+            self.holding = False
+            self._recover_if_error()
+            code = self.arm.set_position(x=px, y=py, z=self.UP_Z,
+                                    roll=pr, pitch=pp, yaw=pyaw, wait=True)
+            if code != 0: raise Exception(f"Place ascend failed (code: {code})")
+
+    def _plan_order(self, targets: dict, place_pose: list | None, place_key: str | None):
+        """関節角キャッシュが揃っていれば関節移動時間、無ければ直線移動時間で順序を決める"""
+        joints = self.state.get_joints(max_age=POSE_MAX_AGE)
+        if joints is None:
+            code, angles = self.arm.get_servo_angle()
+            joints = angles if code == 0 else None
+        keys = list(targets) + ([place_key] if place_pose is not None else [])
+        if self.joint_traverse and joints is not None and all(k in self.joint_map for k in keys):
+            up = {k: self.joint_map[k]["up"] for k in targets}
+            place_joints = self.joint_map[place_key]["up"] if place_pose is not None else None
+            return plan_pick_order(
+                joints, up, place_joints,
+                travel=lambda a, b: joint_move_time(a, b, self.joint_speed, self.joint_acc),
+            )
+        return plan_pick_order(self._current_pose(), targets, place_pose)
+
+    def pick_many(self, cells, place=None, object_type: str | None = None) -> tuple[bool, str]:
+        """
+        複数セルを水平移動時間が最短になる順（Robot.pick_planner）でピックし、place に置く。
+        ホームには戻らず連続で処理する。
+
+        cells: [(x, y), ...] または ["x,y", ...]（教示していないセル・小数セルはグリッドモデルの姿勢）
+               Unity の localPos {"x", "y", "z"} も混在できる
+        place: 置き場所。グリッドキー / (x, y) / [x, y, z, roll, pitch, yaw]。
+               None の場合は各アイテムを元のセルに戻す（動作確認用）。
+        結果（見積もり・実測のサイクルタイム、各アイテムのレポート）は last_pick_many_report に入る
+        （動き出す前に断った場合は空）。
+        """
+        self.last_pick_many_report = {}
+        if not self.connected or not self.arm:
+            return False, "Robot not connected"
+
+        # localPos はまとめて変換する
+        local = [c for c in cells if isinstance(c, dict)]
+        try:
+            converted = iter(self.local_poses(local) if local else [])
+        except (ValueError, KeyError, TypeError) as e:
+            return False, f"Invalid localPos: {e}"
+        targets, missing = {}, []
+        for c in cells:
+            try:
+                key, pose = next(converted) if isinstance(c, dict) else self.cell_pose(c)
+                targets.setdefault(key, pose)
+            except ValueError:
+                missing.append(c if isinstance(c, str) else
+                               ",".join(map(str, c)) if isinstance(c, (list, tuple)) else repr(c))
+        if missing:
+            return False, f"Grid {', '.join(missing)} not found"
+        try:
+            place_pose, place_key = self._resolve_place(place)
+        except ValueError as e:
+            return False, str(e)
+
+        with self.motion_lock:
+            # 前の動作が終わってから、その時点の姿勢で順序と見積もりを決める
+            plan = self._plan_order(targets, place_pose, place_key)
+            estimated = plan.travel_s + len(plan.order) * self.estimate_item_time()
+            print(f"Pick order ({plan.method}): {plan.order} est. {estimated:.2f}s")
+
+            items = []
+            ok, msg = True, "Success"
+            t_start = self._now()
+            for key in plan.order:
+                ok, msg = self._pick_pose(key, targets[key], object_type)
+                item = dict(self.last_pick_report)
+                if ok:
+                    t_place = self._now()
+                    try:
+                        dest, dest_key = place_pose, place_key
+                        if dest is None:
+                            dest, dest_key = list(targets[key]), key
+                            dest[2] = self.DOWN_Z
+                        self._place_at(dest, dest_key)
+                    except Exception as e:
+                        print(f"Place Error: {e}")
+                        ok, msg = False, str(e)
+                    item["place_s"] = round(self._now() - t_place, 4)
+                items.append(item)
+                if not ok:
+                    msg = f"{key}: {msg}"
+                    break
+
+        actual = self._now() - t_start
+        self.last_pick_many_report = {
+            "order": plan.order,
+            "method": plan.method,
+            "place": place_pose,
+            "ok": ok,
+            "completed": sum(1 for i in items if i["ok"]),
+            "estimated_s": round(estimated, 4),
+            "estimated_travel_s": round(plan.travel_s, 4),
+            "actual_s": round(actual, 4),
+            "items": items,
+        }
+        print(f"Pick many: {len(items)}/{len(plan.order)} items, est. {estimated:.2f}s actual {actual:.2f}s")
+        return ok, msg
+
+    def _pick_stepwise(self, tx, ty, tr, tp, tyaw, key: str | None = None) -> None:
+        """従来のシーケンス: 各ウェイポイントで停止しながら進む"""
+        UP_Z, DOWN_Z = self.UP_Z, self.DOWN_Z
+
+        # -------------------------------------------------
+        # 1. 安全高さへ移動 (Safety Lift) -> UP_Zへ
+        # -------------------------------------------------
+        with self._phase("lift"):
+            curr_pose = self._current_pose()
+
             curr_x, curr_y = curr_pose[0], curr_pose[1]
             curr_r, curr_p, curr_yaw = curr_pose[3], curr_pose[4], curr_pose[5]
 
@@ -207,55 +1002,123 @@ class XArmOperator:
             )
             if code != 0: raise Exception(f"Move to safe height failed (code: {code})")
 
-            # -------------------------------------------------
-            # 2. 空中移動 (Horizontal Move) -> 高さを290.0で維持
-            # -------------------------------------------------
+        # 空だと分かっているときだけ横移動中にグリッパーを開き始める
+        # （前のピックの物を持ったままなら、従来どおり目標の真上に着いてから開く）
+        preopen = self._preopen_gripper()
+
+        # -------------------------------------------------
+        # 2. 空中移動 (Horizontal Move) -> 高さを290.0で維持
+        # -------------------------------------------------
+        with self._phase("traverse"):
             print(f"Moving horizontally to {tx}, {ty} at Z={UP_Z}")
-            code = self.arm.set_position(x=tx, y=ty, z=UP_Z, 
-                                    roll=tr, pitch=tp, yaw=tyaw, wait=True)
+            code = self._traverse_to(tx, ty, tr, tp, tyaw, key)
             if code != 0: raise Exception(f"Horizontal move failed (code: {code})")
 
-            # -------------------------------------------------
-            # 3. ピッキング動作 (Pick Sequence)
-            # -------------------------------------------------
-            # グリッパーを開く
-            self.arm.set_gripper_position(self.gripper_open_pos, wait=True)
-     
-            err_code = self.arm.get_err_warn_code()
-            if err_code[1][0] != 0: # エラーがある場合
-                 print(f"Error detected: {err_code}")
-                 self.arm.clean_error()
-                 self.arm.motion_enable(True)
-            
-                 # ステートを強制的に0(Ready)に戻す
-                 self.arm.set_state(0)
-            time.sleep(0.5)  # 少し待つ
-            # 下りる (固定値 179.3 へ)
+        # -------------------------------------------------
+        # 3. ピッキング動作 (Pick Sequence)
+        # -------------------------------------------------
+        # グリッパーを開く
+        with self._phase("gripper_open"):
+            if self.gripper_overlap:
+                if not preopen:
+                    self._start_gripper(self.gripper_open_pos)
+                self._wait_gripper(self.gripper_open_pos)
+            else:
+                self.arm.set_gripper_position(self.gripper_open_pos, wait=True)
+                self._sleep(0.5)  # 少し待つ
+            self.holding = False
+            self._recover_if_error()
+
+        # 下りる (固定値 179.3 へ)
+        with self._phase("descend"):
             print(f"Moving down to Z={DOWN_Z}")
             code = self.arm.set_position(x=tx, y=ty, z=DOWN_Z, 
                                     roll=tr, pitch=tp, yaw=tyaw, wait=True)
-            
 
-            # 掴む
-            self.arm.set_gripper_position(self.gripper_close_pos, wait=True)
-            time.sleep(0.5)  # 少し待つ
-            err_code = self.arm.get_err_warn_code()
-            if err_code[1][0] != 0: # エラーがある場合
-                 print(f"Error detected: {err_code}")
-                 self.arm.clean_error()
-                 self.arm.motion_enable(True)
-            
-            # ステートを強制的に0(Ready)に戻す
-            self.arm.set_state(0)
+        # 掴む
+        with self._phase("grasp"):
+            close_pos = self._grasp_profile["close_pos"]
+            self.holding = None
+            if self.gripper_overlap:
+                self._start_gripper(close_pos)
+                self._wait_gripper(close_pos)
+            else:
+                self.arm.set_gripper_position(close_pos, wait=True)
+                self._sleep(0.5)  # 少し待つ
+            self._recover_if_error(force_ready=True)
 
-            # 上がる (固定値 290.0 へ)
+        # 掴めているか確認（空振りならずらして掴み直す / だめなら退避して中断）
+        with self._phase("verify"):
+            self._ensure_grasp(tx, ty, tr, tp, tyaw)
+            self.holding = True
+
+        # 上がる (固定値 290.0 へ)
+        with self._phase("ascend"):
             print(f"Moving up to Z={UP_Z}")
             code = self.arm.set_position(x=tx, y=ty, z=UP_Z, 
                                     roll=tr, pitch=tp, yaw=tyaw, wait=True)
             if code != 0: raise Exception(f"Move up failed (code: {code})")
 
-            return True, "Success"
+    def _pick_blended(self, tx, ty, tr, tp, tyaw, key: str | None = None) -> None:
+        """
+        連続軌道のシーケンス。
+        上昇と横移動を radius 付き・wait=False でキューし、コーナーで減速停止させない。
+        完了待ちはグリッパーが動く直前（目標真上・把持位置）だけ行い、固定 sleep は入れない。
+        gripper_overlap 時はグリッパーの開動作を上昇と同時に始め、横移動と並行させる。
+        """
+        UP_Z, DOWN_Z = self.UP_Z, self.DOWN_Z
 
-        except Exception as e:
-            print(f"Pick Error: {e}")
-            return False, str(e)
\ No newline at end of file
+        with self._phase("lift"):
+            curr_pose = self._current_pose()
+
+            print(f"Blend: lift to Z={UP_Z} (r={self.blend_radius})")
+            code = self.arm.set_position(
+                x=curr_pose[0], y=curr_pose[1], z=UP_Z,
+                roll=curr_pose[3], pitch=curr_pose[4], yaw=curr_pose[5],
+                radius=self.blend_radius, wait=False
+            )
+            if code != 0: raise Exception(f"Move to safe height failed (code: {code})")
+            preopen = self._preopen_gripper()
+
+        # 最後のウェイポイントを wait=True にすると、キュー済みの動作がすべて終わるまで待つ
+        with self._phase("traverse"):
+            print(f"Blend: traverse to {tx}, {ty} at Z={UP_Z}")
+            code = self._traverse_to(tx, ty, tr, tp, tyaw, key)
+            if code != 0: raise Exception(f"Horizontal move failed (code: {code})")
+
+        with self._phase("gripper_open"):
+            if self.gripper_overlap:
+                if not preopen:
+                    self._start_gripper(self.gripper_open_pos)
+                self._wait_gripper(self.gripper_open_pos)
+            else:
+                self.arm.set_gripper_position(self.gripper_open_pos, wait=True)
+            self.holding = False
+            self._recover_if_error()
+
+        with self._phase("descend"):
+            print(f"Blend: descend to Z={DOWN_Z}")
+            code = self.arm.set_position(x=tx, y=ty, z=DOWN_Z,
+                                    roll=tr, pitch=tp, yaw=tyaw, wait=True)
+            if code != 0: raise Exception(f"Move down failed (code: {code})")
+
+        with self._phase("grasp"):
+            close_pos = self._grasp_profile["close_pos"]
+            self.holding = None
+            if self.gripper_overlap:
+                self._start_gripper(close_pos)
+                self._wait_gripper(close_pos)
+            else:
+                self.arm.set_gripper_position(close_pos, wait=True)
+            # 従来どおり、閉じた後は Ready を要求する（グリッパー操作後の状態を揃える）
+            self._recover_if_error(force_ready=True)
+
+        with self._phase("verify"):
+            self._ensure_grasp(tx, ty, tr, tp, tyaw)
+            self.holding = True
+
+        with self._phase("ascend"):
+            print(f"Blend: ascend to Z={UP_Z}")
+            code = self.arm.set_position(x=tx, y=ty, z=UP_Z,
+                                    roll=tr, pitch=tp, yaw=tyaw, wait=True)
+            if code != 0: raise Exception(f"Move up failed (code: {code})")
@@ -0,0 +1,159 @@
+"""オペレータコンソール（サーバを動かしている端末・ローカル TCP からのコマンド入力）。
+
+入力元ごとに専用の読み取り手段を使い、受け取ったコマンドを asyncio.Queue に積む。
+ディスパッチ側は queue.get() で待つだけなので、入力が無い間は一切起きない。
+
+  key  : 端末から 1 キーずつ（Enter 不要）。Windows は msvcrt.getwch、
+         それ以外は termios の cbreak モードでブロッキング読み取り（専用スレッド）
+  line : 1 行 1 コマンド（stdin が端末でないとき。"w" / "space" / "j" など）
+  off  : stdin を読まない（ヘッドレス運用。TCP か POST /console（OPERATOR_CONSOLE_HTTP=1）を使う）
+  TCP  : OPERATOR_CONSOLE_PORT を設定すると 127.0.0.1 で待ち受け、1 行 1 コマンドを受ける
+         例: echo j | nc 127.0.0.1 8765
+
+  console = OperatorConsole(handle_console_command)
+  await console.start()        # lifespan の起動時
+  console.submit("j")          # 他の経路（HTTP など）から
+  await console.stop()
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+from typing import Awaitable, Callable, Optional
+
+CONSOLE_MODES = ("auto", "key", "line", "off")
+OPERATOR_CONSOLE = os.getenv("OPERATOR_CONSOLE", "auto")
+OPERATOR_CONSOLE_PORT = os.getenv("OPERATOR_CONSOLE_PORT")        # 未設定なら TCP は使わない
+OPERATOR_CONSOLE_HOST = os.getenv("OPERATOR_CONSOLE_HOST", "127.0.0.1")
+
+
+def normalize_command(text: str) -> Optional[str]:
+    """" " / "space" -> "space"、それ以外は小文字にして前後の空白を除く。空なら None"""
+    if text.strip() == "":
+        return "space" if " " in text else None
+    return text.strip().lower()
+
+
+class OperatorConsole:
+    def __init__(
+        self,
+        handler: Callable[[str], Awaitable[None]],
+        mode: str = OPERATOR_CONSOLE,
+        tcp_port: Optional[int] = int(OPERATOR_CONSOLE_PORT) if OPERATOR_CONSOLE_PORT else None,
+        tcp_host: str = OPERATOR_CONSOLE_HOST,
+    ):
+        if mode not in CONSOLE_MODES:
+            raise ValueError(f"mode must be one of {CONSOLE_MODES}: {mode!r}")
+        self.handler = handler
+        self.mode = mode
+        self.tcp_port = tcp_port
+        self.tcp_host = tcp_host
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._restore_tty: Optional[Callable[[], None]] = None
+
+    # ------------------------------------------------------------------
+    # 起動・停止
+    # ------------------------------------------------------------------
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        mode = self.mode
+        if mode == "auto":
+            mode = "key" if sys.stdin is not None and sys.stdin.isatty() else "line"
+        if mode == "key":
+            reader = self._read_keys_windows if sys.platform == "win32" else self._read_keys_posix
+            threading.Thread(target=reader, name="operator-console", daemon=True).start()
+            print("【操作方法】w / r / space / j(JSON送信)")
+        elif mode == "line" and sys.stdin is not None:
+            threading.Thread(target=self._read_lines, name="operator-console", daemon=True).start()
+            print("【操作方法】w / r / space / j(JSON送信) を入力して Enter")
+        if self.tcp_port:
+            self._server = await asyncio.start_server(self._serve_tcp, self.tcp_host, self.tcp_port)
+            print(f"【Console】TCP {self.tcp_host}:{self.tcp_port} でコマンドを受け付けます")
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._task is not None:
+            self._task.cancel()
+        if self._restore_tty is not None:
+            self._restore_tty()
+            self._restore_tty = None
+
+    # ------------------------------------------------------------------
+    # 入力（読み取りスレッド / TCP）
+    # ------------------------------------------------------------------
+    def submit(self, text: str) -> Optional[str]:
+        """コマンドを積む（イベントループのスレッドから）。積んだコマンドを返す"""
+        command = normalize_command(text)
+        if command:
+            self._queue.put_nowait(command)
+        return command
+
+    def _submit_threadsafe(self, text: str) -> None:
+        self._loop.call_soon_threadsafe(self.submit, text)
+
+    def _read_keys_windows(self) -> None:
+        import msvcrt
+
+        while True:
+            ch = msvcrt.getwch()   # キーが押されるまでブロックする
+            if ch in ("\x00", "\xe0"):
+                msvcrt.getwch()    # 矢印・ファンクションキーの 2 文字目は捨てる
+                continue
+            self._submit_threadsafe(ch)
+
+    def _read_keys_posix(self) -> None:
+        import termios
+        import tty
+
+        fd = sys.stdin.fileno()
+        saved = termios.tcgetattr(fd)
+        tty.setcbreak(fd)   # Enter 不要・エコーなし（Ctrl+C は効く）
+        self._restore_tty = lambda: termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+        try:
+            while True:
+                data = os.read(fd, 32)
+                if not data:
+                    return
+                if data.startswith(b"\x1b"):
+                    continue       # 矢印などのエスケープシーケンスは 1 回の read でまとめて捨てる
+                for ch in data.decode("utf-8", errors="ignore"):
+                    self._submit_threadsafe(ch)
+        finally:
+            if self._restore_tty is not None:
+                self._restore_tty()
+
+    def _read_lines(self) -> None:
+        for line in sys.stdin:
+            self._submit_threadsafe(line.rstrip("\r\n"))
+        # EOF（/dev/null など）なら何もしないで終わる
+
+    async def _serve_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                command = self.submit(line.decode("utf-8", errors="ignore").rstrip("\r\n"))
+                if command:
+                    writer.write(f"ok {command}\n".encode("utf-8"))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # ------------------------------------------------------------------
+    # ディスパッチ
+    # ------------------------------------------------------------------
+    async def _dispatch(self) -> None:
+        while True:
+            command = await self._queue.get()
+            try:
+                await self.handler(command)
+            except Exception as e:
+                print(f"【Console】コマンド {command!r} の処理に失敗: {e!r}")
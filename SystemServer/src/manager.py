@@ -1,102 +1,310 @@
 import asyncio
-import json
-import msvcrt
-from fastapi import WebSocket
-from utils import load_latest_grid_json, load_robot_marker_config
+import os
+from array import array
+from collections import deque
+from typing import Any, Dict, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from protocol import decode_frame, encode_frame, negotiate, split_legacy
+from utils import CachedConfig, load_grid_entry, load_robot_marker_entry
+
+# 遅いクライアントへの対処（送信キューが max_queue に達したとき）
+#   drop_oldest: いちばん古いメッセージを捨てる
+#   coalesce   : 同じ eventId のメッセージはキュー内で最新の 1 件に置き換える（状態系向け）。
+#                それでも溢れたら古いものを捨てる
+#   disconnect : その接続を切る（再接続してもらう）
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5.0"))  # これ以上 send が返らなければ切断
+LATENCY_WINDOW = 256
+
+
+class ClientConnection:
+    """1 接続ぶんの送信キューと送信タスク。enqueue() は待たずに戻る"""
+
+    def __init__(self, websocket: WebSocket, policy: str = WS_SLOW_POLICY, max_queue: int = WS_QUEUE_SIZE,
+                 send_timeout: float = WS_SEND_TIMEOUT, encoding: str = "legacy"):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"policy must be one of {SLOW_CONSUMER_POLICIES}: {policy!r}")
+        self.websocket = websocket
+        self.policy = policy
+        self.max_queue = max(1, max_queue)
+        self.send_timeout = send_timeout
+        self.encoding = encoding              # protocol.ENCODERS のキー（接続時に決まる）
+        self.topics: set[str] = set()         # 購読中の状態配信トピック（state_stream.TOPICS）
+        self.closed = False
+        self._queue: deque = deque()          # (eventId, フレーム, キューに入れた時刻)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_close = None
+
+        # 指標
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.bytes_sent = 0
+        self._latency = array("d", bytes(8 * LATENCY_WINDOW))   # キュー投入から送信完了まで [s]
+        self._n_latency = 0
+
+    def start(self, on_close) -> None:
+        self._on_close = on_close
+        self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, frame: str | bytes, event_id: Optional[str] = None) -> bool:
+        """送信キューに積む。切断したら False"""
+        if self.closed:
+            return False
+        queue = self._queue
+        if self.policy == "coalesce" and event_id is not None:
+            for i, item in enumerate(queue):
+                if item[0] == event_id:
+                    # 順番は保ったまま中身だけ最新にする（待ち時間は古い方から数える）
+                    queue[i] = (event_id, frame, item[2])
+                    self.coalesced += 1
+                    return True
+        if len(queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                print(f"【WS】送信キューが溢れたため切断します（{self.max_queue} 件）")
+                self.close(code=1013)
+                return False
+            queue.popleft()
+            self.dropped += 1
+        queue.append((event_id, frame, asyncio.get_running_loop().time()))
+        self.max_depth = max(self.max_depth, len(queue))
+        self._wakeup.set()
+        return True
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                _, frame, t_enqueued = self._queue.popleft()
+                send = self.websocket.send_bytes(frame) if isinstance(frame, bytes) else self.websocket.send_text(frame)
+                await asyncio.wait_for(send, self.send_timeout)
+                self.sent += 1
+                self.bytes_sent += len(frame)
+                self._latency[self._n_latency % LATENCY_WINDOW] = loop.time() - t_enqueued
+                self._n_latency += 1
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            print(f"【WS】送信が {self.send_timeout:.1f}s 返らないため切断します")
+            self.close(code=1011)
+        except Exception as e:
+            print(f"【WS】送信失敗のため切断します: {e!r}")
+            self.close()
+
+    def close(self, code: Optional[int] = None) -> None:
+        """送信をやめて管理から外す。code を渡すとソケットも閉じる"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._wakeup.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+        if self._on_close:
+            self._on_close(self)
+
+    async def _close_socket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def metrics(self) -> Dict[str, Any]:
+        n = min(self._n_latency, LATENCY_WINDOW)
+        lat = sorted(self._latency[:n])
+        client = getattr(self.websocket, "client", None)
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "policy": self.policy,
+            "encoding": self.encoding,
+            "topics": sorted(self.topics),
+            "queue_depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "latency_ms": {
+                "p50": round(1000 * lat[n // 2], 3) if n else None,
+                "p95": round(1000 * lat[min(n - 1, int(0.95 * n))], 3) if n else None,
+                "max": round(1000 * lat[-1], 3) if n else None,
+            },
+        }
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        # WebSocket は Mapping 扱いでハッシュできないので、リストで持って is で探す
+        self.clients: list[ClientConnection] = []
+        self.broadcasts = 0
+        self.disconnects = 0
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return [c.websocket for c in self.clients]
+
+    def _find(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        return next((c for c in self.clients if c.websocket is websocket), None)
+
+    async def connect(self, websocket: WebSocket, policy: Optional[str] = None, max_queue: Optional[int] = None):
+        # メッセージ形式はサブプロトコル（または ?protocol=）で決める。どちらも無ければ legacy
+        offered = (websocket.headers.get("sec-websocket-protocol") or "").split(",")
+        encoding, subprotocol = negotiate([o for o in offered if o.strip()], websocket.query_params.get("protocol"))
+        await websocket.accept(subprotocol=subprotocol)
+        client = ClientConnection(websocket, policy=policy or WS_SLOW_POLICY, max_queue=max_queue or WS_QUEUE_SIZE,
+                                  encoding=encoding)
+        self.clients.append(client)
+        client.start(self._closed)
+        return client
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    def _closed(self, client: ClientConnection) -> None:
+        if client in self.clients:
+            self.clients.remove(client)
+            self.disconnects += 1
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self._find(websocket)
+        if client is not None:
+            client.close()
+
+    async def receive(self, websocket: WebSocket) -> tuple[Optional[str], Any]:
+        """次のメッセージを (eventId, payload オブジェクト) で返す（形式は問わない）"""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        frame = message.get("text")
+        return decode_frame(frame if frame is not None else message.get("bytes"))
+
+    async def send_event(self, websocket: WebSocket, event_id: str, payload: Any) -> bool:
+        """1 クライアントへ送る（ブロードキャストと同じ送信キューを通るので順序が保たれる）"""
+        client = self._find(websocket)
+        if client is None:
+            return False
+        return client.enqueue(encode_frame(client.encoding, event_id, payload), event_id)
+
+    async def broadcast_event(self, event_id: str, payload: Any, frames: Optional[Dict[str, str | bytes]] = None):
+        """
+        形式ごとに 1 回だけエンコードして全クライアントのキューに積む（送信は各クライアントのタスクが並行して行う）。
+        frames を渡すとエンコード結果をそこに残し、次回からは使い回す（内容が変わらない設定の再送など）
+        """
+        self.broadcasts += 1
+        self._fan_out(list(self.clients), event_id, payload, {} if frames is None else frames)
+
+    async def publish(self, topic: str, event_id: str, payload: Any) -> int:
+        """topic を購読しているクライアントにだけ送る（状態配信用）。送った数を返す"""
+        clients = [c for c in self.clients if topic in c.topics]
+        self._fan_out(clients, event_id, payload, {})
+        return len(clients)
+
+    @staticmethod
+    def _fan_out(clients: list[ClientConnection], event_id: str, payload: Any, frames: Dict[str, str | bytes]) -> None:
+        for client in clients:
+            frame = frames.get(client.encoding)
+            if frame is None:
+                frame = frames[client.encoding] = encode_frame(client.encoding, event_id, payload)
+            client.enqueue(frame, event_id)
+
+    def subscribe(self, websocket: WebSocket, topics) -> set[str]:
+        client = self._find(websocket)
+        if client is None:
+            return set()
+        client.topics.update(topics)
+        return client.topics
+
+    def unsubscribe(self, websocket: WebSocket, topics) -> set[str]:
+        client = self._find(websocket)
+        if client is None:
+            return set()
+        client.topics.difference_update(topics)
+        return client.topics
+
+    def subscribed_topics(self) -> set[str]:
+        return set().union(*(c.topics for c in self.clients))
+
+    def subscriber_count(self, topic: str) -> int:
+        return sum(1 for c in self.clients if topic in c.topics)
+
+    async def send(self, websocket: WebSocket, message: dict) -> bool:
+        """従来形式の dict（payload が JSON 文字列）で送る"""
+        return await self.send_event(websocket, *split_legacy(message))
 
     async def broadcast(self, message: dict):
-        json_str = json.dumps(message)
-        for connection in self.active_connections[:]:
-            try:
-                await connection.send_text(json_str)
-            except:
-                self.active_connections.remove(connection)
+        """従来形式の dict（payload が JSON 文字列）でブロードキャストする"""
+        await self.broadcast_event(*split_legacy(message))
+
+    def metrics(self) -> Dict[str, Any]:
+        clients = [c.metrics() for c in self.clients]
+        return {
+            "connections": len(clients),
+            "broadcasts": self.broadcasts,
+            "disconnects": self.disconnects,
+            "queue_depth": sum(c["queue_depth"] for c in clients),
+            "dropped": sum(c["dropped"] for c in clients),
+            "clients": clients,
+        }
+
+def _grid_payload(entry: CachedConfig) -> Dict[str, Any]:
+    return {"type": "grid_config", "filename": entry.filename, "gridPoints": entry.data}
+
+
+def _robot_marker_payload(entry: CachedConfig) -> Dict[str, Any]:
+    return {"type": "robot_marker_config", "filename": entry.filename, "markerData": entry.data}
+
+
+async def broadcast_config(event_id: str, entry: CachedConfig, build_payload) -> None:
+    """キャッシュ済みの設定を送る。エンコード済みパケットは entry.frames に残り、保存し直すまで使い回す"""
+    await manager.broadcast_event(event_id, build_payload(entry), frames=entry.frames)
+
 
 async def send_json_grid():
-    latest = load_latest_grid_json()
+    latest = load_grid_entry()
     if latest and manager.active_connections:
-        payload = {"type": "grid_config", "filename": latest["filename"], "gridPoints": latest["data"]}
-        packet = {"eventId": "RestoreGridConfig", "payload": json.dumps(payload)}
         print("Sending latest grid config...")
-        await manager.broadcast(packet)
-        print(f"✅ Grid JSON送信: {latest['filename']}")
+        await broadcast_config("RestoreGridConfig", latest, _grid_payload)
+        print(f"✅ Grid JSON送信: {latest.filename}")
     else:
         print("No active connections to send the grid config.")
 
 
 manager = ConnectionManager()
 
-async def keyboard_monitor_loop():
-    print("【操作方法】w / r / space / j(JSON送信)")
-    while True:
-        if msvcrt.kbhit():
-            key_bytes = msvcrt.getch()
-
-            # Extended keys (arrows, function keys, etc.) are a 2-byte sequence.
-            # Swallow and ignore them to avoid decode errors.
-            if key_bytes in (b"\x00", b"\xe0"):
-                _ = msvcrt.getch()
-                await asyncio.sleep(0.05)
-                continue
-
-            # For our command keys we only need ASCII.
-            # Fall back to a tolerant decode for non-ASCII bytes.
-            try:
-                key = key_bytes.decode("ascii")
-            except UnicodeDecodeError:
-                key = key_bytes.decode("cp932", errors="ignore")
-
-            key = key.lower()
-            if not key:
-                await asyncio.sleep(0.05)
-                continue
-
-            if key == " ":
-                key = "space"
-
-            if key == "j":
-                latest = load_latest_grid_json()
-                robot_marker = load_robot_marker_config()
-                
-                if manager.active_connections:
-                    # Grid設定を送信
-                    if latest:
-                        payload = {"type": "grid_config", "filename": latest["filename"], "gridPoints": latest["data"]}
-                        packet = {"eventId": "RestoreGridConfig", "payload": json.dumps(payload)}
-                        await manager.broadcast(packet)
-                        print(f"✅ Grid JSON送信: {latest['filename']}")
-                    else:
-                        print("⚠️ Grid設定が見つかりません")
-                    
-                    # ロボットマーカー設定を送信
-                    if robot_marker:
-                        payload = {"type": "robot_marker_config", "filename": robot_marker["filename"], "markerData": robot_marker["data"]}
-                        packet = {"eventId": "RestoreRobotMarkerConfig", "payload": json.dumps(payload)}
-                        await manager.broadcast(packet)
-                        print(f"✅ Robot Marker JSON送信: {robot_marker['filename']}")
-                    else:
-                        print("⚠️ ロボットマーカー設定が見つかりません")
-                else:
-                    print("No active connections to send the config.")
+async def handle_console_command(key: str):
+    """オペレータコンソール（console.OperatorConsole）からのコマンド: j は設定の送信、それ以外は KeyInput"""
+    if key == "j":
+        latest = load_grid_entry()
+        robot_marker = load_robot_marker_entry()
+
+        if manager.active_connections:
+            # Grid設定を送信
+            if latest:
+                await broadcast_config("RestoreGridConfig", latest, _grid_payload)
+                print(f"✅ Grid JSON送信: {latest.filename}")
             else:
-                if manager.active_connections:
-
-                    data = {"type": "key", "key": key}
-                    packet = {"eventId": "KeyInput", "payload": json.dumps(data)}
-                    await manager.broadcast(packet)
-                    print(f"送信: {key}")
-                else:
-                    print("No active connections to send the key input.")
-        await asyncio.sleep(0.05)
\ No newline at end of file
+                print("⚠️ Grid設定が見つかりません")
+
+            # ロボットマーカー設定を送信
+            if robot_marker:
+                await broadcast_config("RestoreRobotMarkerConfig", robot_marker, _robot_marker_payload)
+                print(f"✅ Robot Marker JSON送信: {robot_marker.filename}")
+            else:
+                print("⚠️ ロボットマーカー設定が見つかりません")
+        else:
+            print("No active connections to send the config.")
+    else:
+        if manager.active_connections:
+
+            data = {"type": "key", "key": key}
+            await manager.broadcast_event("KeyInput", data)
+            print(f"送信: {key}")
+        else:
+            print("No active connections to send the key input.")
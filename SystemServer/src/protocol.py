@@ -0,0 +1,255 @@
+"""Unity <-> server.py の WebSocket メッセージ形式（エンベロープ）。
+
+legacy（従来）: テキスト {"eventId": E, "payload": "<JSON 文字列>"}
+  payload が dict のときは json.dumps した文字列を入れる（JSON の中に JSON）。
+  dict 以外（XarmPickResult の [ok, msg] など）は従来どおりそのまま入れる。
+v1.json      : テキスト {"v": 1, "eventId": E, "payload": <オブジェクト>}（1 回だけエンコード）
+v1.msgpack   : バイナリ。上と同じマップを MessagePack で。msgpack パッケージがあればそれを、
+               無ければ下の最小実装（nil / bool / int / float64 / str / bin / array / map）を使う
+
+接続時のネゴシエーション（どちらも無ければ legacy）:
+  - WebSocket サブプロトコル: Sec-WebSocket-Protocol: xarm.v1.msgpack, xarm.v1.json
+    （クライアントの希望順で、サーバが対応している最初のものを選ぶ）
+  - クエリ: ws://host:port/?protocol=v1.msgpack
+
+受信側は形式によらず decode_frame() で (eventId, payload オブジェクト) にする
+（バイナリなら msgpack、"v" があれば v1、無ければ legacy として payload 文字列を 1 段ほどく）。
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+PROTOCOL_VERSION = 1
+SUBPROTOCOL_PREFIX = "xarm."
+Frame = Union[str, bytes]
+
+try:
+    import msgpack as _msgpack
+except ImportError:   # 任意依存。無ければ下の実装を使う
+    _msgpack = None
+
+
+# ----------------------------------------------------------------------
+# MessagePack（最小実装）
+# ----------------------------------------------------------------------
+def _pack(obj: Any, out: bytearray) -> None:
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif obj > 0:
+            # 収まる最小の符号なし整数
+            for tag, fmt, limit in ((0xCC, ">B", 1 << 8), (0xCD, ">H", 1 << 16), (0xCE, ">I", 1 << 32), (0xCF, ">Q", 1 << 64)):
+                if obj < limit:
+                    out.append(tag)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise OverflowError(f"int too large for msgpack: {obj}")
+        else:
+            for tag, fmt, limit in ((0xD0, ">b", 1 << 7), (0xD1, ">h", 1 << 15), (0xD2, ">i", 1 << 31), (0xD3, ">q", 1 << 63)):
+                if obj >= -limit:
+                    out.append(tag)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise OverflowError(f"int too small for msgpack: {obj}")
+    elif isinstance(obj, float):
+        out += b"\xcb" + struct.pack(">d", obj)
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        n = len(data)
+        if n < 32:
+            out.append(0xA0 | n)
+        elif n < 0x100:
+            out += bytes((0xD9, n))
+        elif n < 0x10000:
+            out += b"\xda" + struct.pack(">H", n)
+        else:
+            out += b"\xdb" + struct.pack(">I", n)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n < 0x100:
+            out += bytes((0xC4, n))
+        elif n < 0x10000:
+            out += b"\xc5" + struct.pack(">H", n)
+        else:
+            out += b"\xc6" + struct.pack(">I", n)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += b"\xdc" + struct.pack(">H", n)
+        else:
+            out += b"\xdd" + struct.pack(">I", n)
+        for v in obj:
+            _pack(v, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += b"\xde" + struct.pack(">H", n)
+        else:
+            out += b"\xdf" + struct.pack(">I", n)
+        for k, v in obj.items():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError(f"cannot pack {type(obj).__name__}")
+
+
+# 固定長の型: 先頭バイト -> (struct 形式, バイト数)
+_FIXED = {
+    0xCA: (">f", 4), 0xCB: (">d", 8),
+    0xCC: (">B", 1), 0xCD: (">H", 2), 0xCE: (">I", 4), 0xCF: (">Q", 8),
+    0xD0: (">b", 1), 0xD1: (">h", 2), 0xD2: (">i", 4), 0xD3: (">q", 8),
+}
+# 長さ付きの型: 先頭バイト -> (種類, 長さの struct 形式, バイト数)
+_SIZED = {
+    0xD9: ("str", ">B", 1), 0xDA: ("str", ">H", 2), 0xDB: ("str", ">I", 4),
+    0xC4: ("bin", ">B", 1), 0xC5: ("bin", ">H", 2), 0xC6: ("bin", ">I", 4),
+    0xDC: ("array", ">H", 2), 0xDD: ("array", ">I", 4),
+    0xDE: ("map", ">H", 2), 0xDF: ("map", ">I", 4),
+}
+
+
+def _unpack(data: bytes, i: int) -> Tuple[Any, int]:
+    b = data[i]
+    i += 1
+    if b < 0x80:
+        return b, i
+    if b >= 0xE0:
+        return b - 0x100, i
+    if 0xA0 <= b <= 0xBF:
+        n = b & 0x1F
+        return data[i:i + n].decode("utf-8"), i + n
+    if 0x90 <= b <= 0x9F:
+        kind, n = "array", b & 0x0F
+    elif 0x80 <= b <= 0x8F:
+        kind, n = "map", b & 0x0F
+    elif b == 0xC0:
+        return None, i
+    elif b in (0xC2, 0xC3):
+        return b == 0xC3, i
+    elif b in _FIXED:
+        fmt, size = _FIXED[b]
+        return struct.unpack_from(fmt, data, i)[0], i + size
+    elif b in _SIZED:
+        kind, fmt, size = _SIZED[b]
+        n = struct.unpack_from(fmt, data, i)[0]
+        i += size
+        if kind == "str":
+            return data[i:i + n].decode("utf-8"), i + n
+        if kind == "bin":
+            return bytes(data[i:i + n]), i + n
+    else:
+        raise ValueError(f"unsupported msgpack type 0x{b:02x}")
+    if kind == "array":
+        items = []
+        for _ in range(n):
+            v, i = _unpack(data, i)
+            items.append(v)
+        return items, i
+    obj = {}
+    for _ in range(n):
+        k, i = _unpack(data, i)
+        obj[k], i = _unpack(data, i)
+    return obj, i
+
+
+def packb(obj: Any) -> bytes:
+    if _msgpack is not None:
+        return _msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def unpackb(data: bytes) -> Any:
+    if _msgpack is not None:
+        return _msgpack.unpackb(data, raw=False)
+    obj, end = _unpack(data, 0)
+    if end != len(data):
+        raise ValueError(f"trailing bytes after msgpack object ({len(data) - end})")
+    return obj
+
+
+# ----------------------------------------------------------------------
+# エンベロープ
+# ----------------------------------------------------------------------
+def _encode_legacy(event_id: str, payload: Any) -> str:
+    if isinstance(payload, dict):
+        payload = json.dumps(payload)
+    return json.dumps({"eventId": event_id, "payload": payload})
+
+
+def _encode_v1_json(event_id: str, payload: Any) -> str:
+    return json.dumps({"v": PROTOCOL_VERSION, "eventId": event_id, "payload": payload})
+
+
+def _encode_v1_msgpack(event_id: str, payload: Any) -> bytes:
+    return packb({"v": PROTOCOL_VERSION, "eventId": event_id, "payload": payload})
+
+
+ENCODERS: Dict[str, Callable[[str, Any], Frame]] = {
+    "legacy": _encode_legacy,
+    "v1.json": _encode_v1_json,
+    "v1.msgpack": _encode_v1_msgpack,
+}
+
+
+def encode_frame(encoding: str, event_id: str, payload: Any) -> Frame:
+    return ENCODERS[encoding](event_id, payload)
+
+
+def decode_frame(frame: Frame) -> Tuple[Optional[str], Any]:
+    """どの形式のフレームでも (eventId, payload オブジェクト) にする"""
+    if isinstance(frame, (bytes, bytearray)):
+        message = unpackb(bytes(frame))
+    else:
+        message = json.loads(frame)
+    if not isinstance(message, dict):
+        raise ValueError("message must be an object")
+    payload = message.get("payload")
+    if "v" not in message and isinstance(payload, str):
+        # legacy: JSON 文字列の payload を 1 段ほどく（空文字は空オブジェクト扱い）
+        payload = json.loads(payload) if payload.strip() else {}
+    return message.get("eventId"), payload
+
+
+def split_legacy(message: Dict[str, Any]) -> Tuple[Optional[str], Any]:
+    """従来形式で組み立てた dict（payload が JSON 文字列）を (eventId, payload オブジェクト) にする"""
+    payload = message.get("payload")
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            pass
+    return message.get("eventId"), payload
+
+
+def negotiate(offered: Iterable[str] = (), requested: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    (使う形式, accept に渡すサブプロトコル) を返す。
+    offered: クライアントが Sec-WebSocket-Protocol で出した候補、requested: ?protocol= の値
+    """
+    for sub in offered:
+        sub = sub.strip()
+        if sub.startswith(SUBPROTOCOL_PREFIX) and sub[len(SUBPROTOCOL_PREFIX):] in ENCODERS:
+            return sub[len(SUBPROTOCOL_PREFIX):], sub
+    if requested in ENCODERS:
+        return requested, None
+    return "legacy", None
@@ -1,23 +1,25 @@
 import asyncio
+import ipaddress
 import json
 import os
 import traceback
 from typing import Dict, Optional, List
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, BackgroundTasks, HTTPException
 from contextlib import asynccontextmanager
 from Calculator.AgentObjectSelectorCalculator import *
-from LLM_Agent.agent import classify_reference_frame, decide_selection_rule, execute_decision
+from LLM_Agent.agent import LLMDecision, classify_reference_frame, decide_selection_rule, execute_decision
+from LLM_Agent.paraphrase_cache import paraphrase_cache
+from LLM_Agent.usage import set_endpoint
 from manager import send_json_grid
-from manager import manager, keyboard_monitor_loop
+from console import OperatorConsole
+from state_stream import StateStreamer
+from manager import SLOW_CONSUMER_POLICIES, handle_console_command, manager
 from utils import save_grid_to_file, save_robot_marker_config
 # from models import CommandRequest, XarmPickRequest
 # from SpatialCalculator import SpatialCalculator
 
-try:
-    from XARmOperator import XArmOperator
-except ModuleNotFoundError as e:
-    XArmOperator = None  # type: ignore[assignment]
-    _XARM_IMPORT_ERROR = e
+from Robot.health import RobotHealthMonitor
+from Robot.sim_xarm import is_sim_address
 # --- 初期化 ---
 def _env_flag(name: str, default: bool = True) -> bool:
     raw = os.getenv(name)
@@ -27,8 +29,89 @@ def _env_flag(name: str, default: bool = True) -> bool:
 
 XARM_ENABLE = _env_flag("XARM_ENABLE", default=True)
 XARM_IP = os.getenv("XARM_IP", "192.168.1.199")
+XARM_MOTION_MODE = os.getenv("XARM_MOTION_MODE", "stepwise")  # stepwise / blended
+XARM_BACKEND = os.getenv("XARM_BACKEND", "real")  # real / sim（sim は実機なしで動作確認）
+# グリッドの列数,行数（例: "8,8"）。教示セルの範囲外もグリッドモデルで受け付ける
+XARM_GRID_SIZE = os.getenv("XARM_GRID_SIZE")
+# 動作テレメトリを記録する（失敗したピックは XARM_TELEMETRY_DIR に書き出す）
+XARM_TELEMETRY = _env_flag("XARM_TELEMETRY", default=False)
+XARM_TELEMETRY_DIR = os.getenv("XARM_TELEMETRY_DIR", "telemetry")
+
+try:
+    from XARmOperator import XArmOperator
+    if XARM_BACKEND != "sim" and not is_sim_address(XARM_IP):
+        # create_arm は SDK を遅延 import するので、実機を使うときは起動時に有無を確かめる
+        import xarm  # noqa: F401
+except ModuleNotFoundError as e:
+    XArmOperator = None  # type: ignore[assignment]
+    _XARM_IMPORT_ERROR = e
 
-robot = XArmOperator(ip=XARM_IP) if (XArmOperator and XARM_ENABLE) else None
+robot = (
+    XArmOperator(
+        ip=XARM_IP,
+        motion_mode=XARM_MOTION_MODE,
+        backend=XARM_BACKEND,
+        grid_size=tuple(int(v) for v in XARM_GRID_SIZE.split(",")) if XARM_GRID_SIZE else None,
+        telemetry=XARM_TELEMETRY,
+        telemetry_dir=XARM_TELEMETRY_DIR,
+    )
+    if (XArmOperator and XARM_ENABLE) else None
+)
+
+# 接続・コントローラ状態の監視（通信断は指数バックオフで自動再接続）
+XARM_HEALTH_INTERVAL = float(os.getenv("XARM_HEALTH_INTERVAL", "1.0"))
+# ロボットが ok でないときのピック要求: "reject"（即エラー）/ "queue"（復帰を待つ）
+XARM_PICK_WHEN_UNHEALTHY = os.getenv("XARM_PICK_WHEN_UNHEALTHY", "queue")
+XARM_PICK_QUEUE_TIMEOUT = float(os.getenv("XARM_PICK_QUEUE_TIMEOUT", "30.0"))
+
+robot_health = RobotHealthMonitor(robot, interval=XARM_HEALTH_INTERVAL) if robot is not None else None
+
+# 端末（OPERATOR_CONSOLE=auto/key/line/off）・ローカル TCP（OPERATOR_CONSOLE_PORT）からの w / r / space / j
+console = OperatorConsole(handle_console_command)
+# POST /console（ヘッドレス運用向け）。有効にしても同じマシン（ループバック）からしか受け付けない
+OPERATOR_CONSOLE_HTTP = _env_flag("OPERATOR_CONSOLE_HTTP", default=False)
+
+
+def _is_loopback(host: Optional[str]) -> bool:
+    if host is None:
+        return False
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+def _robot_stream_state() -> Optional[dict]:
+    """状態配信（state_stream）用: キャッシュ済みの状態 + ピックのフェーズ（RPC は出さない）"""
+    if robot is None:
+        return None
+    state = robot.state.snapshot()
+    state["phase"] = robot.current_phase
+    state["health"] = robot_health.status if robot_health is not None else None
+    return state
+
+# 購読したクライアントへ姿勢・関節・グリッパー・フェーズを配信（XARM_STREAM_HZ, XARM_STREAM_KEYFRAME_S）
+state_stream = StateStreamer(manager, _robot_stream_state)
+
+
+def _pick_many_with_report(cells, place, object_type) -> tuple[tuple[bool, str], dict]:
+    """pick_many と、その回の last_pick_many_report（motion_lock を持ったまま読むので他のピックに上書きされない）"""
+    with robot.motion_lock:
+        result = robot.pick_many(cells, place, object_type)
+        return result, dict(robot.last_pick_many_report)
+
+
+async def _robot_ready() -> tuple[bool, str]:
+    """ピックを実行してよいか。queue ポリシーでは復帰を最大 XARM_PICK_QUEUE_TIMEOUT 秒待つ"""
+    if robot is None or robot_health is None:
+        return False, "robot disabled"
+    ok, reason = robot_health.is_ready()
+    if ok or XARM_PICK_WHEN_UNHEALTHY != "queue":
+        return ok, reason
+    print(f"【Server】ロボット復帰待ち: {reason}")
+    if await asyncio.to_thread(robot_health.wait_ready, XARM_PICK_QUEUE_TIMEOUT):
+        return True, "ok"
+    return robot_health.is_ready()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -40,15 +123,21 @@ async def lifespan(app: FastAPI):
                 print(f"【Server】xArm 接続失敗のためロボット機能を無効化して起動します: {msg}")
         except Exception as e:
             print(f"【Server】xArm 接続例外のためロボット機能を無効化して起動します: {e!r}")
+        # 初回接続に失敗していてもモニタが再接続を試み続ける
+        robot_health.start()
     else:
         if not XARM_ENABLE:
             print("【Server】環境変数 XARM_ENABLE=0 のためロボット機能は無効です")
         else:
             print(f"【Server】xArm SDK が見つからないためロボット機能は無効です: {_XARM_IMPORT_ERROR}")
-    asyncio.create_task(keyboard_monitor_loop())
+    await console.start()
+    await state_stream.start()
     yield
     # 終了時
+    await state_stream.stop()
+    await console.stop()
     if robot is not None:
+        robot_health.stop()
         robot.disconnect()
 
 app = FastAPI(title="Integrated Spatial Robot Controller", lifespan=lifespan)
@@ -58,6 +147,7 @@ app = FastAPI(title="Integrated Spatial Robot Controller", lifespan=lifespan)
 
 @app.post("/command_cord", response_model=CommandResponse)
 def command_cord(req: CommandRequest):
+    set_endpoint("/command_cord")
     try:
         print("【Server】Command Request:", req.model_dump())
 
@@ -124,16 +214,39 @@ def command_cord(req: CommandRequest):
         # # 4) LLM decision -> executor
         # # -------------------------
         
-        print("【Server】Before decide_selection_rule", flush=True)
-        try:
-            decision = decide_selection_rule(llm_input)
-            print("【Server】After decide_selection_rule", flush=True)
-            print("【Server】LLM Decision:", json.dumps(decision.model_dump(), indent=2, ensure_ascii=False), flush=True)
-        except Exception as e:
-            print("【Server】decide_selection_rule ERROR:", repr(e), flush=True)
-            traceback.print_exc()
-            # ここで一旦HTTP 500にして落とすとデバッグしやすい（任意）
-            raise HTTPException(status_code=500, detail=str(e))
+        # 言い換えキャッシュに互換シーンでの類似発話があれば LLM を呼ばずに再利用する
+        paraphrase_hit = paraphrase_cache.lookup(req.utterance, llm_input) if paraphrase_cache else None
+        if paraphrase_hit is not None:
+            decision = LLMDecision(**paraphrase_hit.decision)
+            print(
+                f"【Server】Paraphrase cache hit (sim={paraphrase_hit.similarity}): "
+                f"'{req.utterance}' ≈ '{paraphrase_hit.utterance}'",
+                flush=True,
+            )
+            # 一部のヒットは LLM でも解いて答え合わせ用に記録する（LLM の判定を優先して使う）
+            audited = None
+            if paraphrase_cache.should_audit():
+                try:
+                    decision = decide_selection_rule(llm_input)
+                    audited = decision.model_dump()
+                    if audited != paraphrase_hit.decision:
+                        print("【Server】Paraphrase cache audit mismatch:", json.dumps(audited, ensure_ascii=False), flush=True)
+                except Exception as e:
+                    print("【Server】Paraphrase cache audit failed:", repr(e), flush=True)
+            paraphrase_cache.log_hit(req.utterance, llm_input, paraphrase_hit, audited)
+        else:
+            print("【Server】Before decide_selection_rule", flush=True)
+            try:
+                decision = decide_selection_rule(llm_input)
+                print("【Server】After decide_selection_rule", flush=True)
+                print("【Server】LLM Decision:", json.dumps(decision.model_dump(), indent=2, ensure_ascii=False), flush=True)
+            except Exception as e:
+                print("【Server】decide_selection_rule ERROR:", repr(e), flush=True)
+                traceback.print_exc()
+                # ここで一旦HTTP 500にして落とすとデバッグしやすい（任意）
+                raise HTTPException(status_code=500, detail=str(e))
+            if paraphrase_cache is not None:
+                paraphrase_cache.add(req.utterance, llm_input, decision.model_dump())
 
         # # decision が pydantic の場合
         # try:
@@ -169,6 +282,10 @@ def command_cord(req: CommandRequest):
                 "objects_source": objects_source,
                 "num_objects": len(objects_pos),
                 "note": "coordinate-only input (pos_world + pos_user (+pos_robot if provided))",
+                "paraphrase_cache": (
+                    {"hit": True, "similarity": paraphrase_hit.similarity, "matched_utterance": paraphrase_hit.utterance}
+                    if paraphrase_hit is not None else {"hit": False}
+                ),
             },
         )
 
@@ -183,6 +300,7 @@ def command_cord(req: CommandRequest):
 
 @app.post("/command", response_model=CommandResponse)
 def command(req: CommandRequest):
+    set_endpoint("/command")
     try:
         print("【Server】Command Request:", req.model_dump())
         # -------------------------
@@ -307,6 +425,9 @@ def command(req: CommandRequest):
 @app.post("/save_grid_config")
 async def save_grid_api(payload: dict):
     filename = save_grid_to_file(payload)
+    if robot is not None:
+        # 保存で正規化した内容（config_cache に入っている）から当て直す
+        robot.load_calibration()
     return {"status": "ok", "filename": filename}
 
 @app.get("/calibration")
@@ -314,56 +435,123 @@ async def calibration_api():
     await send_json_grid()
     return {"status": "ok"}
 
+@app.post("/console")
+async def console_api(payload: dict, request: Request):
+    """
+    ヘッドレス運用向け: {"command": "w" | "r" | "space" | "j"} をオペレータコンソールに積む。
+    OPERATOR_CONSOLE_HTTP=1 のときだけ、ループバックからの要求に限って受け付ける
+    """
+    if not OPERATOR_CONSOLE_HTTP:
+        raise HTTPException(status_code=404, detail="operator console over HTTP is disabled (OPERATOR_CONSOLE_HTTP)")
+    if not _is_loopback(request.client.host if request.client else None):
+        raise HTTPException(status_code=403, detail="operator console accepts local requests only")
+    command = console.submit(str(payload.get("command", "")))
+    if not command:
+        raise HTTPException(status_code=400, detail="command is required")
+    return {"status": "ok", "command": command}
+
+@app.get("/health/robot")
+async def robot_health_api():
+    if robot_health is None:
+        return {"status": "disabled"}
+    return robot_health.snapshot()
+
+@app.post("/robot/clear_error")
+async def robot_clear_error_api():
+    """コントローラエラー・停止状態の解除（操作者が安全を確認してから呼ぶ。自動では解除しない）"""
+    if robot_health is None:
+        raise HTTPException(status_code=503, detail="robot disabled")
+    ok, msg = await asyncio.to_thread(robot_health.clear_error)
+    if not ok:
+        raise HTTPException(status_code=409, detail=msg)
+    return {"status": "ok", "health": robot_health.snapshot()}
+
+@app.get("/ws/metrics")
+async def ws_metrics_api():
+    """WebSocket 送信キューの深さ・送信遅延など"""
+    return {**manager.metrics(), "stream": state_stream.metrics()}
+
 @app.websocket("/")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # ?policy=drop_oldest|coalesce|disconnect で遅いときの扱いをクライアントごとに選べる
+    # 状態配信（Subscribe）を受けるなら policy=coalesce にすると遅いときも最新値だけが残る
+    # メッセージ形式は Sec-WebSocket-Protocol: xarm.v1.msgpack / xarm.v1.json（または ?protocol=）で選ぶ
+    policy = websocket.query_params.get("policy")
+    if policy not in SLOW_CONSUMER_POLICIES:
+        policy = None
+    await manager.connect(websocket, policy=policy)
     print("【Server】Unity接続完了")
     try:
         while True:
             # Unityからのメッセージ受信
+            # 形式（legacy / v1.json / v1.msgpack）によらず payload はオブジェクトで受け取る
             try:
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
+                event_id, payload = await asyncio.wait_for(manager.receive(websocket), timeout=30.0)
             except asyncio.TimeoutError:
                 # Unity側が一定間隔で送信しない場合でも、サーバー側からは切断しない。
                 # KeepAlive を送って接続維持を試みる。
-                await websocket.send_text(json.dumps({"eventId": "KeepAlive", "payload": "{}"}))
+                await manager.send_event(websocket, "KeepAlive", {})
                 continue
+            if payload is None:
+                payload = {}
+
+            if event_id in ("Subscribe", "Unsubscribe"):
+                # 状態配信の購読: {"topics": ["pose", "joints", "gripper", "job"]}（省略で全部）
+                topics = payload.get("topics") if isinstance(payload, dict) else None
+                if event_id == "Subscribe":
+                    result = await state_stream.subscribe(websocket, topics)
+                else:
+                    result = state_stream.unsubscribe(websocket, topics)
+                await manager.send_event(websocket, "SubscribeResult", result)
 
-            message = json.loads(data)
-            
-            if message.get("eventId") == "SaveGridConfig":
-                grid_data = json.loads(message.get("payload", "{}"))
+            if event_id == "SaveGridConfig":
+                grid_data = payload
                 filename = save_grid_to_file(grid_data)
+                if robot is not None:
+                    # localPos -> ロボット座標の変換を当て直す（保存で正規化した内容を使う）
+                    robot.load_calibration()
                 
                 # 結果をUnityに返す
-                response = {
-                    "eventId": "SaveGridConfigResult",
-                    "payload": json.dumps({"status": "success", "filename": filename})
-                }
-                await websocket.send_text(json.dumps(response))
-            
-            if message.get("eventId") == "SaveRobotMarkerConfig":
-                marker_data = json.loads(message.get("payload", "{}"))
+                await manager.send_event(websocket, "SaveGridConfigResult", {"status": "success", "filename": filename})
+
+            if event_id == "SaveRobotMarkerConfig":
+                marker_data = payload
                 filename = save_robot_marker_config(marker_data)
-                
-                response = {
-                    "eventId": "SaveRobotMarkerConfigResult",
-                    "payload": json.dumps({"status": "success", "filename": filename})
-                }
-                await websocket.send_text(json.dumps(response))
+
+                await manager.send_event(websocket, "SaveRobotMarkerConfigResult", {"status": "success", "filename": filename})
                 print(f"【Server】ロボットマーカー設定を保存しました: {filename}")
             
-            if message.get("eventId") == "XarmPick":
-                payload = json.loads(message.get("payload", "{}"))
-                x = payload.get("x")
-                y = payload.get("y")
-
-                result =  robot.pick_at(x, y)
-
-                await websocket.send_text(json.dumps({
-                    "eventId": "XarmPickResult",
-                    "payload": result
-                }))
+            if event_id == "XarmPick":
+                cells = payload.get("cells")
+                # object_type（任意）: grasp_profiles.json の把持判定パラメータを選ぶ
+                ready, reason = await _robot_ready()
+                if not ready:
+                    # 途中で失敗させず、動き出す前に断る
+                    result = (False, f"Robot unavailable ({reason})")
+                elif cells:
+                    # 複数ピック: {"cells": [[x, y] | {"x", "y", "z"}, ...], "place": "x,y" | [x, y, z, r, p, yaw] | null}
+                    # {"x", "y", "z"} は Unity の localPos（QR アンカー基準 [m]）
+                    result, report = await asyncio.to_thread(
+                        _pick_many_with_report, cells, payload.get("place"), payload.get("object_type")
+                    )
+                elif payload.get("localPos") is not None:
+                    # 任意位置のピック: {"localPos": {"x", "y", "z"}}
+                    result = await asyncio.to_thread(
+                        robot.pick_local, payload["localPos"], payload.get("object_type")
+                    )
+                else:
+                    x = payload.get("x")
+                    y = payload.get("y")
+
+                    # 動作中もイベントループ（KeepAlive・他クライアント）を止めない
+                    result = await asyncio.to_thread(robot.pick_at, x, y, payload.get("object_type"))
+
+                await manager.send_event(websocket, "XarmPickResult", result)
+                if cells and ready and report:
+                    # 複数ピックは見積もり・実測のサイクルタイムを別イベントで返す（XarmPickResult の形は変えない）
+                    print(f"【Server】Pick many: est. {report.get('estimated_s')}s actual {report.get('actual_s')}s "
+                          f"({report.get('completed')}/{len(report.get('order', []))})")
+                    await manager.send_event(websocket, "XarmPickManyReport", report)
                 
     except WebSocketDisconnect as e:
         manager.disconnect(websocket)
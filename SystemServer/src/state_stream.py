@@ -0,0 +1,209 @@
+"""ロボット状態のライブ配信（HoloLens のデジタルツイン向け）。
+
+rate_hz ごとに状態（RobotStateCache.snapshot() + ピックのフェーズ）を読み、購読している
+クライアントへトピックごとのイベントで送る。
+
+  トピック  eventId        payload
+  pose      RobotPose      {"pose": [x, y, z, roll, pitch, yaw]}     [mm, deg]
+  joints    RobotJoints    {"joints": [j1, ..., j7]}                 [deg]
+  gripper   RobotGripper   {"gripper": pos}
+  job       RobotJob       {"phase", "state", "error_code", "connected", "health"}
+
+差分送信:
+  - 前回送った値から pose_mm / angle_deg 以上（job・gripper は値が変われば）動いたトピックだけ送る。
+    何も変わらないティックは何も送らない（停止中は keyframe_s ごとのキーフレームだけ）
+  - 各フレームはそのトピックの全値を持つので、途中のフレームが捨てられても次で追いつく。
+    トピックごとに eventId が違うので、?policy=coalesce の接続では未送信の古い値が最新値に置き換わる
+  - keyframe_s ごとに全トピックを送り直す（取りこぼし・途中参加の保険）
+
+購読（クライアント -> サーバ）:
+  {"eventId": "Subscribe",   "payload": {"topics": ["pose", "job"]}}   # topics 省略で全部
+  {"eventId": "Unsubscribe", "payload": {"topics": ["pose"]}}
+  どちらも SubscribeResult {"topics": [...購読中], "unknown": [...]} を返す。
+  購読した直後に、そのトピックの現在値を 1 回送る。購読しないクライアントには何も送らない。
+
+  stream = StateStreamer(manager, read_state)   # read_state() -> dict | None
+  await stream.start()                          # lifespan の起動時
+  await stream.stop()
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+TOPICS = ("pose", "joints", "gripper", "job")
+EVENT_IDS = {
+    "pose": "RobotPose",
+    "joints": "RobotJoints",
+    "gripper": "RobotGripper",
+    "job": "RobotJob",
+}
+XARM_STREAM_HZ = float(os.getenv("XARM_STREAM_HZ", "10"))
+XARM_STREAM_KEYFRAME_S = float(os.getenv("XARM_STREAM_KEYFRAME_S", "2.0"))
+
+
+def _rounded(values: Optional[List[float]], digits: int = 1) -> Optional[List[float]]:
+    return None if values is None else [round(float(v), digits) for v in values]
+
+
+def _moved(new: Optional[List[float]], old: Optional[List[float]], tol: float) -> bool:
+    if new is None or old is None or len(new) != len(old):
+        return new != old
+    return any(abs(a - b) >= tol for a, b in zip(new, old))
+
+
+class StateStreamer:
+    def __init__(
+        self,
+        manager: Any,
+        read_state: Callable[[], Optional[Dict[str, Any]]],
+        rate_hz: float = XARM_STREAM_HZ,
+        keyframe_s: float = XARM_STREAM_KEYFRAME_S,
+        pose_mm: float = 0.1,
+        angle_deg: float = 0.1,
+    ):
+        if rate_hz <= 0:
+            raise ValueError(f"rate_hz must be positive: {rate_hz}")
+        self.manager = manager
+        self.read_state = read_state
+        self.period = 1.0 / rate_hz
+        self.keyframe_s = keyframe_s
+        self.pose_mm = pose_mm
+        self.angle_deg = angle_deg
+        self._last: Dict[str, Any] = {}        # トピック -> 最後に送った payload
+        self._last_key = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+        # 指標
+        self.ticks = 0
+        self.idle_ticks = 0                    # 何も送らなかったティック
+        self.sent: Dict[str, int] = {t: 0 for t in TOPICS}
+        self.keyframes = 0
+
+    # ------------------------------------------------------------------
+    # 起動・停止
+    # ------------------------------------------------------------------
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_t = loop.time()
+        while True:
+            next_t += self.period
+            delay = next_t - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -self.period:
+                next_t = loop.time()   # 大きく遅れたら追いつこうとしない
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"【Stream】状態の配信に失敗: {e!r}")
+
+    # ------------------------------------------------------------------
+    # 購読
+    # ------------------------------------------------------------------
+    async def subscribe(self, websocket: Any, topics: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+        wanted, unknown = self._split_topics(topics)
+        current = self.manager.subscribe(websocket, wanted)
+        # 途中参加でも次のキーフレームを待たせない
+        payloads = self._payloads(self.read_state())
+        for topic in wanted:
+            if payloads.get(topic) is not None:
+                await self.manager.send_event(websocket, EVENT_IDS[topic], payloads[topic])
+        return {"topics": sorted(current), "unknown": unknown}
+
+    def unsubscribe(self, websocket: Any, topics: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+        wanted, unknown = self._split_topics(topics)
+        current = self.manager.unsubscribe(websocket, wanted)
+        return {"topics": sorted(current), "unknown": unknown}
+
+    @staticmethod
+    def _split_topics(topics: Optional[Iterable[str]]) -> Tuple[List[str], List[str]]:
+        if topics is None:
+            return list(TOPICS), []
+        if isinstance(topics, str):
+            topics = [topics]
+        topics = [str(t) for t in topics]
+        return [t for t in TOPICS if t in topics], [t for t in topics if t not in TOPICS]
+
+    # ------------------------------------------------------------------
+    # 配信
+    # ------------------------------------------------------------------
+    def _payloads(self, state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not state:
+            return {}
+        out: Dict[str, Any] = {}
+        if state.get("pose") is not None:
+            out["pose"] = {"pose": _rounded(state["pose"])}
+        if state.get("joints") is not None:
+            out["joints"] = {"joints": _rounded(state["joints"])}
+        if state.get("gripper_pos") is not None:
+            out["gripper"] = {"gripper": round(float(state["gripper_pos"]), 1)}
+        out["job"] = {
+            "phase": state.get("phase"),
+            "state": state.get("state"),
+            "error_code": state.get("error_code", 0),
+            "connected": bool(state.get("connected")),
+            "health": state.get("health"),
+        }
+        return out
+
+    def _changed(self, topic: str, payload: Dict[str, Any]) -> bool:
+        last = self._last.get(topic)
+        if last is None:
+            return True
+        if topic == "pose":
+            # 位置は mm、姿勢角は deg で別々に不感帯を取る
+            new, old = payload["pose"], last["pose"]
+            return _moved(new[:3], old[:3], self.pose_mm) or _moved(new[3:], old[3:], self.angle_deg)
+        if topic == "joints":
+            return _moved(payload["joints"], last["joints"], self.angle_deg)
+        return payload != last
+
+    async def tick(self) -> int:
+        """1 回分: 変わったトピックだけ購読者へ送る。送ったトピック数を返す"""
+        self.ticks += 1
+        subscribed = self.manager.subscribed_topics()
+        if not subscribed:
+            self.idle_ticks += 1
+            return 0
+        now = asyncio.get_running_loop().time()
+        keyframe = now - self._last_key >= self.keyframe_s
+        payloads = self._payloads(self.read_state())
+        count = 0
+        for topic in TOPICS:
+            payload = payloads.get(topic)
+            if topic not in subscribed or payload is None:
+                continue
+            if not keyframe and not self._changed(topic, payload):
+                continue
+            self._last[topic] = payload
+            await self.manager.publish(topic, EVENT_IDS[topic], payload)
+            self.sent[topic] += 1
+            count += 1
+        if keyframe:
+            self._last_key = now
+            self.keyframes += 1
+        if count == 0:
+            self.idle_ticks += 1
+        return count
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "rate_hz": round(1.0 / self.period, 3),
+            "keyframe_s": self.keyframe_s,
+            "ticks": self.ticks,
+            "idle_ticks": self.idle_ticks,
+            "keyframes": self.keyframes,
+            "sent": dict(self.sent),
+            "subscribers": {t: self.manager.subscriber_count(t) for t in TOPICS},
+        }
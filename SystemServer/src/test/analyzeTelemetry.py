@@ -0,0 +1,143 @@
+"""TelemetryRecorder の記録（.xtel / .npz）を解析する。
+
+ピックごとの所要時間をフェーズ別に分解し、アームもグリッパーも止まっている
+「待ち時間」（固定 sleep・完了待ちの遅れなど）と、レポートの途切れを一覧にする。
+"(none)" はどのフェーズにも入っていない時間。
+
+Run:
+	python test/analyzeTelemetry.py telemetry/telemetry_20250101_120000.xtel
+	python test/analyzeTelemetry.py pick.xtel --gap 0.1 --json out.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import statistics
+import sys
+from pathlib import Path
+
+
+# Allow importing from <repo>/SystemServer/src regardless of where you run this.
+SRC_DIR = Path(__file__).resolve().parents[1]
+if str(SRC_DIR) not in sys.path:
+	sys.path.insert(0, str(SRC_DIR))
+
+from Robot.telemetry import TelemetryRecorder
+
+STATE_MOVING = 1
+
+
+def _phase_name(meta: dict, code: float) -> str:
+	return meta["phases"][int(code)] or "(none)"
+
+
+def breakdown(cols: dict, meta: dict) -> dict:
+	"""ピック番号 -> {label, total_s, phases_s}。各行の時間は次の行までとする"""
+	t, pick, phase = cols["t"], cols["pick"], cols["phase"]
+	out: dict = {}
+	for i in range(len(t) - 1):
+		p = int(pick[i])
+		dt = t[i + 1] - t[i]
+		name = _phase_name(meta, phase[i])
+		key = str(p) if p else "-"
+		entry = out.setdefault(key, {"label": meta["picks"].get(str(p), "") if p else "outside picks",
+		                             "total_s": 0.0, "phases_s": {}})
+		entry["total_s"] += dt
+		entry["phases_s"][name] = entry["phases_s"].get(name, 0.0) + dt
+	return out
+
+
+def idle_gaps(cols: dict, meta: dict, min_gap: float, still_mm: float, still_grip: float) -> list[dict]:
+	"""ピック中にアーム・グリッパーとも止まっている区間（min_gap 秒以上）"""
+	t, pick, phase, state = cols["t"], cols["pick"], cols["phase"], cols["state"]
+	xyz = list(zip(cols["x"], cols["y"], cols["z"]))
+	grip = cols["gripper"]
+	gaps, start = [], None
+
+	def close(i: int) -> None:
+		if start is not None and t[i] - t[start] >= min_gap:
+			gaps.append({
+				"pick": int(pick[start]),
+				"phase": _phase_name(meta, phase[start]),
+				"t": round(t[start], 4),
+				"duration_s": round(t[i] - t[start], 4),
+			})
+
+	for i in range(len(t) - 1):
+		moved = math.dist(xyz[i], xyz[i + 1]) > still_mm if not math.isnan(xyz[i][0] + xyz[i + 1][0]) else False
+		gripped = abs(grip[i + 1] - grip[i]) > still_grip if not math.isnan(grip[i] + grip[i + 1]) else False
+		idle = int(pick[i]) > 0 and not moved and not gripped and state[i] != STATE_MOVING
+		if idle and start is None:
+			start = i
+		elif not idle and start is not None:
+			close(i)
+			start = None
+	if start is not None:
+		close(len(t) - 1)
+	return gaps
+
+
+def report_dropouts(cols: dict, factor: float = 5.0) -> tuple[float, list[dict]]:
+	"""レポート周期の中央値と、その factor 倍以上あいた区間"""
+	t = cols["t"]
+	dts = [b - a for a, b in zip(t, t[1:]) if b - a > 1e-6]
+	if not dts:
+		return 0.0, []
+	med = statistics.median(dts)
+	limit = max(factor * med, 0.02)
+	drops = [{"t": round(a, 4), "duration_s": round(b - a, 4)} for a, b in zip(t, t[1:]) if b - a > limit]
+	return med, drops
+
+
+def main() -> int:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("file", help=".xtel / .npz（TelemetryRecorder.save の出力）")
+	parser.add_argument("--gap", type=float, default=0.05, help="待ち時間として数える最短の長さ [s]")
+	parser.add_argument("--still-mm", type=float, default=0.05, help="1 サンプルあたりこれ以下の移動は静止とみなす")
+	parser.add_argument("--still-grip", type=float, default=0.5, help="1 サンプルあたりこれ以下のグリッパー変化は静止とみなす")
+	parser.add_argument("--json", help="結果を JSON で保存する")
+	args = parser.parse_args()
+
+	cols, meta = TelemetryRecorder.load(args.file)
+	if len(cols["t"]) < 2:
+		print("not enough samples")
+		return 1
+
+	med_dt, drops = report_dropouts(cols)
+	print(f"{meta['rows']} samples over {cols['t'][-1] - cols['t'][0]:.2f}s "
+	      f"(report period {1000 * med_dt:.1f} ms, dropped by ring buffer: {meta['dropped']})")
+
+	picks = breakdown(cols, meta)
+	phases = [p for p in meta["phases"] if p] + ["(none)"]
+	header = ["pick", "cell", "total"] + phases
+	print("\n" + "  ".join(f"{h:>12}" for h in header))
+	for key, entry in picks.items():
+		row = [key, entry["label"][:12], f"{entry['total_s']:.3f}"]
+		row += [f"{entry['phases_s'].get(p, 0.0):.3f}" for p in phases]
+		print("  ".join(f"{v:>12}" for v in row))
+
+	gaps = idle_gaps(cols, meta, args.gap, args.still_mm, args.still_grip)
+	print(f"\nidle gaps >= {args.gap:.3f}s: {len(gaps)} ({sum(g['duration_s'] for g in gaps):.3f}s total)")
+	for g in gaps:
+		print(f"  pick {g['pick']:>3} {g['phase']:>14}  t={g['t']:.3f}  {g['duration_s']:.3f}s")
+	if drops:
+		print(f"\nreport dropouts: {len(drops)}")
+		for d in drops:
+			print(f"  t={d['t']:.3f}  {d['duration_s']:.3f}s")
+
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump({
+				"file": str(args.file),
+				"report_period_s": med_dt,
+				"picks": picks,
+				"idle_gaps": gaps,
+				"report_dropouts": drops,
+			}, f, indent=2)
+		print(f"\nsaved {args.json}")
+	return 0
+
+
+if __name__ == "__main__":
+	raise SystemExit(main())
@@ -0,0 +1,247 @@
+"""pick_at のサイクルタイム・ベンチマーク。
+
+標準シナリオを実機またはシミュレータで実行し、フェーズ別・合計の所要時間を
+パーセンタイル付きで表示して JSON に保存する。--compare で以前の結果と比べられる。
+
+シナリオ:
+	single      : 初期姿勢から 1 セル（既定 1,1）をピック
+	corner      : 対角の隅を交互にピック（最長の横移動）
+	sweep       : 教示した全セルを蛇行順にピック
+	after_fault : コントローラエラーを注入し、clear_error（ヘルスモニタと同じ復帰）してからピック
+	              （シミュレータのみ。復帰時間は "recover" フェーズとして合計に含める）
+
+Run:
+	python test/benchPickCycle.py --sim
+	python test/benchPickCycle.py --sim --mode blended --set UP_Z=260 --set joint_speed=90
+	python test/benchPickCycle.py --ip 192.168.1.199 --scenarios single corner --repeat 3
+	python test/benchPickCycle.py --sim --compare bench_results/20250101_120000_sim_stepwise.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+# Allow importing from <repo>/SystemServer/src regardless of where you run this.
+SRC_DIR = Path(__file__).resolve().parents[1]
+if str(SRC_DIR) not in sys.path:
+	sys.path.insert(0, str(SRC_DIR))
+
+from Robot.grid_model import parse_cell
+from XARmOperator import MOTION_MODES, XArmOperator
+
+
+PERCENTILES = (50, 90, 95, 99)
+SCENARIOS = ("single", "corner", "sweep", "after_fault")
+RESULTS_DIR = Path(__file__).resolve().parent / "bench_results"
+
+# 結果に記録する設定（--set で上書きできる属性もこの中から選ぶ）
+CONFIG_ATTRS = (
+	"motion_mode", "gripper_overlap", "joint_traverse", "verify_grasp",
+	"UP_Z", "DOWN_Z", "SAFE_HEIGHT", "blend_radius", "joint_speed", "joint_acc",
+	"gripper_open_pos", "gripper_close_pos", "gripper_tolerance", "gripper_poll_s", "gripper_stall_s",
+)
+
+
+def percentile(values: list[float], q: float) -> float:
+	"""線形補間のパーセンタイル（q: 0-100）"""
+	if not values:
+		return 0.0
+	s = sorted(values)
+	pos = (len(s) - 1) * q / 100.0
+	lo = int(pos)
+	hi = min(lo + 1, len(s) - 1)
+	return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def stats(values: list[float]) -> dict:
+	out = {"n": len(values), "mean": sum(values) / len(values) if values else 0.0,
+	       "min": min(values, default=0.0), "max": max(values, default=0.0)}
+	out.update({f"p{q}": percentile(values, q) for q in PERCENTILES})
+	return {k: round(v, 4) if isinstance(v, float) else v for k, v in out.items()}
+
+
+# ----------------------------------------------------------------------
+# シナリオ
+# ----------------------------------------------------------------------
+def _grid_cells(op: XArmOperator) -> list[tuple[int, int]]:
+	return sorted((int(x), int(y)) for x, y in (parse_cell(k) for k in op.pose_map))
+
+
+def scenario_cells(op: XArmOperator, name: str, single: tuple[int, int]) -> list[tuple[int, int]]:
+	cells = _grid_cells(op)
+	xs = sorted({c[0] for c in cells})
+	ys = sorted({c[1] for c in cells})
+	if name in ("single", "after_fault"):
+		return [single]
+	if name == "corner":
+		return [(xs[0], ys[0]), (xs[-1], ys[-1]), (xs[-1], ys[0]), (xs[0], ys[-1])]
+	if name == "sweep":
+		# 蛇行順（行ごとに向きを変える）
+		order = []
+		for i, y in enumerate(ys):
+			row = [c for c in cells if c[1] == y]
+			order += row if i % 2 == 0 else row[::-1]
+		return order
+	raise ValueError(f"unknown scenario: {name}")
+
+
+def run_scenario(op: XArmOperator, name: str, cells: list[tuple[int, int]], repeat: int,
+                 fault_code: int) -> list[dict]:
+	reports = []
+	for _ in range(repeat):
+		op.go_to_initial_pos()  # 毎回同じ開始姿勢からそろえる
+		for x, y in cells:
+			recover_s = None
+			if name == "after_fault":
+				op.arm.inject_error(fault_code)
+				t0 = op._now()
+				ok, msg = op.clear_error()
+				recover_s = op._now() - t0
+				if not ok:
+					print(f"[{name}] clear_error failed: {msg}")
+			ok, msg = op.pick_at(x, y)
+			if not ok:
+				print(f"[{name}] pick_at({x},{y}) failed: {msg}")
+			report = dict(op.last_pick_report, phases_s=dict(op.last_pick_report["phases_s"]))
+			if recover_s is not None:
+				report["phases_s"]["recover"] = round(recover_s, 4)
+				report["total_s"] = round(report["total_s"] + recover_s, 4)
+			reports.append(report)
+	return reports
+
+
+def summarize(reports: list[dict]) -> dict:
+	phases = sorted({p for r in reports for p in r["phases_s"]})
+	return {
+		"picks": len(reports),
+		"failed": sum(1 for r in reports if not r["ok"]),
+		"recoveries": sum(len(r.get("recoveries") or []) for r in reports),
+		"total_s": stats([r["total_s"] for r in reports]),
+		"phases_s": {p: stats([r["phases_s"].get(p, 0.0) for r in reports]) for p in phases},
+	}
+
+
+# ----------------------------------------------------------------------
+# 出力
+# ----------------------------------------------------------------------
+def print_results(results: dict) -> None:
+	cols = ["mean"] + [f"p{q}" for q in PERCENTILES] + ["max"]
+	for name, res in results["scenarios"].items():
+		print(f"\n== {name}: {res['picks']} picks, {res['failed']} failed, {res['recoveries']} recoveries")
+		print(f"{'phase':>14}  " + "  ".join(f"{c:>8}" for c in cols))
+		rows = list(res["phases_s"].items()) + [("total", res["total_s"])]
+		for phase, s in rows:
+			print(f"{phase:>14}  " + "  ".join(f"{s[c]:>8.3f}" for c in cols))
+
+
+def print_compare(results: dict, base: dict) -> None:
+	print(f"\n== compare with {base.get('label')} ({base.get('git')}, {base.get('timestamp')})")
+	print(f"{'scenario':>12}  {'phase':>14}  {'base p50':>9}  {'new p50':>9}  {'delta':>8}")
+	for name, res in results["scenarios"].items():
+		old = base.get("scenarios", {}).get(name)
+		if not old:
+			continue
+		rows = [(p, s) for p, s in res["phases_s"].items()] + [("total", res["total_s"])]
+		for phase, s in rows:
+			o = old["total_s"] if phase == "total" else old["phases_s"].get(phase)
+			if not o:
+				continue
+			a, b = o["p50"], s["p50"]
+			pct = f"{100.0 * (b - a) / a:+.1f}%" if a > 0 else "-"
+			print(f"{name:>12}  {phase:>14}  {a:>9.3f}  {b:>9.3f}  {pct:>8}")
+
+
+def _git_rev() -> str | None:
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR,
+		                      capture_output=True, text=True, timeout=5).stdout.strip() or None
+	except Exception:
+		return None
+
+
+def _parse_override(text: str) -> tuple[str, object]:
+	name, _, raw = text.partition("=")
+	if name not in CONFIG_ATTRS:
+		raise SystemExit(f"--set: unknown attribute {name!r} (choose from {', '.join(CONFIG_ATTRS)})")
+	try:
+		value = json.loads(raw)
+	except json.JSONDecodeError:
+		value = raw
+	return name, value
+
+
+def main() -> int:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--ip", default="192.168.1.199")
+	parser.add_argument("--sim", action="store_true", help="SimXArmAPI で実行する（仮想時間）")
+	parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--cell", default="1,1", help="single / after_fault でピックするセル")
+	parser.add_argument("--mode", choices=MOTION_MODES, default="stepwise")
+	parser.add_argument("--no-overlap", action="store_true", help="gripper_overlap を切る")
+	parser.add_argument("--no-joint-traverse", action="store_true", help="joint_traverse を切る")
+	parser.add_argument("--set", action="append", default=[], metavar="ATTR=VALUE",
+	                    help="XArmOperator の設定を上書きする（例: UP_Z=260）")
+	parser.add_argument("--fault-code", type=int, default=22, help="after_fault で注入するエラーコード")
+	parser.add_argument("--label", help="結果の名前（既定: backend_mode）")
+	parser.add_argument("--out", help="結果 JSON の保存先（既定: test/bench_results/<時刻>_<label>.json）")
+	parser.add_argument("--compare", help="比較する以前の結果 JSON")
+	args = parser.parse_args()
+
+	backend = "sim" if args.sim else "real"
+	op = XArmOperator(ip=args.ip, backend=backend, motion_mode=args.mode,
+	                  gripper_overlap=not args.no_overlap, joint_traverse=not args.no_joint_traverse)
+	overrides = dict(_parse_override(s) for s in args.set)
+	for name, value in overrides.items():
+		setattr(op, name, value)
+
+	ok, msg = op.connect()
+	if not ok:
+		print(f"connect failed: {msg}")
+		return 1
+
+	scenarios = list(args.scenarios)
+	if "after_fault" in scenarios and not hasattr(op.arm, "inject_error"):
+		print("after_fault needs a backend that can inject errors (use --sim); skipped")
+		scenarios.remove("after_fault")
+
+	label = args.label or f"{backend}_{args.mode}"
+	results = {
+		"label": label,
+		"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"git": _git_rev(),
+		"backend": backend,
+		"repeat": args.repeat,
+		"config": {a: getattr(op, a) for a in CONFIG_ATTRS},
+		"overrides": overrides,
+		"scenarios": {},
+	}
+	single = tuple(int(v) for v in parse_cell(args.cell))
+	try:
+		for name in scenarios:
+			cells = scenario_cells(op, name, single)
+			reports = run_scenario(op, name, cells, args.repeat, args.fault_code)
+			results["scenarios"][name] = {"cells": [f"{x},{y}" for x, y in cells], **summarize(reports)}
+	finally:
+		op.disconnect()
+
+	print_results(results)
+	if args.compare:
+		with open(args.compare, "r", encoding="utf-8") as f:
+			print_compare(results, json.load(f))
+
+	out = Path(args.out) if args.out else RESULTS_DIR / f"{time.strftime('%Y%m%d_%H%M%S')}_{label}.json"
+	out.parent.mkdir(parents=True, exist_ok=True)
+	with open(out, "w", encoding="utf-8") as f:
+		json.dump(results, f, indent=2)
+	print(f"\nsaved {out}")
+	return 0
+
+
+if __name__ == "__main__":
+	raise SystemExit(main())
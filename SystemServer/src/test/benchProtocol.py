@@ -0,0 +1,105 @@
+"""WebSocket エンベロープ（protocol.py）の形式ごとのサイズとエンコード / デコード時間。
+
+メッセージ種別ごとに legacy / v1.json / v1.msgpack のバイト数と、1 メッセージあたりの
+エンコード・デコード時間 [us] を表示する。RestoreGridConfig は saved_grids/qr_grid_config.json
+（--cells で合成したグリッドに置き換え可）を使う。
+
+Run:
+	python test/benchProtocol.py
+	python test/benchProtocol.py --cells 400 --json bench_results/protocol.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+
+# Allow importing from <repo>/SystemServer/src regardless of where you run this.
+SRC_DIR = Path(__file__).resolve().parents[1]
+if str(SRC_DIR) not in sys.path:
+	sys.path.insert(0, str(SRC_DIR))
+
+import protocol
+from protocol import ENCODERS, decode_frame, encode_frame
+
+
+def synthetic_grid(cells: int) -> list[dict]:
+	rng = random.Random(0)
+	w = max(1, int(cells ** 0.5))
+	return [{"id": i, "gridX": i % w, "gridY": i // w,
+	         "localPos": {"x": rng.uniform(0, 0.6), "y": 0.0, "z": rng.uniform(0, 0.6)}}
+	        for i in range(cells)]
+
+
+def sample_messages(cells: int | None) -> dict[str, object]:
+	grid_path = SRC_DIR / "saved_grids" / "qr_grid_config.json"
+	if cells is None and grid_path.is_file():
+		with open(grid_path, "r", encoding="utf-8") as f:
+			grid = json.load(f)
+	else:
+		grid = synthetic_grid(cells or 16)
+	marker = {"markers": [{"id": k, "position": {"x": 0.1 * k, "y": 0.0, "z": 0.05 * k},
+	                       "rotation": {"x": 0.0, "y": 90.0, "z": 0.0}} for k in range(4)]}
+	return {
+		"KeepAlive": {},
+		"KeyInput": {"type": "key", "key": "space"},
+		"XarmPick": {"cells": [[0, 1], [2, 3], {"x": 0.12, "y": 0.0, "z": 0.34}], "place": "3,3", "object_type": "cube"},
+		"XarmPickResult": [True, "Picked (1, 2)"],
+		"SaveGridConfigResult": {"status": "success", "filename": "qr_grid_config.json"},
+		"RestoreGridConfig": {"type": "grid_config", "filename": "qr_grid_config.json", "gridPoints": grid},
+		"RestoreRobotMarkerConfig": {"type": "robot_marker_config", "filename": "robot_marker_config.json", "markerData": marker},
+	}
+
+
+def measure(event_id: str, payload: object, encoding: str, min_time: float) -> dict:
+	frame = encode_frame(encoding, event_id, payload)
+	assert decode_frame(frame)[0] == event_id
+	enc = timeit.Timer(lambda: encode_frame(encoding, event_id, payload))
+	dec = timeit.Timer(lambda: decode_frame(frame))
+	n_enc, t_enc = enc.autorange()
+	n_dec, t_dec = dec.autorange()
+	# autorange は 0.2s 以上になる回数を選ぶ。min_time が長ければ同じ回数で繰り返して最小値を取る
+	repeat = max(1, int(min_time / 0.2))
+	t_enc = min([t_enc] + enc.repeat(repeat - 1, n_enc)) if repeat > 1 else t_enc
+	t_dec = min([t_dec] + dec.repeat(repeat - 1, n_dec)) if repeat > 1 else t_dec
+	return {
+		"bytes": len(frame.encode("utf-8") if isinstance(frame, str) else frame),
+		"encode_us": round(1e6 * t_enc / n_enc, 2),
+		"decode_us": round(1e6 * t_dec / n_dec, 2),
+	}
+
+
+def main() -> int:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--cells", type=int, help="RestoreGridConfig を合成したこのセル数のグリッドにする")
+	parser.add_argument("--min-time", type=float, default=0.2, help="1 測定あたりの目安時間 [s]")
+	parser.add_argument("--json", help="結果を JSON で保存する")
+	args = parser.parse_args()
+
+	backend = "msgpack package" if protocol._msgpack is not None else "built-in packer"
+	print(f"v1.msgpack: {backend}")
+	results: dict = {}
+	print(f"\n{'message':>26}  {'encoding':>10}  {'bytes':>8}  {'vs legacy':>9}  {'enc us':>9}  {'dec us':>9}")
+	for event_id, payload in sample_messages(args.cells).items():
+		results[event_id] = {}
+		for encoding in ENCODERS:
+			r = results[event_id][encoding] = measure(event_id, payload, encoding, args.min_time)
+			base = results[event_id]["legacy"]["bytes"]
+			print(f"{event_id:>26}  {encoding:>10}  {r['bytes']:>8}  {100.0 * r['bytes'] / base:>8.0f}%  "
+			      f"{r['encode_us']:>9.2f}  {r['decode_us']:>9.2f}")
+
+	if args.json:
+		out = Path(args.json)
+		out.parent.mkdir(parents=True, exist_ok=True)
+		with open(out, "w", encoding="utf-8") as f:
+			json.dump({"msgpack_backend": backend, "results": results}, f, indent=2)
+		print(f"\nsaved {out}")
+	return 0
+
+
+if __name__ == "__main__":
+	raise SystemExit(main())
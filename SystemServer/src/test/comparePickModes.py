@@ -0,0 +1,96 @@
+"""pick_at の stepwise / blended モードのサイクルタイム比較。
+
+同じセル列を各モード × グリッパー先行動作（gripper_overlap）の有無で順にピックし、
+フェーズ別・合計の所要時間を表にする。"+ovl" がグリッパー先行・位置フィードバック待ち。
+
+Run:
+	python test/comparePickModes.py --cells "0,0" "3,3" "0,3"
+	python test/comparePickModes.py --sim        # 実機なし（シミュレータの仮想時間）
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+
+# Allow importing from <repo>/SystemServer/src regardless of where you run this.
+SRC_DIR = Path(__file__).resolve().parents[1]
+if str(SRC_DIR) not in sys.path:
+	sys.path.insert(0, str(SRC_DIR))
+
+from XARmOperator import MOTION_MODES, XArmOperator
+
+
+PHASES = ("lift", "traverse", "gripper_open", "descend", "grasp", "verify", "ascend")
+
+
+def _parse_cell(text: str) -> tuple[int, int]:
+	x, y = text.replace(" ", "").split(",")
+	return int(x), int(y)
+
+
+def run_mode(op: XArmOperator, mode: str, overlap: bool, cells: list[tuple[int, int]], repeat: int) -> list[dict]:
+	op.motion_mode = mode
+	op.gripper_overlap = overlap
+	op.go_to_initial_pos()  # 各条件を同じ開始姿勢からそろえる
+	reports = []
+	for _ in range(repeat):
+		for x, y in cells:
+			ok, msg = op.pick_at(x, y)
+			if not ok:
+				print(f"[{mode}{'+ovl' if overlap else ''}] pick_at({x},{y}) failed: {msg}")
+			reports.append(dict(op.last_pick_report))
+	return reports
+
+
+def summarize(reports: list[dict]) -> dict:
+	n = max(len(reports), 1)
+	out = {p: sum(r["phases_s"].get(p, 0.0) for r in reports) / n for p in PHASES}
+	out["total"] = sum(r["total_s"] for r in reports) / n
+	return out
+
+
+def main() -> int:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--ip", default="192.168.1.199")
+	parser.add_argument("--cells", nargs="+", default=["0,0", "3,3", "0,3", "3,0"])
+	parser.add_argument("--repeat", type=int, default=1)
+	parser.add_argument("--sim", action="store_true", help="SimXArmAPI で実行する")
+	args = parser.parse_args()
+
+	cells = [_parse_cell(c) for c in args.cells]
+	op = XArmOperator(ip=args.ip, backend="sim" if args.sim else "real")
+	ok, msg = op.connect()
+	if not ok:
+		print(f"connect failed: {msg}")
+		return 1
+
+	variants = [(mode, overlap) for mode in MOTION_MODES for overlap in (False, True)]
+	labels = [f"{mode}+ovl" if overlap else mode for mode, overlap in variants]
+	try:
+		results = {
+			label: summarize(run_mode(op, mode, overlap, cells, args.repeat))
+			for label, (mode, overlap) in zip(labels, variants)
+		}
+	finally:
+		op.disconnect()
+
+	header = ["phase"] + labels
+	print("\n" + "  ".join(f"{h:>14}" for h in header))
+	for key in PHASES + ("total",):
+		print("  ".join(f"{v:>14}" for v in [key] + [f"{results[l][key]:.3f}" for l in labels]))
+
+	def saved(base: str, new: str) -> str:
+		a, b = results[base]["total"], results[new]["total"]
+		return f"{a - b:.3f}s ({100.0 * (1.0 - b / a):.1f}%)" if a > 0 else "-"
+
+	print()
+	for mode in MOTION_MODES:
+		print(f"gripper overlap saves {saved(mode, mode + '+ovl')} per pick in {mode} mode")
+	print(f"{labels[-1]} saves {saved(labels[0], labels[-1])} per pick vs {labels[0]}")
+	return 0
+
+
+if __name__ == "__main__":
+	raise SystemExit(main())
@@ -1,6 +1,8 @@
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Optional, Tuple
 
 SAVE_DIR = Path(__file__).resolve().parent / "saved_grids"
 SAVE_DIR.mkdir(exist_ok=True)
@@ -25,46 +27,110 @@ def _normalize_json_data(data: Any) -> Any:
                 return data
     return data
 
+class CachedConfig:
+    """読み込み済みの設定 1 ファイル分。frames は送信用にエンコード済みのパケット（形式ごと）"""
+
+    def __init__(self, filename: str, data: Any, stamp: Optional[Tuple[int, int]]):
+        self.filename = filename
+        self.data = data
+        self.stamp = stamp                     # (st_mtime_ns, st_size)
+        self.frames: Dict[str, Any] = {}       # protocol.ENCODERS のキー -> フレーム
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"filename": self.filename, "data": self.data}
+
+
+class ConfigCache:
+    """
+    saved_grids の設定ファイルをパース済みで持っておく。
+    get() のたびに stat だけ見て、mtime かサイズが変わっていたら読み直す（手で編集した場合など）。
+    save() は書いた内容をそのままキャッシュに入れるので、直後の get() で読み直さない。
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._entries: Dict[str, CachedConfig] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def _stamp(self, path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, filename: str) -> Optional[CachedConfig]:
+        path = self.directory / filename
+        stamp = self._stamp(path)
+        with self._lock:
+            if stamp is None:
+                self._entries.pop(filename, None)
+                return None
+            entry = self._entries.get(filename)
+            if entry is not None and entry.stamp == stamp:
+                self.hits += 1
+                return entry
+        with open(path, "r", encoding="utf-8") as f:
+            data = _normalize_json_data(json.load(f))
+        entry = CachedConfig(filename, data, stamp)
+        with self._lock:
+            self._entries[filename] = entry
+            self.loads += 1
+        return entry
+
+    def save(self, filename: str, data: Any) -> CachedConfig:
+        path = self.directory / filename
+        data = _normalize_json_data(data)
+        # 書きかけのファイルを読まれないよう一時ファイルから置き換える
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+        entry = CachedConfig(filename, data, self._stamp(path))
+        with self._lock:
+            self._entries[filename] = entry
+        return entry
+
+    def invalidate(self, filename: Optional[str] = None) -> None:
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(filename, None)
+
+
+config_cache = ConfigCache(SAVE_DIR)
+
+
 def save_grid_to_file(data: Any) -> str:
     """Always overwrite the single grid-config file."""
-    save_path = SAVE_DIR / GRID_CONFIG_FILENAME
-    data = _normalize_json_data(data)
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    return GRID_CONFIG_FILENAME
+    return config_cache.save(GRID_CONFIG_FILENAME, data).filename
+
+def load_grid_entry() -> Optional[CachedConfig]:
+    """キャッシュ経由でグリッド設定を返す（送信用パケットも entry.frames に残る）"""
+    return config_cache.get(GRID_CONFIG_FILENAME)
 
 def load_latest_grid_json():
     """Load the single grid-config file (kept for backward compatibility)."""
-    path = SAVE_DIR / GRID_CONFIG_FILENAME
-    if not path.is_file():
-        return None
-
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    data = _normalize_json_data(data)
-    return {"filename": path.name, "data": data}
+    entry = load_grid_entry()
+    return entry.as_dict() if entry is not None else None
 
 
 ROBOT_MARKER_CONFIG_FILENAME = "robot_marker_config.json"
 
 def save_robot_marker_config(data: Any) -> str:
     """Save robot marker relative coordinates config."""
-    save_path = SAVE_DIR / ROBOT_MARKER_CONFIG_FILENAME
-    data = _normalize_json_data(data)
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    return ROBOT_MARKER_CONFIG_FILENAME
+    return config_cache.save(ROBOT_MARKER_CONFIG_FILENAME, data).filename
+
+def load_robot_marker_entry() -> Optional[CachedConfig]:
+    return config_cache.get(ROBOT_MARKER_CONFIG_FILENAME)
 
 def load_robot_marker_config():
     """Load robot marker relative coordinates config."""
-    path = SAVE_DIR / ROBOT_MARKER_CONFIG_FILENAME
-    if not path.is_file():
-        return None
-
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    data = _normalize_json_data(data)
-    return {"filename": path.name, "data": data}
+    entry = load_robot_marker_entry()
+    return entry.as_dict() if entry is not None else None
 
 
 
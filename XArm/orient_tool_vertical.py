@@ -1,7 +1,15 @@
-import time
+import sys
+from pathlib import Path
 from typing import Optional
 from xarm.wrapper import XArmAPI
 
+# SystemServer/src の共通モジュール（復帰処理）を使う
+SRC_DIR = Path(__file__).resolve().parents[1] / "SystemServer" / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from Robot.recovery import ArmRecovery, ControllerState
+
 # ============================================================
 # CONFIG
 # ============================================================
@@ -26,34 +34,17 @@ def ensure_commandable(arm: XArmAPI) -> None:
 
 def recover_and_prepare(arm: XArmAPI) -> None:
     """
-    xArm をコマンド可能へ遷移させる正しい最小手順
+    xArm をコマンド可能へ遷移させる（エラー解除 → 有効化 → ポジションモード → READY）。
+    固定 sleep ではなく state の遷移を確認し、回数・時間の上限を超えたら例外にする。
     """
+    result = ArmRecovery(arm).recover_arm(mode=0)
+    if not result.ok:
+        raise RuntimeError(f"xArm not commandable ({result.reason}, steps={result.steps})")
 
-    # ① 明示的に STOP
-    arm.set_state(4)
-    time.sleep(0.15)
-
-    # ② エラー・警告クリア
-    arm.clean_error()
-    arm.clean_warn()
-    time.sleep(0.15)
-
-    # ③ READY 要求（← 先）
-    arm.set_state(0)
-    time.sleep(0.3)
-
-    # ④ モーション有効化（← READY の後）
-    arm.motion_enable(True)
-    time.sleep(0.2)
-
-    # ⑤ ポジションモード
-    arm.set_mode(0)
-    time.sleep(0.1)
-
-    # ⑥ 最終確認
+    # 最終確認（停止して READY で待っていること）
     _, state = arm.get_state()
-    if state != 2:
-        raise RuntimeError(f"xArm not commandable (state={state})")
+    if state != ControllerState.READY:
+        raise RuntimeError(f"xArm not commandable (state={state}, steps={result.steps})")
 
 # ============================================================
 # ORIENTATION CONTROL
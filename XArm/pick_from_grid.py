@@ -1,10 +1,21 @@
 import json
 import time
+import os
 import sys
-from xarm.wrapper import XArmAPI
+from pathlib import Path
+
+# SystemServer/src の共通モジュール（シミュレータ等）を使う
+SRC_DIR = Path(__file__).resolve().parents[1] / "SystemServer" / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from Robot.grid_model import GridPoseModel, cell_key
+from Robot.pick_planner import plan_pick_order
+from Robot.recovery import ArmRecovery
+from Robot.sim_xarm import create_arm
 
 # --- 設定項目 ---
-ARM_IP = '192.168.1.199'
+ARM_IP = os.getenv("XARM_IP", "192.168.1.199")  # "sim" でシミュレータ
 JSON_FILE = 'grid_pose_map.json'  # JSONファイル名を指定
 GRIP_OPEN = 850
 GRIP_CLOSE = 350
@@ -12,9 +23,11 @@ APPROACH_OFFSET_Z = 50.0
 
 class XArmPicker:
     def __init__(self, ip=ARM_IP, json_file=JSON_FILE):
-        self.arm = XArmAPI(ip)
+        self.arm = create_arm(ip)
+        self.recovery = ArmRecovery(self.arm)
         self.json_file = json_file
         self.pose_map = {}  # ここで初期化
+        self.grid_model = None  # 教示していないセル・小数セル用
         
         self.load_poses()   # JSONを読み込む
         self.initialize_robot()
@@ -28,6 +41,21 @@ class XArmPicker:
         except FileNotFoundError:
             print(f"[Error] {self.json_file} が見つかりません。")
             sys.exit(1)
+        try:
+            self.grid_model = GridPoseModel.fit(self.pose_map)
+            stats = self.grid_model.fit_stats()
+            print(f"[File] グリッドモデル: 誤差 rms {stats['rms_mm']:.2f} mm / max {stats['max_mm']:.2f} mm")
+        except ValueError as e:
+            print(f"[File] グリッドモデルなし: {e}")
+
+    def lookup(self, x, y):
+        """教示セルは JSON の値、それ以外（小数セルなど）はグリッドモデルの値。範囲外は None"""
+        key = cell_key(x, y)
+        if key in self.pose_map:
+            return self.pose_map[key]
+        if self.grid_model is not None and self.grid_model.contains(float(x), float(y)):
+            return self.grid_model.pose(x, y)
+        return None
 
     def initialize_robot(self):
         """アームとグリッパーの初期化設定"""
@@ -47,54 +75,91 @@ class XArmPicker:
         print("[Init] ロボットの準備が完了しました。")
 
     def set_gripper_pos(self, pos):
-        """エラーが発生しても、復旧して成功するまでリトライする"""
-        while True:
-            print(f"[Gripper] Moving to {pos}...")
-            code = self.arm.set_gripper_position(pos, wait=True)
-            
-            if code == 0:
-                return True
+        """エラーが発生したら復旧して再試行する（回数・時間に上限あり）"""
+        print(f"[Gripper] Moving to {pos}...")
+        result = self.recovery.move_gripper(pos, wait=True)
+        if result.attempts > 1:
+            print(f"[Gripper] 復旧: {result.steps}")
+        if not result.ok:
+            print(f"!! Gripper Error !! {result.reason}")
+        return result.ok
 
-            print(f"!! Gripper Error (Code: {code}) !! 復旧シーケンス開始...")
-            self.arm.clean_error()
-            self.arm.clean_gripper_error()
-            time.sleep(1.0)
-            
-            self.arm.set_state(state=0)
-            self.arm.motion_enable(enable=True)
-            self.arm.set_gripper_mode(0)
-            self.arm.set_gripper_enable(True)
-            time.sleep(1.0)
+    def move(self, px, py, pz, r, p, yaw):
+        """set_position(wait=True)。失敗したらコードを表示して False"""
+        code = self.arm.set_position(px, py, pz, r, p, yaw, wait=True)
+        if code != 0:
+            print(f"!! Move Error !! ({px:.1f}, {py:.1f}, {pz:.1f}) code: {code}")
+        return code == 0
 
     def pick_at(self, x, y):
-        """指定したグリッド座標 (x, y) をピックアップする"""
-        key = f"{x},{y}"
-        if key not in self.pose_map:
-            print(f"エラー: 座標 {key} がJSONファイルに見つかりません。")
+        """指定したグリッド座標 (x, y) をピックアップする。途中で失敗したら False"""
+        pose = self.lookup(x, y)
+        if pose is None:
+            print(f"エラー: 座標 {cell_key(x, y)} がJSONファイルに見つかりません。")
             return False
 
-        pose = self.pose_map[key]
         # poseの要素数に合わせて展開（x, y, z, roll, pitch, yaw）
         px, py, pz, r, p, yaw = pose
 
         print(f"\n--- Picking at Grid ({x}, {y}) ---")
 
-        # 1. アプローチ位置（上空）へ移動
-        self.arm.set_position(px, py, pz + APPROACH_OFFSET_Z, r, p, yaw, wait=True)
-        
-        # 2. グリッパーを開く
-        self.set_gripper_pos(GRIP_OPEN)
-        
-        # 3. 下降
-        self.arm.set_position(px, py, pz, r, p, yaw, wait=True)
-        
-        # 4. グリッパーを閉じる
-        self.set_gripper_pos(GRIP_CLOSE)
-        
-        # 5. 退避（上昇）
-        self.arm.set_position(px, py, pz + APPROACH_OFFSET_Z, r, p, yaw, wait=True)
-        
-        print(f"--- Pick Complete ({x}, {y}) ---")
+        ok = (
+            # 1. アプローチ位置（上空）へ移動
+            self.move(px, py, pz + APPROACH_OFFSET_Z, r, p, yaw)
+            # 2. グリッパーを開く
+            and self.set_gripper_pos(GRIP_OPEN)
+            # 3. 下降
+            and self.move(px, py, pz, r, p, yaw)
+            # 4. グリッパーを閉じる
+            and self.set_gripper_pos(GRIP_CLOSE)
+            # 5. 退避（上昇）
+            and self.move(px, py, pz + APPROACH_OFFSET_Z, r, p, yaw)
+        )
+        print(f"--- Pick {'Complete' if ok else 'Failed'} ({x}, {y}) ---")
+        return ok
+
+    def place_at(self, pose):
+        """把持中のアイテムを pose の位置に置いて上空へ退避する。途中で失敗したら False"""
+        px, py, pz, r, p, yaw = pose
+        return (
+            self.move(px, py, pz + APPROACH_OFFSET_Z, r, p, yaw)
+            and self.move(px, py, pz, r, p, yaw)
+            and self.set_gripper_pos(GRIP_OPEN)
+            and self.move(px, py, pz + APPROACH_OFFSET_Z, r, p, yaw)
+        )
+
+    def pick_many(self, cells, place=None):
+        """
+        複数セルを移動時間が最短になる順でピックし、place（グリッドキー "x,y"）に置く。
+        place が None の場合は各アイテムを元のセルに戻す。
+        """
+        keys = [cell_key(x, y) for x, y in cells]
+        missing = [k for k in keys if self.lookup(*k.split(",")) is None]
+        place_pose = self.lookup(*place.split(",")) if place is not None else None
+        if missing or (place is not None and place_pose is None):
+            print(f"エラー: 座標 {missing or place} がJSONファイルに見つかりません。")
+            return False
+
+        targets = {k: self.lookup(*k.split(",")) for k in dict.fromkeys(keys)}
+        code, cur = self.arm.get_position()
+        if code != 0:
+            print(f"エラー: 現在位置を取得できません (code: {code})")
+            return False
+        plan = plan_pick_order(cur, targets, place_pose)
+        print(f"[Plan] 順序: {plan.order}（水平移動の見積もり {plan.travel_s:.2f}s）")
+
+        clock = getattr(self.arm, "sim_clock", time.perf_counter)
+        t0 = clock()
+        for i, key in enumerate(plan.order):
+            x, y = key.split(",")
+            # 失敗したら残りは動かさない（XArmOperator.pick_many と同じ）
+            if not self.pick_at(x, y):
+                print(f"[Plan] {key} のピックに失敗したため中断します（{i}/{len(plan.order)} 個完了）")
+                return False
+            if not self.place_at(place_pose if place_pose is not None else targets[key]):
+                print(f"[Plan] {key} の配置に失敗したため中断します（{i}/{len(plan.order)} 個完了）")
+                return False
+        print(f"[Plan] {len(plan.order)} 個完了: {clock() - t0:.2f}s")
         return True
 
 # ==========================================
@@ -112,7 +177,12 @@ if __name__ == "__main__":
             if val.lower() == 'q': break
             
             inputs = val.split()
-            if len(inputs) == 2:
+            # 複数ピック: m 0,0 1,1 2,3 [@3,3]（@ 以降は置き場所）
+            if inputs and inputs[0].lower() == 'm':
+                cells = [tuple(c.split(",")) for c in inputs[1:] if not c.startswith("@")]
+                place = next((c[1:] for c in inputs[1:] if c.startswith("@")), None)
+                system.pick_many(cells, place)
+            elif len(inputs) == 2:
                 system.pick_at(inputs[0], inputs[1])
             
             else: 
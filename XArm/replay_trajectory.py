@@ -0,0 +1,78 @@
+"""teleop.py で記録した軌道（.xtrj）を再生する。
+
+記録開始時の関節角へ戻ってから、単純化したウェイポイントを radius 付きでつなげて流す。
+--scale 2 で記録の 2 倍速（静止時間も半分）。--no-dwell で静止時間を詰める。
+
+Run:
+  python replay_trajectory.py trajectories/traj_20250101_120000.xtrj
+  python replay_trajectory.py demo.xtrj --scale 2 --blend 10 --repeat 5
+  python replay_trajectory.py demo.xtrj --plan         # ウェイポイントを表示するだけ（アームに接続しない）
+  XARM_IP=sim python replay_trajectory.py demo.xtrj --scale 2
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# SystemServer/src の共通モジュール（シミュレータ等）を使う
+SRC_DIR = Path(__file__).resolve().parents[1] / "SystemServer" / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from Robot.sim_xarm import create_arm
+from Robot.trajectory import Trajectory, TrajectoryPlayer
+
+# --- 設定項目 ---
+ARM_IP = os.getenv("XARM_IP", "192.168.1.199")  # "sim" でシミュレータ
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="teleop.py が保存した .xtrj")
+    parser.add_argument("--ip", default=ARM_IP)
+    parser.add_argument("--scale", type=float, default=1.0, help="時間スケール（2 で 2 倍速）")
+    parser.add_argument("--blend", type=float, default=5.0, help="ウェイポイント間のブレンド半径 [mm]")
+    parser.add_argument("--tol", type=float, default=1.0, help="軌道を単純化するときの許容誤差 [mm]")
+    parser.add_argument("--max-speed", type=float, default=500.0, help="TCP 速度の上限 [mm/s]")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-dwell", action="store_true", help="記録中に止まっていた時間を待たない")
+    parser.add_argument("--plan", action="store_true", help="ウェイポイントを表示して終了")
+    args = parser.parse_args(argv)
+
+    traj = Trajectory.load(args.file)
+    print(f"[Load] {args.file}: {len(traj)} 行, {traj.duration:.2f}s")
+
+    # --plan ではアームに接続しない（実機の XArmAPI は生成時に接続する）。シミュレータは実時間で動かす
+    arm = None if args.plan else create_arm(args.ip, realtime=True)
+    player = TrajectoryPlayer(arm, time_scale=args.scale, blend_mm=args.blend, tol_mm=args.tol,
+                              keep_dwell=not args.no_dwell, max_speed=args.max_speed)
+    if args.plan:
+        for wp in player.plan(traj):
+            flags = "stop" if wp.stop else f"r={args.blend:g}"
+            extra = f" gripper={wp.gripper:g}" if wp.gripper is not None else ""
+            extra += f" dwell={wp.dwell:.2f}s" if wp.dwell else ""
+            print(f"  t={wp.t:7.2f}  {[round(v, 1) for v in wp.pose[:3]]}  {flags}{extra}")
+        return 0
+
+    print(f"[Init] {args.ip} に接続中...")
+    arm.connect()
+    arm.clean_error()
+    arm.clean_gripper_error()
+    arm.motion_enable(True)
+    arm.set_mode(0)   # position control
+    arm.set_state(0)
+    arm.set_gripper_mode(0)
+    arm.set_gripper_enable(True)
+    try:
+        result = player.play(traj, repeat=args.repeat)
+    except RuntimeError as e:
+        print(f"[Replay] 失敗: {e}")
+        return 1
+    finally:
+        arm.disconnect()
+    print(f"[Replay] {result}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
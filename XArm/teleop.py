@@ -0,0 +1,763 @@
+"""xArm テレオペ（自由ジョグ・グリッド教示・名前付き姿勢の記録）。
+
+save_grid.py / keyboard_move.py の共通部分をまとめたもの。
+
+  - 入力はイベント駆動（キーの押下/解放・スティックの変化・受信パケット）。
+    入力バックエンドは keyboard / gamepad / network から選ぶ
+  - 移動は ServoTeachLoop が固定周期（SERVO_HZ）で送る。入力側は軸の値を変えるだけ
+  - グリッパー・保存などのアクションはワーカースレッドで順に実行する（移動を止めない）
+  - m（記録）で軌道の記録を開始/停止し、trajectories/ に .xtrj で保存する
+    （再生は replay_trajectory.py）
+
+モード:
+  jog   : 自由ジョグ。Space で pose_N を manual_saved_poses.json に追記
+  grid  : GRID_W x GRID_H のセルを順に記録して grid_pose_map.json に保存
+  poses : --names で指定した名前の姿勢を順に記録して manual_saved_poses.json に保存
+  corners: 3 隅 (0,0) (W-1,0) (0,H-1) だけ教示し、残りのセルを格子補間で生成してから
+          検証スイープ（各セルの HOVER_MM 上へ自動で移動 → 必要なら微調整して Space で確定）。
+          セル間は TRANSIT_Z まで上げて横に動き、ホバー位置へ下ろす。
+          微調整のずれは以降のセルの予測にも反映する。結果は grid_pose_map.json 形式。
+          途中経過は grid_pose_map.partial.json に書き、全セル確定まで元のファイルは置き換えない
+
+Run:
+  python teleop.py
+  python teleop.py --mode grid
+  python teleop.py --mode corners --grid-w 6 --grid-h 5
+  python teleop.py --mode poses --names home,place_a,place_b
+  python teleop.py --input gamepad
+  python teleop.py --input network --port 9870     # UDP で JSON を受ける（NetworkInput 参照）
+  XARM_IP=sim python teleop.py --input network
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+# SystemServer/src の共通モジュール（シミュレータ等）を使う
+SRC_DIR = Path(__file__).resolve().parents[1] / "SystemServer" / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from Robot.grid_model import GridPoseModel, cell_key
+from Robot.recovery import ArmRecovery
+from Robot.servo_teach import ServoTeachLoop, WorkspaceLimits
+from Robot.sim_xarm import create_arm
+from Robot.state_cache import RobotStateCache
+from Robot.trajectory import TrajectoryRecorder
+
+# --- 設定項目 ---
+ARM_IP = os.getenv("XARM_IP", "192.168.1.199")  # "sim" でシミュレータ
+GRID_FILE = "grid_pose_map.json"
+POSES_FILE = "manual_saved_poses.json"
+TRAJECTORY_DIR = "trajectories"
+GRID_W = 4
+GRID_H = 4
+
+JOG_SPEED = 4.0 / 0.03   # ジョグ速度 [mm/s]（従来の 1 フレーム 4mm / 30ms と同じ）
+SERVO_HZ = 100.0         # サーボ指令の送信周期
+POSE_MAX_AGE = 0.05      # これより古いキャッシュは使わない
+SETTLE_MM = 0.5          # 保存時、指令姿勢との差がこれ以下になるまで待つ
+SETTLE_S = 0.5
+
+HOVER_MM = 30.0          # corners の検証スイープで、生成したセルのこの高さ上に止める
+TRANSIT_Z = 290.0        # セル間の移動はこの高さまで上げてから横に動く（XArmOperator.UP_Z と同じ）
+SWEEP_SPEED = 100.0      # 検証スイープの移動速度 [mm/s]
+ARRIVE_S = 10.0
+
+GRIPPER_OPEN_POS = 850
+AXES = ("x", "y", "z")
+
+
+def _write_json(path, data):
+    """途中で落ちても壊れないよう一時ファイル経由で書く"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        print(f"[File] {path} を読み込みました。")
+        return data
+    except FileNotFoundError:
+        print(f"[File] {path} を新規作成します。")
+        return {}
+
+
+# ======================================================================
+# 入力バックエンド
+#   start(sink) でイベントの受け取りを始め、sink.set_axis(軸, -1..1) /
+#   sink.action(名前) を呼ぶ。アクション: open close print save record recover quit
+# ======================================================================
+class KeyboardInput:
+    """keyboard パッケージのフック（押下/解放イベント）。キーリピートは無視する"""
+    AXIS_KEYS = {
+        "up": ("x", -1.0), "down": ("x", 1.0),
+        "left": ("y", -1.0), "right": ("y", 1.0),
+        "1": ("z", 1.0), "0": ("z", -1.0),
+    }
+    ACTION_KEYS = {"o": "open", "c": "close", "p": "print", "space": "save", "m": "record", "r": "recover", "q": "quit"}
+    HELP = """\
+[Arrows] : XY方向移動 (↑:前, ↓:後, ←:左, →:右)
+[ 1 / 0 ]: Z方向 上昇 / 下降
+[ o / c ]: グリッパーを開く / 閉じる
+[ Space ]: 現在の座標を保存
+[ p ]    : 現在の座標を表示
+[ m ]    : 軌道の記録を開始 / 停止
+[ r ]    : エラーから復帰
+[ q ]    : 終了"""
+
+    def __init__(self):
+        self._held = set()
+        self._hook = None
+
+    def start(self, sink):
+        import keyboard
+
+        self._sink = sink
+        self._hook = keyboard.hook(self._on_event)
+
+    def stop(self):
+        if self._hook is not None:
+            import keyboard
+
+            keyboard.unhook(self._hook)
+            self._hook = None
+
+    def _on_event(self, event):
+        name = (event.name or "").lower()
+        if event.event_type == "down":
+            if name in self._held:
+                return  # キーリピート
+            self._held.add(name)
+            if name in self.ACTION_KEYS:
+                self._sink.action(self.ACTION_KEYS[name])
+        else:
+            self._held.discard(name)
+        if name in self.AXIS_KEYS:
+            axis = self.AXIS_KEYS[name][0]
+            value = sum(s for k, (a, s) in self.AXIS_KEYS.items() if a == axis and k in self._held)
+            self._sink.set_axis(axis, value)
+
+
+class GamepadInput:
+    """
+    inputs パッケージ（pip install inputs）のゲームパッド。
+    左スティック: XY、RT / LT: Z 上昇 / 下降。スティックの Y 向きは環境で逆になるので invert_y で合わせる
+    """
+    STICK_MAX = 32768.0
+    TRIGGER_MAX = 255.0
+    DEADZONE = 0.15
+    BUTTONS = {
+        "BTN_EAST": "open", "BTN_WEST": "close", "BTN_NORTH": "print",
+        "BTN_SOUTH": "save", "BTN_TL": "record", "BTN_TR": "recover", "BTN_START": "quit", "BTN_SELECT": "quit",
+    }
+    HELP = """\
+[左スティック] : XY方向移動
+[ RT / LT ]    : Z方向 上昇 / 下降
+[ B / X ]      : グリッパーを開く / 閉じる
+[ A ]          : 現在の座標を保存
+[ Y ]          : 現在の座標を表示
+[ LB ]         : 軌道の記録を開始 / 停止
+[ RB ]         : エラーから復帰
+[ Start ]      : 終了"""
+
+    def __init__(self, invert_y=False):
+        self.invert_y = invert_y
+        self._triggers = {"ABS_RZ": 0.0, "ABS_Z": 0.0}
+        self._stop = threading.Event()
+        self._sink = None
+
+    def start(self, sink):
+        import inputs
+
+        if not inputs.devices.gamepads:
+            raise RuntimeError("gamepad not found")
+        self._sink = sink
+        self._inputs = inputs
+        # get_gamepad() はブロックするので専用スレッドで読む
+        threading.Thread(target=self._run, name="teleop-gamepad", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._release()
+
+    def _release(self):
+        """全軸を 0 にする（スティック・トリガーの値を残さない）"""
+        self._triggers = {"ABS_RZ": 0.0, "ABS_Z": 0.0}
+        if self._sink is None:
+            return
+        for axis in AXES:
+            self._sink.set_axis(axis, 0.0)
+
+    def _stick(self, raw):
+        v = max(-1.0, min(1.0, raw / self.STICK_MAX))
+        return 0.0 if abs(v) < self.DEADZONE else v
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                for e in self._inputs.get_gamepad():
+                    if e.ev_type == "Key" and e.state == 1 and e.code in self.BUTTONS:
+                        self._sink.action(self.BUTTONS[e.code])
+                    elif e.code == "ABS_X":
+                        self._sink.set_axis("y", self._stick(e.state))
+                    elif e.code == "ABS_Y":
+                        v = self._stick(e.state)
+                        self._sink.set_axis("x", v if self.invert_y else -v)
+                    elif e.code in self._triggers:
+                        self._triggers[e.code] = min(1.0, e.state / self.TRIGGER_MAX)
+                        self._sink.set_axis("z", self._triggers["ABS_RZ"] - self._triggers["ABS_Z"])
+        except Exception as e:
+            # 抜かれた・読めなくなったゲームパッドの値で動き続けないようにする
+            print(f"[Input] ゲームパッドを読めなくなりました: {e!r}")
+        finally:
+            self._release()
+
+
+class NetworkInput:
+    """
+    UDP で JSON を受ける（1 データグラム 1 メッセージ）:
+      {"axes": {"x": -1, "y": 0, "z": 0}}   軸の値（-1..1、省略した軸はそのまま）
+      {"action": "save"}                   アクション
+    軸が 0 でない間は送信側が timeout より短い間隔で送り続けること。
+    途切れたら全軸を 0 にする（デッドマン）。
+    """
+    HELP = """\
+UDP {"axes": {"x": .., "y": .., "z": ..}} / {"action": "open|close|print|save|record|recover|quit"}"""
+
+    def __init__(self, port=9870, host="127.0.0.1", timeout=0.3):
+        self.port = port
+        self.host = host
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._sock = None
+
+    def start(self, sink):
+        self._sink = sink
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self.host, self.port))
+        self._sock.settimeout(self.timeout / 3)
+        print(f"[Input] UDP {self.host}:{self.port} で待ち受け中")
+        threading.Thread(target=self._run, name="teleop-network", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _parse(self, data):
+        """データグラム -> (軸の値, アクション)。不正なら ValueError / TypeError / AttributeError"""
+        msg = json.loads(data)
+        if not isinstance(msg, dict):
+            raise TypeError("message must be an object")
+        axes = {}
+        for axis, value in (msg.get("axes") or {}).items():
+            if axis in AXES:
+                value = float(value)
+                if not math.isfinite(value):
+                    raise ValueError(f"axis {axis} is not finite")
+                axes[axis] = max(-1.0, min(1.0, value))
+        action = msg.get("action")
+        return axes, str(action) if action else None
+
+    def _run(self):
+        last = time.monotonic()
+        values = dict.fromkeys(AXES, 0.0)
+        try:
+            while not self._stop.is_set():
+                try:
+                    data, _ = self._sock.recvfrom(4096)
+                except socket.timeout:
+                    if any(values.values()) and time.monotonic() - last > self.timeout:
+                        print("[Input] 入力が途切れたので停止します")
+                        for axis in AXES:
+                            values[axis] = 0.0
+                            self._sink.set_axis(axis, 0.0)
+                    continue
+                try:
+                    axes, action = self._parse(data)
+                except (ValueError, TypeError, AttributeError):
+                    # 不正なメッセージは生存確認にも数えない
+                    print(f"[Input] 不正なメッセージ: {data[:80]!r}")
+                    continue
+                last = time.monotonic()
+                for axis, value in axes.items():
+                    values[axis] = value
+                    self._sink.set_axis(axis, value)
+                if action:
+                    self._sink.action(action)
+        except Exception as e:
+            print(f"[Input] UDP 受信が止まりました: {e!r}")
+        finally:
+            # どう抜けても最後の軸の値で動き続けないようにする
+            for axis in AXES:
+                self._sink.set_axis(axis, 0.0)
+            self._sock.close()
+
+
+BACKENDS = {"keyboard": KeyboardInput, "gamepad": GamepadInput, "network": NetworkInput}
+
+
+# ======================================================================
+# モード（保存した姿勢の行き先）
+# ======================================================================
+class TeachMode:
+    """モードの共通部分。on_save() で記録し、goal() があればそこへ自動で移動する"""
+    title = ""
+    gripper_close = 250
+
+    @property
+    def done(self):
+        return False
+
+    def target(self):
+        return None
+
+    def goal(self):
+        return None
+
+    def summary(self):
+        return None
+
+    def save(self):
+        """記録を書き出し、書いたパスを返す"""
+        _write_json(self.path, self.data)
+        return self.path
+
+
+class PoseCaptureMode(TeachMode):
+    """自由ジョグ（pose_N の連番）/ 名前付き姿勢の記録（names の順）"""
+
+    def __init__(self, path=POSES_FILE, names=None):
+        self.path = path
+        self.names = list(names or [])
+        self.data = _read_json(path)
+        self.index = 0
+        self.counter = 1 + max((int(k[5:]) for k in self.data if k.startswith("pose_") and k[5:].isdigit()), default=0)
+
+    @property
+    def title(self):
+        return "Named Pose Capture" if self.names else "Manual Control (jog)"
+
+    @property
+    def done(self):
+        return bool(self.names) and self.index >= len(self.names)
+
+    def target(self):
+        if self.names and not self.done:
+            return f">>> Target: {self.names[self.index]} を記録してください"
+        return None
+
+    def on_save(self, pose, joints):
+        if self.names:
+            label = self.names[self.index]
+            self.index += 1
+        else:
+            label = f"pose_{self.counter}"
+            self.counter += 1
+        self.data[label] = pose
+        print(f"Saved [{label}]: {pose}")
+        if joints:
+            print(f"Servo Angles: {joints[:7]}")
+
+
+class GridMode(TeachMode):
+    """グリッドのセル "x,y" を行ごとに順に記録する"""
+    gripper_close = 350
+    title = "Grid Teaching"
+
+    def __init__(self, path=GRID_FILE, width=GRID_W, height=GRID_H):
+        self.path = path
+        self.cells = [f"{gx},{gy}" for gy in range(height) for gx in range(width)]
+        self.data = _read_json(path)
+        self.index = 0
+
+    @property
+    def done(self):
+        return self.index >= len(self.cells)
+
+    def target(self):
+        if self.done:
+            return None
+        return f">>> Target: Grid ({self.cells[self.index]}) を記録してください"
+
+    def on_save(self, pose, joints):
+        key = self.cells[self.index]
+        self.data[key] = pose
+        self.index += 1
+        print(f"[Saved] {key}: {pose}")
+
+
+class CornerGridMode(TeachMode):
+    """
+    3 隅だけ教示し、残りは GridPoseModel（affine）で生成して検証スイープで確定する。
+    確定した姿勢 = 生成姿勢 + 微調整量（停止位置 - ホバー位置）。確定のたびに当てはめ直す
+    """
+    gripper_close = 350
+    title = "Grid Teaching (3 corners + sweep)"
+
+    def __init__(self, path=GRID_FILE, width=GRID_W, height=GRID_H, hover_mm=HOVER_MM):
+        if width < 2 or height < 2:
+            raise ValueError("corners mode needs a grid of at least 2x2")
+        self.path = path
+        self.hover_mm = hover_mm
+        self.corners = [cell_key(0, 0), cell_key(width - 1, 0), cell_key(0, height - 1)]
+        # 検証は蛇行順（隣のセルへ少しずつ動く）
+        sweep = []
+        for gy in range(height):
+            row = [cell_key(gx, gy) for gx in range(width)]
+            sweep += row if gy % 2 == 0 else row[::-1]
+        self.sweep = [k for k in sweep if k not in self.corners]
+        self.size = (width, height)
+        self.data = {}  # 今回確定したセルだけ（古い教示と混ぜない）
+        self.model = None
+        self.index = 0
+        self._hover = None  # 今のセルの生成姿勢と、送ったホバー位置
+        self.nudges = {}
+
+    @property
+    def teaching(self):
+        return self.index < len(self.corners)
+
+    @property
+    def current(self):
+        if self.teaching:
+            return self.corners[self.index]
+        i = self.index - len(self.corners)
+        return self.sweep[i] if i < len(self.sweep) else None
+
+    @property
+    def done(self):
+        return self.current is None
+
+    def target(self):
+        if self.done:
+            return None
+        if self.teaching:
+            return f">>> Corner {self.index + 1}/3: Grid ({self.current}) を記録してください"
+        i = self.index - len(self.corners) + 1
+        return (f">>> Verify {i}/{len(self.sweep)}: Grid ({self.current}) の {self.hover_mm:g}mm 上です。"
+                f"ずれていれば微調整して Space で確定")
+
+    def goal(self):
+        """検証中のセルのホバー位置（生成姿勢の hover_mm 上）"""
+        if self.teaching or self.done:
+            return None
+        generated = self.model.pose(self.current)
+        hover = list(generated)
+        hover[2] += self.hover_mm
+        self._hover = (generated, hover)
+        return hover
+
+    def on_save(self, pose, joints):
+        key = self.current
+        if self.teaching:
+            self.data[key] = pose
+            print(f"[Saved] corner {key}: {pose}")
+        else:
+            generated, hover = self._hover
+            nudge = [p - h for p, h in zip(pose[:3], hover[:3])]
+            self.data[key] = [g + d for g, d in zip(generated[:3], nudge)] + list(pose[3:6])
+            self.nudges[key] = math.sqrt(sum(d * d for d in nudge))
+            print(f"[Saved] {key}: {self.data[key]} (nudge {self.nudges[key]:.1f} mm)")
+        self.index += 1
+        if len(self.data) >= len(self.corners):
+            self.model = GridPoseModel.fit(self.data, "affine", size=self.size)
+
+    @property
+    def partial_path(self):
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.partial{ext or '.json'}"
+
+    def save(self):
+        """途中は partial に書き、全セル確定したときだけ path を置き換える（中断しても古い教示を壊さない）"""
+        if not self.done:
+            _write_json(self.partial_path, self.data)
+            return self.partial_path
+        _write_json(self.path, self.data)
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+        return self.path
+
+    def summary(self):
+        if not self.nudges:
+            return None
+        values = list(self.nudges.values())
+        return (f"[Verify] {len(values)}/{len(self.sweep)} セルを確定 "
+                f"（微調整 平均 {sum(values) / len(values):.1f} mm, 最大 {max(values):.1f} mm）")
+
+
+MODES = ("jog", "grid", "poses", "corners")
+
+
+# ======================================================================
+# セッション
+# ======================================================================
+class TeleopSession:
+    def __init__(self, ip, mode, jog_speed=JOG_SPEED, servo_hz=SERVO_HZ, limits=None,
+                 trajectory_dir=TRAJECTORY_DIR):
+        # シミュレータは実時間で動かす（仮想時計のままだとサーボループが空回りする）
+        self.arm = create_arm(ip, realtime=True)
+        self.ip = ip
+        self.mode = mode
+        self.jog_speed = jog_speed
+        self.state = RobotStateCache()
+        self.recovery = ArmRecovery(self.arm, state_cache=self.state)
+        self.servo = ServoTeachLoop(self.arm, state_cache=self.state, rate_hz=servo_hz,
+                                    limits=limits or WorkspaceLimits(x_min=200, y_min=-310, z_min=80))
+        self._axes = dict.fromkeys(AXES, 0.0)
+        self._axes_lock = threading.Lock()
+        self._actions = queue.Queue()
+        self._worker = None
+        self.finished = threading.Event()
+        self.trajectory_dir = Path(trajectory_dir)
+        self.recorder = TrajectoryRecorder()
+
+    def initialize_robot(self):
+        """アームとグリッパーの初期化"""
+        print(f"[Init] {self.ip} に接続中...")
+        self.arm.connect()
+        self.state.attach(self.arm)
+        self.recorder.attach(self.state)
+        self.arm.clean_error()
+        self.arm.clean_gripper_error()
+
+        self.arm.motion_enable(True)
+        self.arm.set_mode(1)  # Servo Mode (リアルタイム制御)
+        self.arm.set_state(0)
+
+        self.arm.set_gripper_mode(0)
+        self.arm.set_gripper_enable(True)
+        self.arm.set_gripper_speed(2000)
+        time.sleep(1)
+        self.servo.start()
+        self._worker = threading.Thread(target=self._run_actions, name="teleop-actions", daemon=True)
+        self._worker.start()
+        print("[Init] サーボモードで準備完了")
+
+    # ------------------------------------------------------------------
+    # 入力（バックエンドのスレッドから呼ばれる。すぐ戻ること）
+    # ------------------------------------------------------------------
+    def set_axis(self, axis, value):
+        with self._axes_lock:
+            self._axes[axis] = value
+            v = [self.jog_speed * self._axes[a] for a in AXES]
+        self.servo.set_velocity(*v)
+
+    def action(self, name):
+        if name == "quit":
+            self.finished.set()
+        else:
+            self._actions.put(name)
+
+    # ------------------------------------------------------------------
+    # アクション（ワーカースレッド）
+    # ------------------------------------------------------------------
+    def _run_actions(self):
+        while True:
+            name = self._actions.get()
+            if name is None:
+                return
+            try:
+                handler = getattr(self, f"_do_{name}", None)
+                if handler is None:
+                    print(f"[Teleop] unknown action: {name}")
+                else:
+                    handler()
+            except Exception as e:
+                print(f"[Teleop] {name} failed: {e!r}")
+
+    def _gripper(self, pos):
+        """エラー監視付きグリッパー操作（失敗時は復旧して再試行）"""
+        result = self.recovery.move_gripper(pos, wait=False)
+        if result.ok:
+            self.state.update_gripper(pos)  # レポートに無いので指令位置を記録する
+        if not result.ok:
+            print(f"!! Gripper Error !! {result.reason}")
+
+    def _do_open(self):
+        self._gripper(GRIPPER_OPEN_POS)
+
+    def _do_close(self):
+        self._gripper(self.mode.gripper_close)
+
+    def current_pose(self):
+        """レポートストリームのキャッシュから現在姿勢を読む（古い場合のみ RPC）"""
+        pose = self.state.get_pose(max_age=POSE_MAX_AGE)
+        if pose is not None:
+            return pose
+        code, pose = self.arm.get_position()
+        return pose if code == 0 else None
+
+    def current_joints(self):
+        joints = self.state.get_joints(max_age=POSE_MAX_AGE)
+        if joints is None:
+            code, joints = self.arm.get_servo_angle()
+            joints = joints if code == 0 else None
+        return joints
+
+    def _do_print(self):
+        print(f"Current Pose: {self.current_pose()}")
+
+    def _settled(self):
+        pose, cmd = self.state.get_pose(max_age=POSE_MAX_AGE), self.servo.commanded
+        return pose is not None and cmd is not None and math.dist(pose[:3], cmd[:3]) <= SETTLE_MM
+
+    def _do_save(self):
+        if self.mode.done:
+            return
+        self.servo.halt()  # 止めて、実測が指令姿勢に追いつくのを待ってから記録する
+        if not self.state.wait_for(self._settled, timeout=SETTLE_S):
+            print("[Teleop] 姿勢が落ち着く前に記録します")
+        pose = self.current_pose()
+        if pose is None:
+            print("[Teleop] 現在姿勢を取得できませんでした")
+            return
+        self.mode.on_save(list(pose), self.current_joints())
+        self.mode.save()
+        if self.mode.done:
+            self.finished.set()
+            return
+        self._go_to_goal()
+        if self.mode.target():
+            print(f"\n{self.mode.target()}")
+
+    def _go_to_goal(self):
+        """
+        モードが次の位置を指定していれば、サーボループでそこまで動かす。
+        TRANSIT_Z まで真上に上げ、横に動いてから下ろす（把持高さのまま斜めに横切らない）
+        """
+        goal = self.mode.goal()
+        if goal is None:
+            return
+        start = self.servo.commanded or self.current_pose()
+        if start is None:
+            print("[Teleop] 現在姿勢を取得できないので自動移動しません")
+            return
+        transit_z = max(TRANSIT_Z, start[2], goal[2])
+        for waypoint in ([start[0], start[1], transit_z], [goal[0], goal[1], transit_z], list(goal[:3])):
+            self.servo.limits.clamp(waypoint)
+            self.servo.move_to(waypoint, speed=SWEEP_SPEED)
+            if not self.state.wait_for(lambda: self.servo.arrived, timeout=ARRIVE_S):
+                print("[Teleop] 目標位置に着きませんでした")
+                self.servo.halt()
+                return
+            cmd = self.servo.commanded
+            if cmd is None or math.dist(cmd[:3], waypoint) > 1.0:
+                # 操作者の入力・制限・エラーで打ち切られた
+                print("[Teleop] 自動移動を中断しました")
+                return
+
+    def _do_record(self):
+        if not self.recorder.recording:
+            self.recorder.start()
+            print("[Record] 軌道の記録を開始しました（m でもう一度押すと停止）")
+            return
+        self._save_trajectory()
+
+    def _save_trajectory(self):
+        traj = self.recorder.stop()
+        if len(traj) < 2:
+            print("[Record] 記録が空なので保存しません")
+            return
+        path = traj.save(self.trajectory_dir / f"traj_{time.strftime('%Y%m%d_%H%M%S')}.xtrj")
+        print(f"[Record] {traj.duration:.1f}s, {len(traj)} 行（{traj.meta['raw_rows']} 行から間引き）を {path} に保存しました")
+
+    def _do_recover(self):
+        result = self.recovery.recover_arm(mode=1)
+        print(f"[Recover] {'ok' if result.ok else 'failed'}: {result.reason}")
+        self.servo.resync()
+
+    # ------------------------------------------------------------------
+    # 実行
+    # ------------------------------------------------------------------
+    def run(self, backend):
+        print(f"""
+=========================================
+   xArm {self.mode.title}
+=========================================
+{backend.HELP}
+=========================================
+""")
+        if self.mode.target():
+            print(self.mode.target())
+        try:
+            backend.start(self)
+            # 入力はイベントで届くので、ここでは終了を待つだけ
+            while not self.finished.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            backend.stop()
+            self.shutdown()
+
+    def shutdown(self):
+        self.servo.stop()
+        self._actions.put(None)
+        if self._worker:
+            self._worker.join(5.0)
+        if self.recorder.recording:
+            self._save_trajectory()
+        self.recorder.detach()
+        if self.mode.summary():
+            print(self.mode.summary())
+        if self.mode.data:
+            path = self.mode.save()
+            print(f"\n[Done] {len(self.mode.data)} 件の座標を {path} に保存しました。")
+        print(f"[Servo] {self.servo.stats()}")
+        self.arm.disconnect()
+        self.state.detach()
+
+
+def build_mode(args):
+    if args.mode == "grid":
+        return GridMode(args.out or GRID_FILE, args.grid_w, args.grid_h)
+    if args.mode == "corners":
+        return CornerGridMode(args.out or GRID_FILE, args.grid_w, args.grid_h)
+    names = [n.strip() for n in (args.names or "").split(",") if n.strip()]
+    if args.mode == "poses" and not names:
+        raise SystemExit("--mode poses には --names が必要です")
+    return PoseCaptureMode(args.out or POSES_FILE, names if args.mode == "poses" else None)
+
+
+def build_backend(args):
+    if args.input == "network":
+        return NetworkInput(port=args.port, host=args.bind)
+    if args.input == "gamepad":
+        return GamepadInput(invert_y=args.invert_y)
+    return KeyboardInput()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default=ARM_IP)
+    parser.add_argument("--mode", choices=MODES, default="jog")
+    parser.add_argument("--input", choices=sorted(BACKENDS), default="keyboard")
+    parser.add_argument("--out", help="保存先（既定: grid / corners は grid_pose_map.json、それ以外は manual_saved_poses.json）")
+    parser.add_argument("--names", help="poses モードで記録する名前（カンマ区切り）")
+    parser.add_argument("--grid-w", type=int, default=GRID_W)
+    parser.add_argument("--grid-h", type=int, default=GRID_H)
+    parser.add_argument("--speed", type=float, default=JOG_SPEED, help="ジョグ速度 [mm/s]")
+    parser.add_argument("--trajectory-dir", default=TRAJECTORY_DIR, help="記録した軌道の保存先")
+    parser.add_argument("--port", type=int, default=9870, help="network 入力の UDP ポート")
+    parser.add_argument("--bind", default="127.0.0.1", help="network 入力の待ち受けアドレス")
+    parser.add_argument("--invert-y", action="store_true", help="gamepad のスティック Y を反転する")
+    args = parser.parse_args(argv)
+
+    session = TeleopSession(args.ip, build_mode(args), jog_speed=args.speed, trajectory_dir=args.trajectory_dir)
+    session.initialize_robot()
+    session.run(build_backend(args))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())